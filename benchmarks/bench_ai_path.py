@@ -0,0 +1,83 @@
+"""Latency benchmark for AIAgents and LangGraphFlows against the local fake chat model.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ai_path --requests 100 --concurrency 1,8,32 --latency-ms 300
+
+No Gemini key is needed. Latency of the fake model is configurable so the numbers
+isolate the overhead of prompt building, resilience, parsing and graph execution.
+"""
+import argparse
+
+from benchmarks import sample_data
+from benchmarks.common import print_table, run_concurrent
+from utils.ai_agents import AIAgents
+from utils.fake_llm import FakeChatModel
+from utils.langgraph_flows import LangGraphFlows
+
+
+def build_agents(args) -> AIAgents:
+    llm = FakeChatModel(
+        latency_distribution=args.distribution,
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        malformed_rate=args.malformed_rate,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    # Lift the production rate limits; the benchmark measures our overhead, not quota.
+    return AIAgents(llm=llm, requests_per_minute=1e9, tokens_per_minute=1e12, timeout=60)
+
+
+def cases(ai: AIAgents, flows: LangGraphFlows, args):
+    recipients = sample_data.recipients(args.recipients)
+    waste_users = sample_data.waste_users(args.recipients)
+    produce = sample_data.local_produce(50)
+    profile = sample_data.user_profile()
+    plan = ai.generate_meal_plan(profile, produce)
+
+    return {
+        "generate_meal_plan": lambda i: ai.generate_meal_plan(profile, produce),
+        "regenerate_meal_plan_part": lambda i: ai.regenerate_meal_plan_part(profile, produce, plan, "Tuesday", "dinner"),
+        "match_surplus_food": lambda i: ai.match_surplus_food(sample_data.donation(i), recipients),
+        "create_waste_exchange": lambda i: ai.create_waste_exchange(sample_data.waste_material(i), waste_users),
+        "workflow:meal_planning": lambda i: flows.run_workflow("meal_planning", {
+            "user_profile": profile, "local_produce": produce}),
+        "workflow:food_redistribution": lambda i: flows.run_workflow("food_redistribution", {
+            "donation": sample_data.donation(i), "recipients": recipients}),
+        "workflow:waste_exchange": lambda i: flows.run_workflow("waste_exchange", {
+            "waste": sample_data.waste_material(i), "potential_users": waste_users}),
+        "workflow:impact_calculation": lambda i: flows.run_workflow("impact_calculation", {
+            "food_items": sample_data.food_items(20, seed=i)})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--recipients", type=int, default=500)
+    parser.add_argument("--distribution", choices=["constant", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="Comma separated case names")
+    args = parser.parse_args()
+
+    ai = build_agents(args)
+    flows = LangGraphFlows(ai=ai)
+    selected = cases(ai, flows, args)
+    if args.only:
+        selected = {k: v for k, v in selected.items() if k in args.only.split(",")}
+
+    rows = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for name, fn in selected.items():
+            rows.append(run_concurrent(name, fn, args.requests, concurrency))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
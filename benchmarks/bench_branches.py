@@ -0,0 +1,98 @@
+"""Sync vs async workflow runs for LangGraphFlows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_branches --latency-ms 200 --concurrent-runs 50
+
+Runs each workflow as built by the app (node wrappers and tracing included; memoization
+off so every run calls the fake model) under run_workflow and arun_workflow. Node timings
+come from the workflow tracer's spans. For a single run the table shows wall time, the
+summed time spent inside nodes and the peak number of nodes running at once. Only the
+LLM nodes do I/O and each workflow has one, so single runs are expected to take about
+the model latency in both modes; the entry branches are pass-through and overlap little.
+
+The `concurrent` rows run many workflows at once, threads for run_workflow and one event
+loop for arun_workflow; that is where async pays off.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks import sample_data
+from benchmarks.common import print_table
+from utils.ai_agents import AIAgents
+from utils.fake_llm import FakeChatModel
+from utils.langgraph_flows import LangGraphFlows
+from utils.tracing import WorkflowTracer
+
+
+def peak_overlap(spans: List[Dict[str, Any]]) -> int:
+    events = sorted([(s["start_time"], 1) for s in spans] + [(s["end_time"], -1) for s in spans], key=lambda e: (e[0], e[1]))
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def inputs() -> Dict[str, Dict[str, Any]]:
+    return {
+        "meal_planning": {"user_profile": sample_data.user_profile(), "local_produce": sample_data.local_produce(20)},
+        "food_redistribution": {"donation": sample_data.donation(0), "recipients": sample_data.recipients(200)},
+        "waste_exchange": {"waste": sample_data.waste_material(0), "potential_users": sample_data.waste_users(200)},
+        "impact_calculation": {"food_items": sample_data.food_items(20)}
+    }
+
+
+def measure(flows: LangGraphFlows, name: str, data: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    flows.tracer.clear()
+    start = time.perf_counter()
+    if mode == "async":
+        asyncio.run(flows.arun_workflow(name, data))
+    else:
+        flows.run_workflow(name, data)
+    wall = time.perf_counter() - start
+    nodes = [s for s in flows.tracer.snapshot() if s["kind"] == "node"]
+    return {"workflow": name, "mode": mode, "wall_ms": round(wall * 1000, 1),
+            "node_ms": round(sum(s["duration_ms"] for s in nodes), 1), "peak_parallel_nodes": peak_overlap(nodes)}
+
+
+def measure_concurrent(flows: LangGraphFlows, name: str, data: Dict[str, Any], mode: str, runs: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    if mode == "async":
+        async def gather():
+            await asyncio.gather(*(flows.arun_workflow(name, data) for _ in range(runs)))
+        asyncio.run(gather())
+    else:
+        with ThreadPoolExecutor(max_workers=runs) as pool:
+            list(pool.map(lambda _: flows.run_workflow(name, data), range(runs)))
+    wall = time.perf_counter() - start
+    return {"workflow": f"{name} x{runs} concurrent", "mode": mode, "wall_ms": round(wall * 1000, 1),
+            "throughput_per_s": round(runs / wall, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--concurrent-runs", type=int, default=50)
+    args = parser.parse_args()
+
+    llm = FakeChatModel(latency_distribution="constant", latency_ms=args.latency_ms, tokens_per_second=0)
+    ai = AIAgents(llm=llm, requests_per_minute=1e9, tokens_per_minute=1e12, timeout=60,
+                  max_workers=args.concurrent_runs)
+    flows = LangGraphFlows(ai=ai, tracer=WorkflowTracer())
+
+    rows = []
+    for name, data in inputs().items():
+        for mode in ("sync", "async"):
+            measure(flows, name, data, mode)  # compile and warm caches
+            rows.append(measure(flows, name, data, mode))
+    for mode in ("sync", "async"):
+        rows.append(measure_concurrent(flows, "food_redistribution", inputs()["food_redistribution"], mode, args.concurrent_runs))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
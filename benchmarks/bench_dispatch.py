@@ -0,0 +1,88 @@
+"""Nearest-partner dispatch latency with many active delivery partners.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_dispatch --partners 50000 --queries 5000 --k 5
+
+Loads `--partners` partners around Bengaluru into a PartnerIndex and times k-nearest
+queries for random pickup points, against measuring every partner with NumPy. The
+`with_updates` case runs the same queries while another thread keeps moving partners,
+as location heartbeats do.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table, run_concurrent
+from benchmarks.sample_data import CENTER
+from utils.dispatch import PartnerIndex
+from utils.geo import haversine_km
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partners", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--cell-km", type=float, default=1.0)
+    parser.add_argument("--spread", type=float, default=0.3, help="Half-width of the area in degrees")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    partners = CENTER + rng.uniform(-args.spread, args.spread, (args.partners, 2))
+    queries = CENTER + rng.uniform(-args.spread, args.spread, (args.queries, 2))
+
+    index = PartnerIndex(cell_km=args.cell_km)
+    start = time.perf_counter()
+    for i, (lat, lng) in enumerate(partners):
+        index.update(i, lat, lng)
+    load_s = time.perf_counter() - start
+
+    def brute_force(i: int):
+        distances = haversine_km(queries[i, 0], queries[i, 1], partners[:, 0], partners[:, 1])
+        return np.argpartition(distances, args.k)[:args.k]
+
+    def grid(i: int):
+        return index.nearest(queries[i, 0], queries[i, 1], args.k)
+
+    mismatches = sum(
+        set(brute_force(i).tolist()) != {partner_id for partner_id, _ in grid(i)}
+        for i in range(min(200, args.queries))
+    )
+
+    rows = [
+        run_concurrent("brute_force", brute_force, args.queries, 1),
+        run_concurrent("grid", grid, args.queries, 1),
+        run_concurrent("grid", grid, args.queries, args.concurrency)
+    ]
+
+    # Heartbeat-like moves of up to ~100 m while queries run.
+    stop = threading.Event()
+    moves = [0]
+
+    def move_partners():
+        while not stop.is_set():
+            for i in rng.integers(0, args.partners, 1000):
+                partners[i] += rng.uniform(-0.001, 0.001, 2)
+                index.update(int(i), partners[i, 0], partners[i, 1])
+            moves[0] += 1000
+
+    mover = threading.Thread(target=move_partners, daemon=True)
+    start = time.perf_counter()
+    mover.start()
+    rows.append(run_concurrent("grid_with_updates", grid, args.queries, args.concurrency))
+    stop.set()
+    mover.join()
+    rows[-1]["updates_per_s"] = round(moves[0] / (time.perf_counter() - start))
+
+    print(f"{args.partners} partners indexed in {load_s * 1000:.0f} ms "
+          f"({args.partners / load_s:,.0f} updates/s), {len(index.cells)} occupied cells, "
+          f"{mismatches} of {min(200, args.queries)} grid answers differ from brute force")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
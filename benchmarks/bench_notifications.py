@@ -0,0 +1,77 @@
+"""WhatsApp send throughput against a local Twilio stub.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_notifications --messages 400 --latency-ms 50 --handshake-ms 30
+
+For each concurrency level the table shows messages per second and the number of TCP
+connections the stub accepted, for three HTTP clients: a new connection per message,
+Twilio's default session, and the pooled client sized to the concurrency.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+from benchmarks.common import print_table
+from benchmarks.twilio_stub import start_stub
+from utils.twilio_client import PooledHttpClient, TwilioSender
+
+CLIENTS = {
+    "per_request": lambda base_url, concurrency: PooledHttpClient(None, base_url=base_url, pool_connections=False),
+    "default_session": lambda base_url, concurrency: PooledHttpClient(None, base_url=base_url),
+    "pooled": lambda base_url, concurrency: PooledHttpClient(max(10, concurrency), base_url=base_url)
+}
+
+
+def send_one(sender: TwilioSender, message: Tuple[str, str]) -> bool:
+    try:
+        sender.send(*message)
+        return True
+    except Exception:
+        return False
+
+
+def measure(server, client: str, concurrency: int, messages: int, messages_per_second: float) -> Dict[str, Any]:
+    sender = TwilioSender("AC" + "0" * 32, "token", "+15550000000", messages_per_second=messages_per_second,
+                          http_client=CLIENTS[client](server.base_url, concurrency))
+    batch = [(f"+1555{i:07d}", f"Benchmark message {i}") for i in range(messages)]
+
+    connections = server.connections
+    start = time.perf_counter()
+    # One thread per concurrent send, as the outbox workers do.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda message: send_one(sender, message), batch))
+    wall = time.perf_counter() - start
+    return {
+        "client": client,
+        "concurrency": concurrency,
+        "messages": messages,
+        "errors": results.count(False),
+        "wall_s": round(wall, 2),
+        "messages_per_s": round(messages / wall, 1),
+        "connections": server.connections - connections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="Simulated cost of opening a connection")
+    parser.add_argument("--concurrency", default="1,4,8,16,32")
+    parser.add_argument("--messages-per-second", type=float, default=1000.0,
+                        help="Account rate limit enforced by the sender's token bucket")
+    args = parser.parse_args()
+
+    server = start_stub(latency_ms=args.latency_ms, handshake_ms=args.handshake_ms)
+    rows = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for client in CLIENTS:
+            rows.append(measure(server, client, concurrency, args.messages, args.messages_per_second))
+    server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
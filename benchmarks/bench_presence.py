@@ -0,0 +1,161 @@
+"""Partner heartbeat ingestion: ping rate, write amplification and history compaction.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_presence --partners 5000 --minutes 5 --interval 5 --concurrency 4
+
+Simulates `--partners` partners around Bengaluru each pinging every `--interval` seconds
+for `--minutes` simulated minutes while riding at up to ~25 km/h, sometimes standing
+still. `heartbeat` is called directly (with a dispatch index attached, as in the app),
+then `--http-pings` of the same pings are posted to a HeartbeatServer, one per request
+and in batches of `--http-batch`.
+
+Without --mongodb-uri the tracker writes to an in-memory sink that only counts bulk
+writes. With a URI it writes to scratch collections and then checks every partner's
+stored position against its last ping.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.common import print_table, run_concurrent
+from benchmarks.sample_data import CENTER
+from utils.config import Config
+from utils.dispatch import DispatchService, PartnerIndex
+from utils.geo import haversine_km
+from utils.presence import HeartbeatServer, PresenceTracker
+
+
+class CountingCollection:
+    """Stands in for a Mongo collection; records bulk_write sizes."""
+
+    def __init__(self):
+        self.batches: List[int] = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+
+    def find(self, query=None, projection=None):
+        return []
+
+
+class CountingDB:
+    def __init__(self):
+        self.collections: Dict[str, CountingCollection] = {}
+
+    def get_collection(self, name: str):
+        return self.collections.setdefault(name, CountingCollection())
+
+
+def ping_traffic(partners: int, minutes: int, interval: int, seed: int):
+    """Pings in time order as (partner, lat, lng, at) arrays."""
+    rng = np.random.default_rng(seed)
+    steps = minutes * 60 // interval
+    position = CENTER + rng.uniform(-0.2, 0.2, (partners, 2))
+    # Up to ~25 km/h on a random heading; a third of the partners are parked at any time.
+    velocity = rng.uniform(-1, 1, (partners, 2)) * 25 / 3600 / 111.32 * interval
+    lat, lng = np.empty((steps, partners)), np.empty((steps, partners))
+    for step in range(steps):
+        moving = rng.random(partners) > 0.33
+        position = position + velocity * moving[:, None]
+        lat[step], lng[step] = position[:, 0], position[:, 1]
+    # Partners ping at their own offset within each interval.
+    offsets = rng.uniform(0, interval, partners)
+    start = datetime.now() - timedelta(minutes=minutes)
+    seconds = (np.arange(steps)[:, None] * interval + offsets[None, :]).ravel()
+    order = np.argsort(seconds, kind="stable")
+    ids = np.tile(np.arange(partners), steps)[order]
+    at = [start + timedelta(seconds=float(s)) for s in seconds[order]]
+    return ids, lat.ravel()[order], lng.ravel()[order], at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partners", type=int, default=5000)
+    parser.add_argument("--minutes", type=int, default=5)
+    parser.add_argument("--interval", type=int, default=5, help="Seconds between a partner's pings")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--http-pings", type=int, default=20000)
+    parser.add_argument("--http-batch", type=int, default=50)
+    parser.add_argument("--http-concurrency", type=int, default=32)
+    parser.add_argument("--mongodb-uri", help="Write to scratch collections on this server and verify the results")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    config = Config()
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongodb_uri)["rescuebites_presence_bench"]
+        for name in ("partner_presence", "delivery_partners", "partner_locations"):
+            db.drop_collection(config.collections[name])
+    else:
+        db = CountingDB()
+
+    ids, lat, lng, at = ping_traffic(args.partners, args.minutes, args.interval, args.seed)
+    ids, lat, lng = ids.tolist(), lat.tolist(), lng.tolist()
+    dispatch = DispatchService(db=db, config=config, index=PartnerIndex())
+    # The simulated pings are minutes old; keep them online for the run.
+    tracker = PresenceTracker(db=db, config=config, dispatch=dispatch, online_seconds=args.minutes * 60 + 600)
+    tracker.start()
+
+    def heartbeat(i: int):
+        if not tracker.heartbeat(ids[i], lat[i], lng[i], True, at[i]):
+            raise RuntimeError("Heartbeat buffer full")
+
+    rows = [run_concurrent("heartbeat", heartbeat, len(ids), args.concurrency)]
+    start = time.perf_counter()
+    tracker.stop()
+    rows[0]["drain_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    rows[0]["pings_per_min"] = round(rows[0]["throughput_per_s"] * 60)
+
+    http_tracker = PresenceTracker(db=CountingDB(), config=config, online_seconds=args.minutes * 60 + 600)
+    http_tracker.start()
+    server = HeartbeatServer(("127.0.0.1", 0), http_tracker)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    local = threading.local()
+    pings = [{"partner_id": ids[i], "lat": lat[i], "lng": lng[i]} for i in range(min(args.http_pings, len(ids)))]
+    batches = [pings[i:i + args.http_batch] for i in range(0, len(pings), args.http_batch)]
+
+    def post(body):
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection("127.0.0.1", port)
+        local.connection.request("POST", "/heartbeat", json.dumps(body), {"Content-Type": "application/json"})
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 204:
+            raise RuntimeError(f"Heartbeat rejected with {response.status}")
+
+    for name, bodies, per_request in (("http_single", pings, 1), (f"http_batch_{args.http_batch}", batches, args.http_batch)):
+        row = run_concurrent(name, lambda i: post(bodies[i]), len(bodies), args.http_concurrency)
+        row["pings_per_min"] = round(row["throughput_per_s"] * per_request * 60)
+        rows.append(row)
+    server.shutdown()
+    http_tracker.stop()
+
+    print(f"{len(ids)} pings from {args.partners} partners over {args.minutes} simulated minutes; "
+          f"{tracker.written} written ({100 * tracker.written / len(ids):.0f}%), {tracker.sampled} kept as history, "
+          f"{len(dispatch.index)} partners in the dispatch index")
+    if args.mongodb_uri:
+        stored = {doc["_id"]: doc["location"] for doc in db.get_collection(config.collections["delivery_partners"]).find()}
+        last = {partner: (la, ln) for partner, la, ln in zip(ids, lat, lng)}
+        # Stored positions may trail the last ping by up to the sampling distance.
+        wrong = sum(1 for partner, (la, ln) in last.items() if partner not in stored
+                    or haversine_km(la, ln, stored[partner]["lat"], stored[partner]["lng"]) > tracker.sample_km + 1e-6)
+        buckets = db.get_collection(config.collections["partner_locations"]).count_documents({})
+        print(f"{wrong} partners with a stale stored position; history in {buckets} hourly bucket documents")
+    else:
+        writes = {name: sum(c.batches) for name, c in db.collections.items() if c.batches}
+        print(f"write operations per collection: {writes}; "
+              f"{sum(len(c.batches) for c in db.collections.values())} bulk writes")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Route planning time and quality for one delivery partner.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_route_planner --stops 20,50,100,200 --runs 5
+
+Each instance has stops/2 matched donations around Bengaluru (a pickup and a drop-off
+each), a few already on board, and expiry dates from today to five days out. The table
+compares the planned route with visiting jobs one at a time in list order, the way a
+partner works through get_available_deliveries today, and checks the plan's constraints.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.common import print_table
+from benchmarks.sample_data import CENTER
+from utils.geo import haversine_km
+from utils.route_planner import RoutePlanner
+
+
+def instance(stops: int, seed: int, now: datetime, capacity_kg: float) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    onboard_kg = 0.0
+
+    def point():
+        return CENTER[0] + rng.uniform(-0.05, 0.05), CENTER[1] + rng.uniform(-0.05, 0.05)
+
+    jobs = []
+    for i in range(stops // 2):
+        load = rng.randint(2, 15)
+        onboard = rng.random() < 0.05 and onboard_kg + load <= capacity_kg / 2
+        onboard_kg += load if onboard else 0
+        jobs.append({
+            "id": i,
+            "pickup": None if onboard else point(),
+            "dropoff": point(),
+            "load_kg": load,
+            "deadline": now + timedelta(days=rng.randint(0, 5), hours=23),
+            "onboard": onboard
+        })
+    return jobs
+
+
+def path_km(start, points) -> float:
+    points = np.array([start] + points)
+    return float(haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1]).sum())
+
+
+def violations(plan: Dict[str, Any], jobs: List[Dict[str, Any]], capacity_kg: float) -> int:
+    seen_pickup, count = set(), 0
+    for stop in plan["stops"]:
+        if stop["action"] == "pickup":
+            seen_pickup.add(stop["job_id"])
+        elif not jobs[stop["job_id"]]["onboard"] and stop["job_id"] not in seen_pickup:
+            count += 1
+        count += stop["load_kg"] > capacity_kg + 1e-6
+        count += jobs[stop["job_id"]]["deadline"] < stop["eta"]
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", default="20,50,100,200")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--capacity-kg", type=float, default=40.0)
+    args = parser.parse_args()
+
+    planner = RoutePlanner(time_limit=5.0)
+    now = datetime.now()
+    start = (CENTER[0], CENTER[1])
+    rows = []
+    for stops in (int(s) for s in args.stops.split(",")):
+        timings, planned, naive, broken, unassigned = [], [], [], 0, 0
+        for run in range(args.runs):
+            jobs = instance(stops, run, now, args.capacity_kg)
+            began = time.perf_counter()
+            plan = planner.plan(start, jobs, args.capacity_kg, now)
+            timings.append(time.perf_counter() - began)
+            planned.append(plan["distance_km"])
+            naive.append(path_km(start, [p for job in jobs for p in ([job["dropoff"]] if job["onboard"] else [job["pickup"], job["dropoff"]])]))
+            broken += violations(plan, jobs, args.capacity_kg)
+            unassigned += len(plan["unassigned"])
+        rows.append({
+            "stops": stops,
+            "p50_ms": round(float(np.percentile(timings, 50)) * 1000, 1),
+            "max_ms": round(max(timings) * 1000, 1),
+            "naive_km": round(float(np.mean(naive)), 1),
+            "planned_km": round(float(np.mean(planned)), 1),
+            "saving_pct": round(100 * (1 - np.mean(planned) / np.mean(naive)), 1),
+            "unassigned": unassigned,
+            "violations": broken
+        })
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cold-start benchmark for pages that use LangGraphFlows, eager versus lazy compilation.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --repeat 5
+
+Each measurement runs in a fresh interpreter. `startup_ms` covers importing the flows
+module and constructing LangGraphFlows, which every page load pays; `first_run_ms` covers
+the first call to each workflow the page uses. The AI agents are built around the local
+fake chat model, so Gemini client construction itself is not included.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+
+PAGE_WORKFLOWS = {
+    "02_surplus_redistribution": ["food_redistribution"],
+    "03_waste_exchange": ["waste_exchange"],
+    "04_nutritional_impact": ["impact_calculation"]
+}
+
+
+def build_agents():
+    from utils.ai_agents import AIAgents
+    from utils.fake_llm import FakeChatModel
+    return AIAgents(llm=FakeChatModel(latency_ms=0, tokens_per_second=0), requests_per_minute=1e9, tokens_per_minute=1e12)
+
+
+def workflow_input(name: str):
+    from benchmarks import sample_data
+    return {
+        "meal_planning": lambda: {"user_profile": sample_data.user_profile(), "local_produce": sample_data.local_produce(20)},
+        "food_redistribution": lambda: {"donation": sample_data.donation(0), "recipients": sample_data.recipients(50)},
+        "waste_exchange": lambda: {"waste": sample_data.waste_material(0), "potential_users": sample_data.waste_users(50)},
+        "impact_calculation": lambda: {"food_items": sample_data.food_items(20)}
+    }[name]()
+
+
+def child(page: str, mode: str):
+    """Measure one cold start in this (fresh) process and print it as JSON."""
+    start = time.perf_counter()
+    from utils.langgraph_flows import LangGraphFlows
+    if mode == "eager":
+        flows = LangGraphFlows(ai=build_agents(), eager=True)
+    else:
+        flows = LangGraphFlows(ai_factory=build_agents)
+    startup = time.perf_counter() - start
+
+    inputs = {name: workflow_input(name) for name in PAGE_WORKFLOWS[page]}
+    start = time.perf_counter()
+    for name, data in inputs.items():
+        flows.run_workflow(name, data)
+    first_run = time.perf_counter() - start
+    print(json.dumps({"startup_ms": startup * 1000, "first_run_ms": first_run * 1000}))
+
+
+def measure(page: str, mode: str, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", page, "--mode", mode],
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    row = {"page": page, "mode": mode, "n": repeat}
+    for key in ("startup_ms", "first_run_ms"):
+        row[f"p50_{key}"] = round(float(np.median([s[key] for s in samples])), 1)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", default=",".join(PAGE_WORKFLOWS))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["eager", "lazy"], default="lazy", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.mode)
+        return
+
+    rows = [measure(page, mode, args.repeat) for page in args.pages.split(",") for mode in ("eager", "lazy")]
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""CPU cost of building WhatsApp messages: inline f-strings versus utils.message_templates.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_templates --messages 20000
+
+`fstring` is the old path: build the indented triple-quoted f-string, then strip every
+line before queueing. `render` renders a precompiled template per message and
+`render_many` renders a whole fan-out batch with one template lookup.
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.common import print_table
+from utils.message_templates import render, render_many
+
+
+def fstring(food_details: Dict[str, Any]) -> str:
+    message = f"""
+    Food Availability Notification
+
+    A food donation matching your needs is available!
+
+    Item: {food_details.get('type', 'N/A')}
+    Quantity: {food_details.get('quantity', 'N/A')}
+    Expiry: {food_details.get('expiry_date', 'N/A')}
+    Location: {food_details.get('location', {}).get('address', 'N/A')}
+
+    Please contact the donor to arrange pickup.
+    """
+    return "\n".join(line.strip() for line in message.strip().splitlines())
+
+
+def measure(name: str, build: Callable[[List[Dict[str, Any]]], List[str]], rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    messages = build(rows)
+    wall = time.perf_counter() - start
+    return {
+        "case": name,
+        "messages": len(messages),
+        "us_per_message": round(wall / len(messages) * 1e6, 2),
+        "messages_per_s": round(len(messages) / wall)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    donations = [{"type": "Vegetables", "quantity": f"{i % 50} kg", "expiry_date": "2026-01-01",
+                  "location": {"address": f"{i} Market St"}} for i in range(args.messages)]
+    rows = [{**d, "address": d["location"]["address"]} for d in donations]
+    if fstring(donations[0]) != render("food_match_recipient", rows[0]):
+        raise SystemExit("Template output differs from the inline message")
+
+    print_table([
+        measure("fstring", lambda batch: [fstring(d) for d in donations], rows),
+        measure("render", lambda batch: [render("food_match_recipient", r) for r in batch], rows),
+        measure("render_many", lambda batch: render_many("food_match_recipient", batch), rows)
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+
+def summarize(name: str, latencies: List[float], errors: int, wall: float, **extra: Any) -> Dict[str, Any]:
+    """p50/p95/p99 in ms plus throughput for one benchmark case."""
+    values = np.asarray(latencies, dtype=float) * 1000.0
+    total = len(latencies) + errors
+    row = {
+        "case": name,
+        "n": total,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(values, 50)), 1) if values.size else None,
+        "p95_ms": round(float(np.percentile(values, 95)), 1) if values.size else None,
+        "p99_ms": round(float(np.percentile(values, 99)), 1) if values.size else None,
+        "throughput_per_s": round(total / wall, 2) if wall > 0 else None
+    }
+    row.update(extra)
+    return row
+
+
+def run_concurrent(name: str, fn: Callable[[int], Any], requests: int, concurrency: int, **extra: Any) -> Dict[str, Any]:
+    """Call `fn(i)` for i in range(requests) on `concurrency` threads and time each call."""
+    latencies: List[float] = []
+    errors = 0
+
+    def timed(i: int):
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed, i) for i in range(requests)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    wall = time.perf_counter() - start
+    return summarize(name, latencies, errors, wall, concurrency=concurrency, **extra)
+
+
+def print_table(rows: List[Dict[str, Any]]):
+    if not rows:
+        return
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
@@ -0,0 +1,163 @@
+"""Load test for Notifications against the local Twilio stand-in.
+
+Run from the repository root:
+
+    python -m benchmarks.load_notifications --requests 300 --concurrency 16 --error-rate 0.05 --throttle-rate 0.05
+
+Starts benchmarks/twilio_stub.py on a free port and points Notifications at it through
+TWILIO_API_BASE_URL, then drives notify_food_match, notify_delivery_update and
+send_whatsapp_message from concurrent threads while outbox workers drain the queue.
+
+The first table is what a page sees: the time each notify call takes to return.
+The second is what recipients see: enqueue-to-sent latency, how many sends needed a
+retry after a 500 or 429, and what the stub answered.
+
+The outbox needs Mongo: pass --mongodb-uri for a real server (a scratch database is
+used and dropped), or install mongomock to run in memory. mongomock is not thread-safe,
+so its calls are serialized; expect lower drain throughput than against a real server.
+"""
+import argparse
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.common import print_table, run_concurrent
+from benchmarks.twilio_stub import start_stub
+
+
+class SerializedDB:
+    """Wraps a mongomock database so each collection call holds one lock.
+
+    Without it, concurrent find_one_and_update calls can claim the same message twice.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+
+    def get_collection(self, name: str):
+        return SerializedCollection(self.db.get_collection(name), self.lock)
+
+
+class SerializedCollection:
+    def __init__(self, collection, lock: threading.Lock):
+        self.collection = collection
+        self.lock = lock
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self.lock:
+                result = attribute(*args, **kwargs)
+                # Cursors are lazy; materialize them while the lock is held.
+                return list(result) if name in ("find", "aggregate") else result
+        return call
+
+
+def scratch_db(uri: str):
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        client.drop_database("rescuebites_load_test")
+        return client["rescuebites_load_test"]
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("Pass --mongodb-uri or `pip install mongomock` to run the outbox in memory")
+    return SerializedDB(mongomock.MongoClient()["rescuebites_load_test"])
+
+
+def scenarios(notifications) -> Dict[str, Any]:
+    food = {"type": "Vegetables", "quantity": "5 kg", "expiry_date": "2026-01-01", "location": {"address": "12 Market St"}}
+    delivery = {"type": "Bread", "quantity": "20 loaves", "partner_phone": "+15550001111"}
+    return {
+        "notify_food_match": lambda i: notifications.notify_food_match(f"+1555{i:07d}", f"+1666{i:07d}", food),
+        "notify_delivery_update": lambda i: notifications.notify_delivery_update(f"+1777{i:07d}", delivery, "pickup_confirmed"),
+        "send_whatsapp_message": lambda i: notifications.send_whatsapp_message(f"+1888{i:07d}", f"Load test message {i}")
+    }
+
+
+def delivery_report(collection, stub, timeout: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    while collection.count_documents({"status": {"$in": ["queued", "sending"]}}) and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    docs = list(collection.find({}, {"status": 1, "attempts": 1, "created_at": 1, "sent_at": 1}))
+    latencies = np.array([(d["sent_at"] - d["created_at"]).total_seconds() * 1000 for d in docs if d.get("sent_at")])
+    return {
+        "messages": len(docs),
+        "sent": sum(1 for d in docs if d["status"] == "sent"),
+        "failed": sum(1 for d in docs if d["status"] == "failed"),
+        "unsent": sum(1 for d in docs if d["status"] in ("queued", "sending")),
+        "retried": sum(1 for d in docs if d.get("attempts", 0) > 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if latencies.size else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1) if latencies.size else None,
+        "stub_201": stub.responses[201],
+        "stub_429": stub.responses[429],
+        "stub_500": stub.responses[500]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="Calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=16, help="Outbox sender threads")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--throttle-rate", type=float, default=0.05)
+    parser.add_argument("--messages-per-second", type=float, default=200.0)
+    parser.add_argument("--coalesce-seconds", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--mongodb-uri")
+    args = parser.parse_args()
+
+    stub = start_stub(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                      throttle_rate=args.throttle_rate, seed=1)
+    os.environ.update({
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "load-test",
+        "TWILIO_WHATSAPP_NUMBER": "+15550000000",
+        "TWILIO_API_BASE_URL": stub.base_url,
+        "TWILIO_MESSAGES_PER_SECOND": str(args.messages_per_second),
+        "NOTIFICATION_WORKERS": str(args.workers),
+        "NOTIFICATION_COALESCE_SECONDS": str(args.coalesce_seconds)
+    })
+
+    from utils.config import Config
+    from utils.notification_outbox import NotificationOutbox, run_worker
+    from utils.notifications import Notifications
+
+    # Short backoff so retries after injected errors finish within the run; no per-recipient cap.
+    outbox = NotificationOutbox(db=scratch_db(args.mongodb_uri), config=Config(), base_delay=0.1, max_delay=2.0,
+                                recipient_per_minute=1e6, bulk_per_second=1e6)
+    notifications = Notifications(outbox=outbox)
+    stop_event = threading.Event()
+    worker = threading.Thread(target=run_worker, kwargs={
+        "workers": args.workers, "poll_interval": 0.05, "stop_event": stop_event, "outbox": outbox,
+        "sender": notifications.deliver, "requeue_interval": 0
+    }, daemon=True)
+    worker.start()
+
+    calls: List[Dict[str, Any]] = [
+        run_concurrent(name, fn, args.requests, args.concurrency)
+        for name, fn in scenarios(notifications).items()
+    ]
+    print("Notify calls (page-side latency)")
+    print_table(calls)
+
+    print("\nDelivery (enqueue to sent)")
+    print_table([delivery_report(outbox.collection, stub, args.drain_timeout)])
+    stop_event.set()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Replay Twilio status-callback traffic against the callback endpoint.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_status_callbacks --messages 5000 --concurrency 32
+
+Each simulated message gets a realistic callback sequence (queued, sent, delivered,
+sometimes read, a few undelivered with error 30003), lightly shuffled so some callbacks
+arrive out of order, and all of them are posted to a CallbackServer on a local port.
+
+Without --mongodb-uri the ingestor writes to an in-memory sink that only counts bulk
+writes, isolating HTTP and buffering cost. With a URI it writes to a scratch collection
+and then checks that every message ended in its final status.
+"""
+import argparse
+import http.client
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlencode
+
+from benchmarks.common import print_table, run_concurrent
+from utils.config import Config
+from utils.status_callbacks import CallbackServer, StatusCallbackIngestor
+
+
+class CountingCollection:
+    """Stands in for a Mongo collection; records bulk_write sizes."""
+
+    def __init__(self):
+        self.batches: List[int] = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+
+
+class CountingDB:
+    def __init__(self):
+        self.collection = CountingCollection()
+
+    def get_collection(self, name: str):
+        return self.collection
+
+
+def callback_traffic(messages: int, seed: int) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    rng = random.Random(seed)
+    callbacks, final = [], {}
+    for i in range(messages):
+        sid = f"SM{i:032x}"
+        if rng.random() < 0.05:
+            statuses = [("queued", ""), ("sent", ""), ("undelivered", "30003")]
+        else:
+            statuses = [("queued", ""), ("sent", ""), ("delivered", "")] + ([("read", "")] if rng.random() < 0.5 else [])
+        final[sid] = statuses[-1][0]
+        for status, error_code in statuses:
+            callbacks.append({"MessageSid": sid, "MessageStatus": status, "ErrorCode": error_code,
+                              "To": f"whatsapp:+1555{i:07d}", "AccountSid": "AC" + "0" * 32})
+    # Shuffle within small windows: nearby callbacks may swap, as they do from Twilio.
+    for start in range(0, len(callbacks), 8):
+        window = callbacks[start:start + 8]
+        rng.shuffle(window)
+        callbacks[start:start + 8] = window
+    return callbacks, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--flush-interval", type=float, default=0.5)
+    parser.add_argument("--mongodb-uri", help="Write to a scratch collection on this server and verify the results")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    config = Config()
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongodb_uri)["rescuebites_callback_replay"]
+        db.drop_collection(config.collections["notifications"])
+        db.get_collection(config.collections["notifications"]).create_index(
+            "sid", unique=True, partialFilterExpression={"sid": {"$type": "string"}})
+    else:
+        db = CountingDB()
+
+    ingestor = StatusCallbackIngestor(db=db, config=config, batch_size=args.batch_size, flush_interval=args.flush_interval)
+    ingestor.start()
+    server = CallbackServer(("127.0.0.1", 0), ingestor)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    callbacks, final = callback_traffic(args.messages, args.seed)
+    local = threading.local()
+
+    # http.client on a kept-alive connection per thread; requests' own overhead would cap the rate first.
+    def post(i: int):
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection("127.0.0.1", port)
+        local.connection.request("POST", "/twilio/status", urlencode(callbacks[i]),
+                                 {"Content-Type": "application/x-www-form-urlencoded"})
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 204:
+            raise RuntimeError(f"Callback rejected with {response.status}")
+
+    row = run_concurrent("status callbacks", post, len(callbacks), args.concurrency)
+    start = time.perf_counter()
+    ingestor.stop()
+    row["drain_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    row["written"] = ingestor.written
+    server.shutdown()
+
+    if args.mongodb_uri:
+        collection = db.get_collection(config.collections["notifications"])
+        stored = {doc["sid"]: doc.get("delivery_status") for doc in collection.find({}, {"sid": 1, "delivery_status": 1})}
+        row["wrong_final_status"] = sum(1 for sid, status in final.items() if stored.get(sid) != status)
+    else:
+        row["bulk_writes"] = len(db.collection.batches)
+    print_table([row])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from bson import ObjectId
+
+FOOD_TYPES = ["Fruits", "Vegetables", "Grains", "Dairy", "Meat", "Poultry", "Fish", "Baked Goods", "Prepared Meals"]
+WASTE_TYPES = ["Vegetable Scraps", "Fruit Pulp", "Coffee Grounds", "Eggshells", "Bread Crusts"]
+PRODUCE = ["Spinach", "Tomato", "Carrot", "Banana", "Apple", "Lentils", "Brown Rice", "Onion", "Potato", "Mango"]
+
+# Bengaluru, matching the mock hotspot data used by the hotspot page.
+CENTER = (12.9716, 77.5946)
+
+
+def _point(rng: random.Random, spread: float = 0.15) -> Dict[str, float]:
+    return {"lat": CENTER[0] + rng.uniform(-spread, spread), "lng": CENTER[1] + rng.uniform(-spread, spread)}
+
+
+def donation(seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        "donor_id": ObjectId(),
+        "type": rng.choice(FOOD_TYPES),
+        "quantity": f"{rng.randint(2, 40)} kg",
+        "expiry_date": (datetime.now() + timedelta(days=rng.randint(0, 5))).strftime("%Y-%m-%d"),
+        "location": {"address": f"{rng.randint(1, 200)} MG Road", **_point(rng)},
+        "special_requirements": "Keep refrigerated",
+        "donor_phone": "+910000000000",
+        "status": "available",
+        "created_at": datetime.now()
+    }
+
+
+def recipients(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        "_id": ObjectId(),
+        "name": f"Community Kitchen {i}",
+        "phone": f"+91{rng.randint(10**9, 10**10 - 1)}",
+        "capacity": f"{rng.randint(5, 100)} kg",
+        "needs": rng.sample(FOOD_TYPES, 3),
+        "location": {"address": f"{i} Ring Road", **_point(rng)},
+        "created_at": datetime.now()
+    } for i in range(n)]
+
+
+def waste_users(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        "_id": ObjectId(),
+        "user_id": ObjectId(),
+        "name": f"Compost Co {i}",
+        "business_type": rng.choice(["Composting", "Biogas", "Animal Feed"]),
+        "waste_types": rng.sample(WASTE_TYPES, 2),
+        "location": {"address": f"{i} Industrial Area"},
+        "created_at": datetime.now()
+    } for i in range(n)]
+
+
+def waste_material(seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        "type": rng.choice(WASTE_TYPES),
+        "quantity": f"{rng.randint(5, 50)} kg",
+        "composition": "Mixed organic",
+        "location": {"address": "Whitefield"}
+    }
+
+
+def local_produce(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        "_id": ObjectId(),
+        "name": rng.choice(PRODUCE),
+        "category": rng.choice(["Vegetables", "Fruits", "Grains"]),
+        "price": round(rng.uniform(10, 200), 2),
+        "supplier": f"Farm {i % 12}",
+        "location": {"address": "KR Market"},
+        "created_at": datetime.now()
+    } for i in range(n)]
+
+
+def user_profile(seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        "age": rng.randint(18, 70),
+        "gender": rng.choice(["Male", "Female"]),
+        "dietary_preferences": rng.sample(["Vegetarian", "Gluten-Free", "Low-Fat"], 1),
+        "allergies": [],
+        "health_goals": ["General Wellness"],
+        "activity_level": "Moderately Active"
+    }
+
+
+def food_items(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{"type": rng.choice(FOOD_TYPES), "name": rng.choice(PRODUCE), "quantity": f"{rng.randint(1, 20)} kg"}
+            for _ in range(n)]
@@ -0,0 +1,161 @@
+"""Local HTTP stub of the Twilio Messages API.
+
+Run from the repository root:
+
+    python -m benchmarks.twilio_stub --port 8765 --latency-ms 50 --error-rate 0.02 --throttle-rate 0.05
+
+Accepts POST /2010-04-01/Accounts/<sid>/Messages.json and answers 201 with a message
+resource after `latency_ms` (plus up to `jitter_ms`). A fraction `error_rate` of requests
+fail with a Twilio-shaped 500 and `throttle_rate` with 429 Too Many Requests. It speaks
+HTTP/1.1 keep-alive and counts the TCP connections it accepts, so a benchmark can tell
+pooled from unpooled clients; each new connection waits `handshake_ms` first, standing
+in for the TLS handshake with Twilio.
+
+Point the app at it with TWILIO_API_BASE_URL=http://127.0.0.1:8765 (any account sid and
+auth token are accepted).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+
+MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/(?P<account>[^/]+)/Messages\.json$")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address: Tuple[str, int], latency_ms: float = 50.0, handshake_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__(address, StubHandler)
+        self.latency_ms = latency_ms
+        self.handshake_ms = handshake_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.responses: Counter = Counter()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, field: str):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def outcome(self) -> Tuple[float, int]:
+        """Delay in seconds and HTTP status for the next request."""
+        with self.lock:
+            delay = (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000.0
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, 201
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, keep-alive replies stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        time.sleep(self.server.handshake_ms / 1000.0)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict, headers: Optional[dict] = None):
+        body = json.dumps(payload).encode("utf-8")
+        with self.server.lock:
+            self.server.responses[status] += 1
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        match = MESSAGES_PATH.match(self.path.split("?")[0])
+        if not match:
+            self._reply(404, {"code": 20404, "message": "The requested resource was not found", "status": 404})
+            return
+
+        delay, status = self.server.outcome()
+        time.sleep(delay)
+        if status == 429:
+            self._reply(429, {"code": 20429, "message": "Too Many Requests", "status": 429,
+                              "more_info": "https://www.twilio.com/docs/errors/20429"}, {"Retry-After": "1"})
+            return
+        if status == 500:
+            self._reply(500, {"code": 20500, "message": "Internal Server Error", "status": 500,
+                              "more_info": "https://www.twilio.com/docs/errors/20500"})
+            return
+        self.server.count("messages")
+        self._reply(201, {
+            "sid": "SM" + uuid.uuid4().hex,
+            "account_sid": match.group("account"),
+            "from": form.get("From", [""])[0],
+            "to": form.get("To", [""])[0],
+            "body": form.get("Body", [""])[0],
+            "status": "queued",
+            "num_segments": "1",
+            "direction": "outbound-api",
+            "api_version": "2010-04-01",
+            "uri": f"{self.path.split('?')[0][:-5]}/SM.json"
+        })
+
+
+def start_stub(port: int = 0, latency_ms: float = 50.0, handshake_ms: float = 0.0, host: str = "127.0.0.1",
+               **options) -> StubServer:
+    """Serve the stub on a daemon thread; port 0 picks a free port (see `base_url`).
+
+    `options` are StubServer's jitter_ms, error_rate, throttle_rate and seed.
+    """
+    server = StubServer((host, port), latency_ms, handshake_ms, **options)
+    threading.Thread(target=server.serve_forever, name="twilio-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), args.latency_ms, args.handshake_ms, args.jitter_ms,
+                        args.error_rate, args.throttle_rate, args.seed)
+    print(f"Twilio stub listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 import streamlit as st
 from utils.database import get_db
 from utils.ai_agents import get_ai_agents
+from utils.meal_plan_segments import get_meal_plan_segments, segment_profile
+from utils.job_queue import get_job_queue, DONE, FAILED
 from utils.config import get_config
+from utils.telemetry import set_current_page
 from datetime import datetime
 import pandas as pd
 import json
+import time
 from bson import ObjectId
 
 
 db = get_db()
 ai = get_ai_agents()
+segments = get_meal_plan_segments()
+jobs = get_job_queue()
 config = get_config()
+set_current_page("01_personalized_nutrition")
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -72,30 +79,41 @@ if "dietary_preferences" not in user or "health_goals" not in user:
 local_produce = db.find_documents(config.collections["local_produce"], {}, 50)
 
 
+user_profile = {
+    "age": user.get("age", 30),
+    "gender": user.get("gender", "Prefer not to say"),
+    "dietary_preferences": user.get("dietary_preferences", []),
+    "allergies": user.get("allergies", []),
+    "health_goals": user.get("health_goals", []),
+    "activity_level": user.get("activity_level", "Moderately Active")
+}
+
+
 st.subheader("Your Personalized Meal Plan")
+personalize = st.checkbox("Fine-tune a ready-made plan to my exact profile", value=True,
+                          help="Ready-made plans are shared by users with the same preferences and goals")
 if st.button("Generate New Meal Plan"):
     with st.spinner("Creating your personalized meal plan based on local availability..."):
-        user_profile = {
-            "age": user.get("age", 30),
-            "gender": user.get("gender", "Prefer not to say"),
-            "dietary_preferences": user.get("dietary_preferences", []),
-            "allergies": user.get("allergies", []),
-            "health_goals": user.get("health_goals", []),
-            "activity_level": user.get("activity_level", "Moderately Active")
-        }
+        meal_plan = segments.get_plan(user_profile, local_produce)
+        source = "segment"
         
-       
-        meal_plan = ai.generate_meal_plan(user_profile, local_produce)
+        if meal_plan is not None and personalize:
+            personalized = ai.personalize_meal_plan(user_profile, meal_plan, segment_profile(user_profile))
+            if "error" not in personalized:
+                meal_plan = personalized
+                source = "segment_personalized"
         
-        
-        if isinstance(meal_plan, dict) and "error" in meal_plan:
-            st.error(f"Failed to generate meal plan: {meal_plan.get('details', 'Unknown error')}")
-            st.stop()
-        
-    
+    if meal_plan is None:
+        st.session_state.meal_plan_job_id = jobs.enqueue("meal_plan", {
+            "user_id": st.session_state.user_id,
+            "user_profile": user_profile,
+            "local_produce": local_produce
+        }, user_id=st.session_state.user_id, dedup_ttl=0)
+    else:
         meal_plan_id = db.insert_document(config.collections["meal_plans"], {
             "user_id": st.session_state.user_id,
             "plan": meal_plan,
+            "source": source,
             "local_produce_used": bool(local_produce),
             "created_at": datetime.now()
         })
@@ -105,6 +123,25 @@ if st.button("Generate New Meal Plan"):
         st.success("Meal plan generated successfully!")
 
 
+meal_plan_job = jobs.get(st.session_state.meal_plan_job_id) if st.session_state.get("meal_plan_job_id") else None
+if meal_plan_job and meal_plan_job["status"] == DONE:
+    st.session_state.current_meal_plan = meal_plan_job["result"]["plan"]
+    st.session_state.current_meal_plan_id = meal_plan_job["result"]["meal_plan_id"]
+    del st.session_state.meal_plan_job_id
+    meal_plan_job = None
+    st.success("Meal plan generated successfully!")
+elif meal_plan_job and meal_plan_job["status"] == FAILED:
+    st.error(f"Failed to generate meal plan: {meal_plan_job.get('error', 'Unknown error')}")
+    del st.session_state.meal_plan_job_id
+    meal_plan_job = None
+elif meal_plan_job and jobs.unclaimed(meal_plan_job):
+    st.warning("No meal plan worker is running, so your request is still waiting in the queue. "
+               "It will be saved to your profile once a worker picks it up.")
+    meal_plan_job = None
+elif meal_plan_job:
+    st.info("Your new meal plan is being prepared in the background. You can leave this page; it will be saved to your profile.")
+
+
 if "current_meal_plan" not in st.session_state:
     latest_plan = db.get_collection(config.collections["meal_plans"]).find_one(
         {"user_id": st.session_state.user_id},
@@ -187,6 +224,28 @@ if "current_meal_plan" in st.session_state:
                         "lunch": days_data[days].get("lunch", {}).get("nutrition", {}),
                         "dinner": days_data[days].get("dinner", {}).get("nutrition", {})
                     })
+                
+                
+                with st.expander(f"Not happy with {days}? Regenerate just this part"):
+                    meal_choice = st.selectbox("What to regenerate", ["Whole day", "Breakfast", "Lunch", "Dinner"],
+                                               key="regenerate_meal_choice")
+                    if st.button(f"Regenerate {days} {meal_choice.lower()}"):
+                        meal = None if meal_choice == "Whole day" else meal_choice.lower()
+                        with st.spinner(f"Regenerating {days} {meal_choice.lower()}..."):
+                            part = ai.regenerate_meal_plan_part(user_profile, local_produce, plan, days, meal)
+                        
+                        if "error" in part:
+                            st.error(f"Failed to regenerate: {part.get('details', 'Unknown error')}")
+                        else:
+                            plan, updates = ai.merge_meal_plan_part(plan, days, meal, part)
+                            plan_id = st.session_state.get("current_meal_plan_id")
+                            if plan_id is not None:
+                                db.update_document(config.collections["meal_plans"],
+                                                   {"_id": ObjectId(plan_id) if ObjectId.is_valid(str(plan_id)) else plan_id},
+                                                   updates)
+                            st.session_state.current_meal_plan = plan
+                            st.success(f"{days} {meal_choice.lower()} updated!")
+                            st.rerun()
         
         
         if local_produce and ("shopping_list" in plan or any("ingredients" in day for day in plan.get("days", {}).values())):
@@ -233,4 +292,9 @@ if "current_meal_plan" in st.session_state:
                     })
                     st.success("Order placed successfully! You'll receive a confirmation shortly.")
             else:
-                st.info("No local sourcing options found for this meal plan")
\ No newline at end of file
+                st.info("No local sourcing options found for this meal plan")
+
+
+if meal_plan_job:
+    time.sleep(2)
+    st.rerun()
@@ -1,21 +1,26 @@
 import streamlit as st
 from utils.database import get_db
-from utils.ai_agents import get_ai_agents
 from utils.notifications import get_notifications
 from utils.config import get_config
+from utils.telemetry import set_current_page
 from utils.langgraph_flows import get_langgraph_flows
 from utils.deliverypartner import get_delivery_partner
+from utils.dispatch import get_dispatch_service
+from utils.presence import get_presence_tracker
+from utils.matching import find_candidates
 from datetime import datetime
 import pandas as pd
 import json
 
 
 db = get_db()
-ai = get_ai_agents()
 notify = get_notifications()
 config = get_config()
+set_current_page("02_surplus_redistribution")
 flows = get_langgraph_flows()
 delivery = get_delivery_partner()
+dispatch = get_dispatch_service()
+presence = get_presence_tracker()
 
 st.title("Surplus Food Redistribution")
 st.markdown("""
@@ -57,19 +62,47 @@ if user["role"] == "donor":
                 "created_at": datetime.now()
             }
             
-            donation_id = db.insert_document(config.collections["food_donations"], donation_data)
+            status = st.status("Saving donation...", expanded=True)
+            # Submitting the same donation again after a failure resumes its run instead of starting over.
+            fingerprint = json.dumps([str(st.session_state.user_id), food_type, quantity, donation_data["expiry_date"],
+                                      location, special_requirements, donor_phone])
+            pending = st.session_state.get("pending_donation")
+            if pending and pending["fingerprint"] == fingerprint:
+                donation_id = pending["id"]
+                status.write("Resuming your earlier submission")
+            else:
+                donation_id = db.insert_document(config.collections["food_donations"], donation_data)
+                st.session_state.pending_donation = {"fingerprint": fingerprint, "id": donation_id}
+                status.write("Donation saved")
             
             
-            recipients = db.find_documents(config.collections["recipients"], {}, 50)
+            recipients = find_candidates(db.get_collection(config.collections["recipients"]), donation_data)
             
             if recipients:
-               
-                result = flows.run_workflow("food_redistribution", {
-                    "donation": donation_data,
-                    "recipients": recipients
-                })
+                status.update(label="Finding the best recipient...")
+                result = {}
+                try:
+                    for event in flows.stream_workflow("food_redistribution", {
+                        "donation": donation_data,
+                        "recipients": recipients,
+                        "notify": True
+                    }, thread_id=f"donation:{donation_id}"):
+                        result = event["state"]
+                        if event["node"] == "rank_recipients":
+                            status.write(f"Ranked {len(event['update']['ranked'])} candidate recipients")
+                        elif event["node"] == "match_donation" and event["update"]["match"].get("recipient_name"):
+                            status.write(f"Matched with {event['update']['match']['recipient_name']}")
+                except Exception as e:
+                    status.update(label="Matching interrupted", state="error")
+                    if flows.checkpointer is not None:
+                        st.error(f"Your donation is saved, but matching stopped: {str(e)}. Submit it again to pick up where it left off.")
+                    else:
+                        st.error(f"Your donation is saved, but matching stopped: {str(e)}")
+                    st.stop()
+                del st.session_state.pending_donation
+                flows.forget_run(f"donation:{donation_id}")
                 
-                if "match" in result:
+                if result.get("match", {}).get("recipient_id"):
                     best_match = result["match"]
                     db.update_document(config.collections["food_donations"], 
                                      {"_id": donation_id},
@@ -81,11 +114,12 @@ if user["role"] == "donor":
                     
                     if recipient:
                         
-                        notify.notify_food_match(
-                            donor_phone=donor_phone,
-                            recipient_phone=recipient.get("phone", ""),
-                            food_details=donation_data
-                        )
+                        if result.get("notification_sent"):
+                            status.write("Donor and recipient notified")
+                        
+                        offered = dispatch.offer({**donation_data, "_id": donation_id})
+                        if offered:
+                            status.write(f"Offered to {len(offered)} nearby delivery partners")
                         
                        
                         db.get_collection(config.collections["social_impact"]).update_one(
@@ -98,12 +132,17 @@ if user["role"] == "donor":
                             }}
                         )
                         
+                        status.update(label="Donation matched", state="complete", expanded=False)
                         st.success(f"Donation matched with {recipient.get('name', 'recipient')}! Both parties have been notified via WhatsApp.")
                     else:
+                        status.update(label="Matching failed", state="error")
                         st.error("Matched recipient not found")
                 else:
+                    status.update(label="Donation saved", state="complete", expanded=False)
                     st.success("Donation submitted! We'll notify you when we find a match.")
             else:
+                del st.session_state.pending_donation
+                status.update(label="Donation saved", state="complete", expanded=False)
                 st.warning("No recipients currently available. Your donation has been recorded and we'll notify you when a match is found.")
 
 elif user["role"] == "recipient":
@@ -124,20 +163,12 @@ elif user["role"] == "recipient":
                                      {"_id": donation["_id"]},
                                      {"recipient_id": st.session_state.user_id,
                                       "status": "matched"})
+                    dispatch.offer(donation)
                     
-                    
-                    notify.send_whatsapp_message(
-                        to=donation["donor_phone"],
-                        message=f"""
-                         Food Request Notification 
-                        
-                        Your donation has been requested!
-                        
-                        Item: {donation['type']}
-                        Quantity: {donation['quantity']}
-                        
-                        The recipient will contact you shortly to arrange pickup.
-                        """
+                    notify.send_template(
+                        donation["donor_phone"],
+                        "donation_requested",
+                        donation
                     )
                     
                     st.success("Request sent! The donor has been notified and will contact you to arrange pickup.")
@@ -147,6 +178,13 @@ elif user["role"] == "recipient":
 elif user["role"] == "delivery_partner":
     st.subheader("Delivery Partner Dashboard")
     
+    # Positions only come from location heartbeats (utils/presence.py); this just records the switch.
+    partner_status = db.get_collection(config.collections["delivery_partners"]).find_one(
+        {"_id": st.session_state.user_id}, {"available": 1}) or {}
+    available = st.checkbox("Available for deliveries", value=bool(partner_status.get("available")))
+    if available != bool(partner_status.get("available")):
+        presence.set_available(st.session_state.user_id, available)
+    
     tab1, tab2 = st.tabs(["Available Deliveries", "My Deliveries"])
     
     with tab1:
@@ -177,7 +215,24 @@ elif user["role"] == "delivery_partner":
                             st.error("Failed to confirm pickup")
         else:
             st.info("No available deliveries at this time")
-    
+
+        if st.button("Plan My Route"):
+            route = delivery.plan_route(st.session_state.user_id)
+            if route["stops"]:
+                st.write(f"**{len(route['stops'])} stops** · {route['distance_km']} km · about {int(route['duration_minutes'])} minutes")
+                st.dataframe(pd.DataFrame([{
+                    "stop": i + 1,
+                    "action": stop["action"].capitalize(),
+                    "address": stop["address"] or "N/A",
+                    "eta": stop["eta"].strftime("%H:%M"),
+                    "load_kg": stop["load_kg"]
+                } for i, stop in enumerate(route["stops"])]))
+            else:
+                st.info("No deliveries can be routed right now")
+            if route["unassigned"]:
+                st.caption(f"{len(route['unassigned'])} deliveries left out: "
+                           + ", ".join(sorted({u["reason"] for u in route["unassigned"]})))
+
     with tab2:
         st.markdown("### My Active Deliveries")
         my_deliveries = delivery.get_my_deliveries(st.session_state.user_id)
@@ -205,6 +260,45 @@ elif user["role"] == "delivery_partner":
         else:
             st.info("You don't have any active deliveries")
 
+elif user["role"] == "admin":
+    st.subheader("Re-match Unmatched Donations")
+    
+    unmatched = db.find_documents(config.collections["food_donations"],
+                                  {"status": "available", "recipient_id": {"$exists": False}}, 0)
+    st.write(f"{len(unmatched)} donations are waiting for a match")
+    max_concurrency = st.slider("Concurrent matches", min_value=1, max_value=32, value=8)
+    
+    if unmatched and st.button("Re-match All"):
+        # Donations of the same food type share one candidate list.
+        candidates = {}
+        for donation in unmatched:
+            if donation.get("type") not in candidates:
+                candidates[donation.get("type")] = find_candidates(db.get_collection(config.collections["recipients"]), donation)
+        progress = st.progress(0.0, text="Matching donations...")
+        results = flows.run_workflow_batch(
+            "food_redistribution",
+            [{"donation": donation, "recipients": candidates[donation.get("type")], "notify": True} for donation in unmatched],
+            max_concurrency=max_concurrency,
+            on_progress=lambda completed, total: progress.progress(completed / total, text=f"Matched {completed}/{total}")
+        )
+        
+        summary = []
+        for donation, result in zip(unmatched, results):
+            match = result.get("match", {}) if isinstance(result, dict) else {}
+            if match.get("recipient_id"):
+                db.update_document(config.collections["food_donations"],
+                                   {"_id": donation["_id"]},
+                                   {"recipient_id": match["recipient_id"], "status": "matched"})
+                dispatch.offer(donation)
+            summary.append({
+                "donation": f"{donation.get('type')} - {donation.get('quantity')}",
+                "recipient": match.get("recipient_name", "No match"),
+                "score": match.get("score"),
+                "error": result.get("details") if isinstance(result, dict) else None
+            })
+        st.success(f"Matched {sum(1 for row in summary if row['score'] is not None)} of {len(unmatched)} donations")
+        st.dataframe(pd.DataFrame(summary))
+
 
 st.subheader("Your Activity")
 if user["role"] == "donor":
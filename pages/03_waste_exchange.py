@@ -1,18 +1,18 @@
 import streamlit as st
 from utils.database import get_db
-from utils.ai_agents import get_ai_agents
 from utils.notifications import get_notifications
 from utils.config import get_config
+from utils.telemetry import set_current_page
 from utils.langgraph_flows import get_langgraph_flows
 from datetime import datetime
 import pandas as pd
 
 def display_waste_exchange():
     db = get_db()
-    ai = get_ai_agents()
     notify = get_notifications()
     config = get_config()
     flows = get_langgraph_flows()
+    set_current_page("03_waste_exchange")
 
     st.title("Business to Business Waste Exchange")
     st.markdown("""
@@ -127,18 +127,10 @@ def display_waste_exchange():
                                               "status": "matched"})
                             
                           
-                            notify_success = notify.send_whatsapp_message(
-                                to=waste["contact_phone"],
-                                message=f"""
-                                 Waste Request Notification 
-                                
-                                Your waste material has been requested!
-                                
-                                Type: {waste['type']}
-                                Quantity: {waste['quantity']}
-                                
-                                The requester will contact you shortly to arrange pickup.
-                                """
+                            notify_success = notify.send_template(
+                                waste["contact_phone"],
+                                "waste_requested",
+                                waste
                             )
                             
                             if notify_success:
@@ -1,7 +1,7 @@
 import streamlit as st
 from utils.database import get_db
-from utils.ai_agents import get_ai_agents
 from utils.config import get_config
+from utils.telemetry import set_current_page
 from utils.langgraph_flows import get_langgraph_flows
 import pandas as pd
 import plotly.express as px
@@ -12,8 +12,8 @@ import random
 
 
 db = get_db()
-ai = get_ai_agents()
 config = get_config()
+set_current_page("04_nutritional_impact")
 flows = get_langgraph_flows()
 
 
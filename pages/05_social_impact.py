@@ -2,6 +2,7 @@ import streamlit as st
 from utils.database import get_db
 from utils.config import get_config
 from utils.notifications import get_notifications
+from utils.message_templates import render
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -461,17 +462,9 @@ def impact_tracker_page():
     with share_cols[0]:
         share_message = st.text_area(
             "Customize your share message",
-            value=f""" My FoodConnect Impact 
-
-I've contributed to:
-- {user_impact['meals_provided']} meals provided 
-- {user_impact['co2_saved']} kg CO₂ saved 
-- {user_impact['waste_reduced']} kg waste reduced 
-
-My current impact score: {user_impact['score']} pts
-Current rank: #{next((i+1 for i, u in enumerate(leaderboard_data) if u.get('username') == 'You' or u.get('user_id') == st.session_state.user_id), 1)} in the community
-
-Join me in making a difference with FoodConnect!""",
+            value=render("impact_share", user_impact, rank=next(
+                (i+1 for i, u in enumerate(leaderboard_data) if u.get('username') == 'You' or u.get('user_id') == st.session_state.user_id), 1
+            )),
             height=150
         )
     
@@ -482,7 +475,8 @@ Join me in making a difference with FoodConnect!""",
             if notify:
                 if notify.send_whatsapp_message(
                     user_impact.get('phone', ''),  
-                    share_message
+                    share_message,
+                    priority="bulk"
                 ):
                     st.success("Impact summary shared via WhatsApp!")
                 else:
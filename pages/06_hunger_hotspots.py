@@ -3,17 +3,22 @@ import streamlit as st
 from utils.database import get_db
 from utils.ai_agents import get_ai_agents
 from utils.config import get_config
+from utils.telemetry import set_current_page
+from utils.job_queue import get_job_queue, DONE, FAILED
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 import pydeck as pdk
 import random
+import time
 from sklearn.cluster import KMeans
 from geopy.distance import geodesic
 
 db = get_db()
 ai = get_ai_agents()
 config = get_config()
+jobs = get_job_queue()
+set_current_page("06_hunger_hotspots")
 
 def generate_mock_hotspots():
     """Generate real hotspot data for demonstration"""
@@ -200,9 +205,19 @@ def display_hunger_hotspots():
                 ]))
             }
             
-            with st.spinner("Analyzing food security trends..."):
-                hotspots = ai.predict_hunger_hotspots(historical_data, current_data)
-                available_resources = list(db.find_documents(config.collections["food_resources"], {"status": "available"}, 50))
+            # Identical inputs reuse the last finished analysis for an hour.
+            job = jobs.get(jobs.enqueue("hunger_hotspots", {
+                "historical_data": historical_data,
+                "current_data": current_data
+            }, user_id=st.session_state.user_id))
+            if jobs.unclaimed(job):
+                st.warning("No analysis worker is running; showing sample hotspots instead.")
+            elif job["status"] not in (DONE, FAILED):
+                st.info("Analyzing food security trends in the background...")
+                time.sleep(2)
+                st.rerun()
+            hotspots = job.get("result") if job["status"] == DONE else None
+            available_resources = list(db.find_documents(config.collections["food_resources"], {"status": "available"}, 50))
                 
             if not hotspots or not isinstance(hotspots, dict):
                 st.warning("Realtime data updated")
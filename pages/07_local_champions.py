@@ -126,17 +126,10 @@ def display_local_champion():
                     st.success("Application submitted! We'll review your application and get back to you soon.")
                     
                    
-                    notify_success = notify.send_whatsapp_message(
-                        to=user.get("phone", ""),
-                        message=f"""
-                        Local Champion Application Received 
-                        
-                        Thank you for applying to be a Local Champion!
-                        
-                        We'll review your application and get back to you soon.
-                        
-                        In the meantime, keep contributing to the platform to strengthen your application.
-                        """
+                    notify_success = notify.send_template(
+                        user.get("phone", ""),
+                        "champion_application_received",
+                        priority="bulk"
                     )
                     
                     if not notify_success:
@@ -0,0 +1,102 @@
+import streamlit as st
+from utils.database import get_db
+from utils.config import get_config
+from utils.telemetry import get_usage_tracker
+from utils.tracing import get_workflow_tracer
+import pandas as pd
+
+
+db = get_db()
+config = get_config()
+usage = get_usage_tracker()
+tracer = get_workflow_tracer()
+
+st.title("AI Usage & Latency")
+st.markdown("""
+### Token usage, cost and latency per AI feature
+""")
+
+
+if 'user_id' not in st.session_state or not st.session_state.user_id:
+    st.warning("Please login to access the admin dashboard")
+    st.stop()
+
+user = db.get_collection(config.collections["users"]).find_one({"_id": st.session_state.user_id})
+if not user or user.get("role") != "admin":
+    st.error("This page is only available to admins")
+    st.stop()
+
+
+records = usage.snapshot()
+if not records:
+    st.info("No AI calls recorded in this process yet")
+else:
+    by_method = pd.DataFrame(usage.summary(by=("method",)))
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("AI Calls", int(by_method["calls"].sum()))
+    with col2:
+        st.metric("Prompt Tokens", int(by_method["prompt_tokens"].sum()))
+    with col3:
+        st.metric("Completion Tokens", int(by_method["completion_tokens"].sum()))
+    with col4:
+        st.metric("Estimated Cost (USD)", f"{by_method['est_cost_usd'].sum():.4f}")
+
+    st.subheader("By Method")
+    st.dataframe(by_method.sort_values("est_cost_usd", ascending=False))
+
+    st.subheader("By Page")
+    st.dataframe(pd.DataFrame(usage.summary(by=("page", "method"))))
+
+    st.subheader("Most Expensive Calls")
+    calls_df = pd.DataFrame(records)
+    sort_column = "prompt_tokens" if calls_df["prompt_tokens"].notna().any() else "estimated_prompt_tokens"
+    st.dataframe(calls_df.sort_values(sort_column, ascending=False).head(20))
+
+    st.subheader("Export")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download CSV", usage.export("csv"), file_name="ai_usage.csv", mime="text/csv")
+    with col2:
+        st.download_button("Download JSON", usage.export("json"), file_name="ai_usage.json", mime="application/json")
+
+
+st.subheader("Workflow Traces")
+spans = tracer.snapshot()
+if not spans:
+    st.info("No workflow runs traced in this process yet")
+    st.stop()
+
+by_node = pd.DataFrame(tracer.summary())
+workflows = by_node[by_node["kind"] == "workflow"]
+nodes = by_node[by_node["kind"] == "node"].sort_values("p95_ms", ascending=False)
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("Workflow Runs", int(workflows["calls"].sum()))
+with col2:
+    st.metric("Node Errors", int(nodes["errors"].sum()))
+with col3:
+    st.metric("Slowest Node p95 (ms)", f"{nodes['p95_ms'].iloc[0]:.1f}" if not nodes.empty else "-")
+
+st.markdown("**Per workflow**")
+st.dataframe(workflows.drop(columns=["kind", "name"]))
+
+st.markdown("**Slowest nodes (p95)**")
+if not nodes.empty:
+    slowest = nodes.head(10).assign(node=lambda df: df["workflow"] + "." + df["name"])
+    st.bar_chart(slowest.set_index("node")[["p50_ms", "p95_ms"]])
+st.dataframe(nodes.drop(columns=["kind"]))
+
+failed = [s for s in spans if s.get("error")]
+if failed:
+    st.markdown("**Recent failures**")
+    st.dataframe(pd.DataFrame(failed[-20:])[["workflow", "name", "error", "duration_ms", "trace_id"]])
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.download_button("Download Spans (JSON)", tracer.export("json"), file_name="workflow_spans.json", mime="application/json")
+with col2:
+    st.download_button("Download Spans (CSV)", tracer.export("csv"), file_name="workflow_spans.csv", mime="text/csv")
+with col3:
+    st.download_button("Download OTLP", tracer.export("otlp"), file_name="workflow_traces.otlp.json", mime="application/json")
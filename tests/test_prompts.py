@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from utils.prompts import (TOKEN_BUDGETS, PromptBuilder, estimate_tokens, hotspots_prompt, match_prompt,
+                           meal_plan_prompt, waste_exchange_prompt)
+
+
+def produce(n):
+    return [{"_id": ObjectId(), "name": f"Produce {i}", "category": ["leafy", "root", "fruit"][i % 3], "price": 12.5,
+             "season": "winter", "supplier": f"Farm {i}", "created_at": datetime(2024, 1, 1), "phone": "+9100000000"}
+            for i in range(n)]
+
+
+def waste_users(n):
+    return [{"_id": ObjectId(), "name": f"Business {i}", "business_type": ["compost", "biogas"][i % 2],
+             "waste_types": ["Food Waste"], "capacity": 100, "location": {"address": f"{i} Main Road"},
+             "phone": "+9100000000"} for i in range(n)]
+
+
+PROMPTS = {
+    "match_surplus_food": lambda n: match_prompt(
+        {"type": "Cooked Food", "quantity": "20 kg", "location": {"address": "MG Road"}},
+        [{"recipient_id": str(i), "name": f"Shelter {i}", "score": 0.5, "distance_km": 2.0, "capacity": 50,
+          "needs": ["Cooked Food"]} for i in range(n)]),
+    "create_waste_exchange": lambda n: waste_exchange_prompt({"type": "Food Waste", "quantity": "50 kg"}, waste_users(n)),
+    "generate_meal_plan": lambda n: meal_plan_prompt({"age": 30, "dietary_preferences": ["Vegetarian"]}, produce(n)),
+    "predict_hunger_hotspots": lambda n: hotspots_prompt(
+        [{"location": f"Ward {i}", "region": "North", "time_period": "2024-01", "severity_index": 0.4,
+          "latitude": 12.9, "longitude": 77.5} for i in range(n)],
+        {"time_period": "2024-02", "donation_trends": [{"_id": f"Type {i}", "count": i} for i in range(n)],
+         "request_trends": [{"_id": f"Type {i}", "count": i} for i in range(n)]}),
+}
+
+
+@pytest.mark.parametrize("agent", sorted(PROMPTS))
+def test_prompt_stays_within_budget(agent):
+    prompt = PROMPTS[agent](2000)
+    assert estimate_tokens(prompt.user) <= TOKEN_BUDGETS[agent]
+    assert prompt.truncated
+    assert prompt.estimated_tokens == estimate_tokens(prompt.system) + estimate_tokens(prompt.user)
+
+
+@pytest.mark.parametrize("agent", sorted(PROMPTS))
+def test_small_prompt_is_not_truncated(agent):
+    prompt = PROMPTS[agent](3)
+    assert not prompt.truncated
+    assert "(+" not in prompt.user
+
+
+def test_prompt_drops_unprojected_fields():
+    prompt = meal_plan_prompt({"age": 30}, produce(3))
+    assert "+9100000000" not in prompt.user
+    assert "2024-01-01" not in prompt.user
+    assert "Produce 2" in prompt.user
+
+
+def test_truncated_records_are_summarized():
+    prompt = waste_exchange_prompt({"type": "Food Waste"}, waste_users(2000))
+    omitted = prompt.truncated["Potential Users"]
+    assert f"(+{omitted} more omitted: " in prompt.user
+    assert "compost x" in prompt.user and "biogas x" in prompt.user
+
+
+def test_builder_respects_explicit_budget():
+    builder = PromptBuilder("generate_meal_plan", token_budget=200)
+    builder.add_text("Header")
+    builder.add_records("Rows", produce(500), ["name", "category"])
+    assert builder.used_tokens <= 200
+    assert builder.truncated["Rows"] > 0
@@ -0,0 +1,299 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.resilience import (CircuitBreaker, CircuitOpenError, DeadlineExceeded, RateLimitExceeded, ResilientLLM,
+                              SharedRateLimiter, TokenBucket)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CounterCollection:
+    """Just enough of a Mongo collection for SharedRateLimiter's upserted $inc."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "count": 0, **update["$setOnInsert"]})
+        doc["count"] += update["$inc"]["count"]
+        return dict(doc)
+
+
+class ScriptedModel:
+    """Chat model stand-in: raises or answers per call from `script`, then echoes."""
+
+    def __init__(self, script=(), delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+        self.release = threading.Event()
+
+    def _next(self):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else "ok"
+        if step == "hang":
+            self.release.wait(5)
+        elif isinstance(step, Exception):
+            raise step
+        return step
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.delay)
+        return self._next()
+
+    def stream(self, messages, **kwargs):
+        yield self._next()
+        yield "!"
+
+    async def ainvoke(self, messages, **kwargs):
+        if self.script and self.script[0] == "hang":
+            self.script.pop(0)
+            await asyncio.sleep(5)
+        return self._next()
+
+    async def astream(self, messages, **kwargs):
+        yield await self.ainvoke(messages)
+        yield "!"
+
+
+def resilient(model, **options):
+    options = {"requests_per_minute": 6000, "timeout": 1.0, "backoff_base": 0.001, "backoff_max": 0.01, **options}
+    return ResilientLLM(model, **options)
+
+
+def test_token_bucket_grants_capacity_then_reports_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=clock)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.advance(1.0)
+    assert bucket.try_acquire() == 0.0
+
+
+def test_token_bucket_refill_is_capped_at_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=clock)
+    bucket.try_acquire(2)
+    clock.advance(3600)
+    assert bucket.try_acquire(2) == 0.0
+    assert bucket.try_acquire(1) == pytest.approx(1.0)
+
+
+def test_token_bucket_clamps_requests_larger_than_capacity():
+    bucket = TokenBucket(rate_per_minute=600, capacity=100, clock=FakeClock())
+    assert bucket.try_acquire(5000) == 0.0
+    assert bucket.tokens == 0
+
+
+def test_token_bucket_consume_can_go_negative():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, capacity=10, clock=clock)
+    bucket.consume(20)
+    assert bucket.try_acquire(1) == pytest.approx(11.0)
+    clock.advance(11)
+    assert bucket.try_acquire(1) == 0.0
+
+
+def test_token_bucket_acquire_raises_when_wait_exceeds_timeout():
+    bucket = TokenBucket(rate_per_minute=1, capacity=1)
+    bucket.acquire(1, timeout=0.1)
+    start = time.monotonic()
+    with pytest.raises(RateLimitExceeded):
+        bucket.acquire(1, timeout=0.1)
+    assert time.monotonic() - start < 0.1
+
+
+def test_shared_rate_limiter_counts_across_instances_per_window():
+    clock = FakeClock()
+    collection = CounterCollection()
+    first = SharedRateLimiter(collection, "twilio:AC1", 2, clock=clock)
+    second = SharedRateLimiter(collection, "twilio:AC1", 2, clock=clock)
+    other_account = SharedRateLimiter(collection, "twilio:AC2", 2, clock=clock)
+    clock.advance(0.25)
+    assert first.try_acquire() == 0.0
+    assert second.try_acquire() == 0.0
+    assert first.try_acquire() == pytest.approx(0.75)
+    assert other_account.try_acquire() == 0.0
+    clock.advance(0.75)
+    assert second.try_acquire() == 0.0
+
+
+def test_shared_rate_limiter_acquire_raises_when_wait_exceeds_timeout():
+    limiter = SharedRateLimiter(CounterCollection(), "twilio:AC1", 1, window=60)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(timeout=0.01)
+
+
+def test_breaker_opens_after_threshold_and_probes_when_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.advance(30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # Only one probe until the timer runs out again.
+    assert not breaker.allow()
+
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_reopens_when_probe_fails():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    llm = resilient(ScriptedModel(), backoff_base=0.5, backoff_max=8.0)
+    monkeypatch.setattr("utils.resilience.random.uniform", lambda low, high: high)
+    assert [llm._backoff(attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+    monkeypatch.undo()
+    assert all(0 <= llm._backoff(3) <= 4.0 for _ in range(100))
+
+
+def test_invoke_retries_transient_errors():
+    model = ScriptedModel([ConnectionError("reset"), ConnectionError("reset"), "done"])
+    info = {}
+    assert resilient(model).invoke("hi", info=info) == "done"
+    assert info["attempts"] == 3
+
+
+def test_invoke_gives_up_after_max_retries():
+    model = ScriptedModel([RuntimeError("boom")] * 10)
+    with pytest.raises(RuntimeError):
+        resilient(model, max_retries=2).invoke("hi")
+    assert model.calls == 3
+
+
+def test_invoke_serves_cached_response_when_upstream_fails():
+    model = ScriptedModel(["first"] + [RuntimeError("boom")] * 10)
+    llm = resilient(model, max_retries=1)
+    assert llm.invoke("hi") == "first"
+    info = {}
+    assert llm.invoke("hi", info=info) == "first"
+    assert info["cache_hit"] is True
+
+
+def test_open_breaker_fails_fast_without_calling_model():
+    clock = FakeClock()
+    model = ScriptedModel()
+    llm = resilient(model, breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=clock))
+    llm.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        llm.invoke("hi")
+    assert model.calls == 0
+
+
+def test_request_limit_falls_back_instead_of_waiting():
+    llm = resilient(ScriptedModel(), requests_per_minute=1)
+    assert llm.invoke("hi") == "ok"
+    start = time.monotonic()
+    assert llm.invoke("hi") == "ok"  # cached
+    with pytest.raises(RateLimitExceeded):
+        llm.invoke("something else")
+    assert time.monotonic() - start < 0.5
+
+
+def test_invoke_deadline_bounds_hung_call():
+    model = ScriptedModel(["hang"])
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        resilient(model, timeout=0.2).invoke("hi")
+    assert time.monotonic() - start < 1.0
+    model.release.set()
+
+
+def test_hung_calls_do_not_starve_later_calls():
+    model = ScriptedModel(["hang"])
+    llm = resilient(model, timeout=0.2, max_workers=1, max_abandoned=1, max_retries=0)
+    with pytest.raises(DeadlineExceeded):
+        llm.invoke("hi")
+    assert llm.abandoned == 1
+    assert llm.invoke("other") == "ok"
+
+    model.script = ["hang"]
+    with pytest.raises(DeadlineExceeded):
+        llm.invoke("third")
+    # Both threads are hung; fail fast rather than queue behind them.
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        llm.invoke("fourth")
+    assert time.monotonic() - start < 0.1
+
+    model.release.set()
+    deadline = time.monotonic() + 2
+    while llm.abandoned and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert llm.abandoned == 0
+    assert llm.invoke("fifth") == "ok"
+
+
+def test_stream_deadline_applies_before_first_chunk():
+    model = ScriptedModel(["hang"])
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        list(resilient(model, timeout=0.2).stream("hi"))
+    assert time.monotonic() - start < 1.0
+    model.release.set()
+
+
+def test_stream_retries_before_first_chunk():
+    model = ScriptedModel([ConnectionError("reset"), "a"])
+    info = {}
+    assert list(resilient(model).stream("hi", info=info)) == ["a", "!"]
+    assert info["attempts"] == 2
+
+
+def test_ainvoke_shares_retries_and_cache_with_invoke():
+    model = ScriptedModel([ConnectionError("reset"), "done"] + [RuntimeError("boom")] * 10)
+    llm = resilient(model, max_retries=1)
+    info = {}
+    assert asyncio.run(llm.ainvoke("hi", info=info)) == "done"
+    assert info["attempts"] == 2
+    info = {}
+    assert llm.invoke("hi", info=info) == "done"
+    assert info["cache_hit"] is True
+
+
+def test_ainvoke_deadline_bounds_hung_call():
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(resilient(ScriptedModel(["hang"]), timeout=0.2, max_retries=0).ainvoke("hi"))
+    assert time.monotonic() - start < 1.0
+
+
+def test_astream_retries_before_first_chunk():
+    async def collect(llm, info):
+        return [chunk async for chunk in llm.astream("hi", info=info)]
+
+    info = {}
+    assert asyncio.run(collect(resilient(ScriptedModel([ConnectionError("reset"), "a"])), info)) == ["a", "!"]
+    assert info["attempts"] == 2
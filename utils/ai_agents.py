@@ -1,7 +1,6 @@
 import streamlit as st
-from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import json
 from datetime import datetime
 import os
@@ -9,6 +8,12 @@ from dotenv import load_dotenv
 import logging
 from bson import ObjectId
 from utils.config import get_secret
+from utils.matching import CandidateRanker
+from utils.resilience import ResilientLLM
+from utils.nutrition_engine import get_nutrition_engine
+from utils.telemetry import get_usage_tracker
+from utils.prompts import (Prompt, match_prompt, waste_exchange_prompt, meal_plan_prompt, meal_plan_part_prompt,
+                           meal_plan_personalize_prompt, hotspots_prompt)
 
 
 logging.basicConfig(level=logging.INFO)
@@ -24,18 +29,41 @@ class JSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 class AIAgents:
-    def __init__(self):
+    def __init__(self, llm=None, **resilience_options):
+        """Wrap `llm` (Gemini by default) in the rate-limited, retrying ResilientLLM.
+        
+        `resilience_options` override the ResilientLLM settings, e.g. to lift the rate
+        limit when benchmarking against a local fake model.
+        """
         try:
-            # google_api_key = os.getenv("GOOGLE_API_KEY")
-            google_api_key = get_secret("GOOGLE_API_KEY")
-            if not google_api_key:
-                raise ValueError("Google API key not found in environment variables")
+            timeout = float(get_secret("GEMINI_TIMEOUT_SECONDS") or 30)
+            if llm is None:
+                # google_api_key = os.getenv("GOOGLE_API_KEY")
+                google_api_key = get_secret("GOOGLE_API_KEY")
+                if not google_api_key:
+                    raise ValueError("Google API key not found in environment variables")
+                
+                llm = ChatGoogleGenerativeAI(
+                    model="gemini-1.5-flash",
+                    google_api_key=google_api_key,
+                    temperature=0.7,
+                    max_retries=0,
+                    # Ends calls ResilientLLM has given up on, so they free their thread.
+                    timeout=timeout
+                )
             
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash",
-                google_api_key=google_api_key,
-                temperature=0.7
-            )
+            options = {
+                "requests_per_minute": float(get_secret("GEMINI_REQUESTS_PER_MINUTE") or 15),
+                "tokens_per_minute": float(get_secret("GEMINI_TOKENS_PER_MINUTE") or 1_000_000),
+                "timeout": timeout
+            }
+            options.update(resilience_options)
+            self.llm = ResilientLLM(llm, **options)
+            self.ranker = CandidateRanker()
+            self.nutrition = get_nutrition_engine()
+            self.prompt_tokens: Dict[str, int] = {}
+            self.usage = get_usage_tracker()
+            self.model_name = getattr(llm, "model", None) or getattr(llm, "model_name", "unknown")
         except Exception as e:
             st.error(f"Failed to initialize AI Agents: {e}")
             raise
@@ -79,155 +107,281 @@ class AIAgents:
                 "details": str(e),
                 "raw_response": content[:500] + "..." if len(content) > 500 else content
             }
-    def match_surplus_food(self, food_donation: Dict[str, Any], recipients: List[Dict[str, Any]]) -> Dict[str, Any]:
-        system_prompt = """You are an AI that matches surplus food donations with organizations that can use them. 
-        Analyze the food donation details and match it with the most suitable recipient based on their needs, 
-        capacity, and location proximity."""
+    def _prompt_messages(self, prompt: Prompt) -> list:
+        """Log the prompt size and return chat messages for it."""
+        self.prompt_tokens[prompt.agent] = prompt.estimated_tokens
+        logger.info(f"{prompt.agent} prompt: ~{prompt.estimated_tokens} tokens"
+                    + (f", truncated {prompt.truncated}" if prompt.truncated else ""))
+        return prompt.messages()
+    
+    def _start_call(self, method: str, prompt: Prompt):
+        """Messages for `prompt`, a usage recorder and the info dict ResilientLLM fills in."""
+        messages = self._prompt_messages(prompt)
+        return messages, self.usage.start(method, self.model_name, prompt.estimated_tokens), {}
+    
+    @staticmethod
+    def _add_chunk(call, response, chunk):
+        call.first_token()
+        return chunk if response is None else response + chunk
+    
+    def _invoke(self, method: str, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        """Call the LLM for `prompt`, parse the reply and record tokens, latency and outcome."""
+        messages, call, info = self._start_call(method, prompt)
+        try:
+            if stream:
+                response = None
+                for chunk in self.llm.stream(messages, info=info):
+                    response = self._add_chunk(call, response, chunk)
+            else:
+                response = self.llm.invoke(messages, info=info)
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        return self._parse_and_record(call, response, info)
+    
+    async def _ainvoke(self, method: str, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        """Async `_invoke`."""
+        messages, call, info = self._start_call(method, prompt)
+        try:
+            if stream:
+                response = None
+                async for chunk in self.llm.astream(messages, info=info):
+                    response = self._add_chunk(call, response, chunk)
+            else:
+                response = await self.llm.ainvoke(messages, info=info)
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        return self._parse_and_record(call, response, info)
+    
+    def _parse_and_record(self, call, response, info: Dict[str, Any]) -> Dict[str, Any]:
+        parsed = self._process_llm_response(response)
+        parse_ok = isinstance(parsed, dict) and "error" not in parsed and set(parsed) != {"response"}
+        call.finish(response=response, cache_hit=info.get("cache_hit"), parse_ok=parse_ok)
+        return parsed
+    
+    def rank_recipients(self, food_donation: Dict[str, Any], recipients: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Top-k recipients for a donation, best first; no LLM call."""
+        return self.ranker.rank(food_donation, recipients)
+    
+    def match_surplus_food(self, food_donation: Dict[str, Any], recipients: List[Dict[str, Any]],
+                           ranked: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Match a donation to a recipient, pre-ranking candidates so only the top-k reach the LLM.
         
-        user_prompt = f"""
-        Food Donation Details:
-        - Type: {food_donation.get('type', 'N/A')}
-        - Quantity: {food_donation.get('quantity', 'N/A')}
-        - Expiry Date: {food_donation.get('expiry_date', 'N/A')}
-        - Location: {food_donation.get('location', {}).get('address', 'N/A')}
-        - Special Requirements: {food_donation.get('special_requirements', 'None')}
+        Pass `ranked` from `rank_recipients` to skip ranking again.
+        """
+        ranked, candidates, prompt = self._match_prompt(food_donation, recipients, ranked)
+        if prompt is None:
+            return self._ranked_match(ranked)
         
-        Potential Recipients:
-        {json.dumps(recipients, indent=2)}
+        try:
+            result = self._invoke("match_surplus_food", prompt)
+        except Exception as e:
+            logger.error(f"Error matching surplus food: {str(e)}")
+            return self.ranker.as_match(ranked[0])
+        return self._match_result(ranked, candidates, result)
+    
+    async def amatch_surplus_food(self, food_donation: Dict[str, Any], recipients: List[Dict[str, Any]],
+                                  ranked: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        ranked, candidates, prompt = self._match_prompt(food_donation, recipients, ranked)
+        if prompt is None:
+            return self._ranked_match(ranked)
         
-        Please select the best match and provide a justification for your choice.
-        """
+        try:
+            result = await self._ainvoke("match_surplus_food", prompt)
+        except Exception as e:
+            logger.error(f"Error matching surplus food: {str(e)}")
+            return self.ranker.as_match(ranked[0])
+        return self._match_result(ranked, candidates, result)
+    
+    def _match_prompt(self, food_donation: Dict[str, Any], recipients: List[Dict[str, Any]],
+                      ranked: Optional[List[Dict[str, Any]]] = None):
+        """Rank recipients; the prompt is None when the ranking alone decides the match."""
+        if ranked is None:
+            ranked = self.ranker.rank(food_donation, recipients)
+        if not ranked or self.ranker.is_decisive(ranked):
+            return ranked, {}, None
         
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
+        candidates = {str(c["recipient"].get("_id")): c for c in ranked}
+        candidate_rows = [
+            {
+                "recipient_id": recipient_id,
+                "name": c["recipient"].get("name", "N/A"),
+                "score": c["score"],
+                "distance_km": c["distance_km"],
+                "capacity": c["recipient"].get("capacity", c["recipient"].get("capacity_kg", "N/A")),
+                "needs": c["recipient"].get("needs", c["recipient"].get("food_types", "N/A"))
+            }
+            for recipient_id, c in candidates.items()
         ]
+        return ranked, candidates, match_prompt(food_donation, candidate_rows)
+    
+    def _ranked_match(self, ranked: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not ranked:
+            return {"error": "No recipients available"}
+        return self.ranker.as_match(ranked[0])
+    
+    def _match_result(self, ranked: List[Dict[str, Any]], candidates: Dict[str, Any], result: Any) -> Dict[str, Any]:
+        chosen = candidates.get(str(result.get("recipient_id"))) if isinstance(result, dict) else None
+        if not chosen:
+            logger.warning("LLM match did not name a ranked candidate, using top-ranked recipient")
+            return self.ranker.as_match(ranked[0])
         
-        response = self.llm.invoke(messages)
-        return json.loads(response.content)
+        return self.ranker.as_match(chosen, justification=result.get("justification"), method="llm")
     
     def create_waste_exchange(self, waste_material: Dict[str, Any], potential_users: List[Dict[str, Any]]) -> Dict[str, Any]:
-        system_prompt = """You are an AI that facilitates waste exchange between businesses. Analyze the waste material 
-        and match it with businesses that can repurpose it. Provide details on how the waste can be transformed 
-        and used by the receiving business."""
-        
-        user_prompt = f"""
-        Waste Material Details:
-        - Type: {waste_material.get('type', 'N/A')}
-        - Quantity: {waste_material.get('quantity', 'N/A')}
-        - Composition: {waste_material.get('composition', 'N/A')}
-        - Location: {waste_material.get('location', {}).get('address', 'N/A')}
+        prompt = waste_exchange_prompt(waste_material, potential_users)
         
-        Potential Users:
-        {json.dumps(potential_users, indent=2)}
-        
-        Please select the best match and explain how the waste can be repurposed.
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        try:
+            result = self._invoke("create_waste_exchange", prompt)
+        except Exception as e:
+            logger.error(f"Error creating waste exchange: {str(e)}")
+            return self._heuristic_waste_match(waste_material, potential_users)
+        return self._waste_result(waste_material, potential_users, result)
+    
+    async def acreate_waste_exchange(self, waste_material: Dict[str, Any], potential_users: List[Dict[str, Any]]) -> Dict[str, Any]:
+        prompt = waste_exchange_prompt(waste_material, potential_users)
         
-        response = self.llm.invoke(messages)
-        return json.loads(response.content)
+        try:
+            result = await self._ainvoke("create_waste_exchange", prompt)
+        except Exception as e:
+            logger.error(f"Error creating waste exchange: {str(e)}")
+            return self._heuristic_waste_match(waste_material, potential_users)
+        return self._waste_result(waste_material, potential_users, result)
+    
+    def _waste_result(self, waste_material: Dict[str, Any], potential_users: List[Dict[str, Any]], result: Any) -> Dict[str, Any]:
+        if not isinstance(result, dict) or not result.get("user_id"):
+            logger.warning("LLM waste match did not name a user, using heuristic match")
+            return self._heuristic_waste_match(waste_material, potential_users)
+        return result
+    
+    def _heuristic_waste_match(self, waste_material: Dict[str, Any], potential_users: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fallback when the LLM is unavailable: first user who declares this waste type."""
+        waste_type = str(waste_material.get("type", "")).lower()
+        for user in potential_users:
+            if waste_type in [str(t).lower() for t in user.get("waste_types", [])]:
+                return {
+                    "user_id": user.get("user_id", user.get("_id")),
+                    "justification": f"Accepts {waste_material.get('type')} (AI matching unavailable).",
+                    "method": "heuristic"
+                }
+        return {"error": "AI matching unavailable and no user declares this waste type"}
 
     def generate_meal_plan(self, user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate a personalized meal plan based on user profile and local produce."""
         try:
-            system_prompt = """You are a nutritionist AI that creates personalized meal plans. Generate a 7-day meal plan 
-            with breakfast, lunch, and dinner options that match the user's preferences and use locally available produce.
-            
-            Respond in valid JSON format with this structure:
-            {
-              "days": {
-                "Monday": {
-                  "breakfast": {
-                    "name": "...",
-                    "description": "...",
-                    "ingredients": ["...", "..."],
-                    "nutrition": {
-                      "calories": ...,
-                      "protein": ...,
-                      "carbs": ...,
-                      "fat": ...
-                    }
-                  },
-                  "lunch": {...},
-                  "dinner": {...}
-                },
-                // ... other days
-              },
-              "shopping_list": ["...", "..."],
-              "nutritional_summary": {
-                "weekly_calories": ...,
-                "weekly_protein": ...,
-                // ... other metrics
-              }
-            }
-            """
-            
-            user_prompt = f"""
-            User Profile:
-            - Age: {user_profile.get('age', 'N/A')}
-            - Gender: {user_profile.get('gender', 'N/A')}
-            - Dietary Preferences: {', '.join(user_profile.get('dietary_preferences', []))}
-            - Allergies: {', '.join(user_profile.get('allergies', []))}
-            - Health Goals: {', '.join(user_profile.get('health_goals', []))}
-            - Activity Level: {user_profile.get('activity_level', 'moderate')}
-            
-            Available Local Produce:
-            {json.dumps(local_produce, indent=2, cls=JSONEncoder) if local_produce else "None available"}
-            
-            Create a detailed meal plan that:
-            1. Matches the user's dietary needs and goals
-            2. Uses locally available ingredients when possible
-            3. Provides balanced nutrition
-            4. Includes a shopping list
-            5. Provides nutritional information for each meal
-            """
+            prompt = meal_plan_prompt(user_profile, local_produce)
+            return self._meal_plan_result(self._invoke("generate_meal_plan", prompt, stream=True))
+        except Exception as e:
+            return self._meal_plan_error(e)
+    
+    async def agenerate_meal_plan(self, user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            prompt = meal_plan_prompt(user_profile, local_produce)
+            return self._meal_plan_result(await self._ainvoke("generate_meal_plan", prompt, stream=True))
+        except Exception as e:
+            return self._meal_plan_error(e)
+    
+    def _meal_plan_result(self, processed_response: Any) -> Dict[str, Any]:
+        if isinstance(processed_response, dict) and "error" in processed_response:
+            raise Exception(processed_response["details"])
+        return processed_response
+    
+    def _meal_plan_error(self, e: Exception) -> Dict[str, Any]:
+        logger.error(f"Error generating meal plan: {str(e)}")
+        return {
+            "error": "Failed to generate meal plan",
+            "details": str(e)
+        }
+    
+    def regenerate_meal_plan_part(self, user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]],
+                                  meal_plan: Dict[str, Any], day: str, meal: Optional[str] = None) -> Dict[str, Any]:
+        """Regenerate a single day (all meals) or a single meal of an existing plan.
+        
+        Returns the new day or meal only; use `merge_meal_plan_part` to apply it.
+        """
+        try:
+            days = meal_plan.get("days", meal_plan.get("week", {}))
+            if day not in days:
+                raise ValueError(f"Day not in meal plan: {day}")
             
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
+            prompt = meal_plan_part_prompt(user_profile, local_produce, days, day, meal)
+            part = self._invoke("regenerate_meal_plan_part", prompt)
             
-            response = self.llm.invoke(messages)
-            processed_response = self._process_llm_response(response)
+            if not isinstance(part, dict) or "error" in part or set(part) == {"response"}:
+                raise ValueError("Could not parse regenerated meal plan")
+            if meal is None and not any(slot in part for slot in ("breakfast", "lunch", "dinner")):
+                raise ValueError("Regenerated day has no meals")
+            return part
+        
+        except Exception as e:
+            logger.error(f"Error regenerating meal plan: {str(e)}")
+            return {
+                "error": "Failed to regenerate meal plan",
+                "details": str(e)
+            }
+    
+    @staticmethod
+    def merge_meal_plan_part(meal_plan: Dict[str, Any], day: str, meal: Optional[str], part: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Return (plan with the part merged in, Mongo $set path -> value) for persisting."""
+        days_key = "days" if "days" in meal_plan else "week"
+        days = dict(meal_plan.get(days_key, {}))
+        if meal:
+            days[day] = {**days.get(day, {}), meal: part}
+            updates = {f"plan.{days_key}.{day}.{meal}": part}
+        else:
+            days[day] = {**days.get(day, {}), **part}
+            updates = {f"plan.{days_key}.{day}": days[day]}
+        return {**meal_plan, days_key: days}, updates
+    
+    def personalize_meal_plan(self, user_profile: Dict[str, Any], meal_plan: Dict[str, Any],
+                              segment_profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a cheap per-user delta to a pre-generated segment plan and return the merged plan."""
+        try:
+            days = meal_plan.get("days", meal_plan.get("week", {}))
+            prompt = meal_plan_personalize_prompt(user_profile, segment_profile, days)
+            delta = self._invoke("personalize_meal_plan", prompt)
             
-            if isinstance(processed_response, dict) and "error" in processed_response:
-                raise Exception(processed_response["details"])
-                
-            return processed_response
+            if not isinstance(delta, dict) or "error" in delta or not isinstance(delta.get("days", {}), dict):
+                raise ValueError("Could not parse meal plan changes")
             
+            for day, meals in delta.get("days", {}).items():
+                if day not in days or not isinstance(meals, dict):
+                    continue
+                for meal, details in meals.items():
+                    if isinstance(details, dict):
+                        meal_plan, _ = self.merge_meal_plan_part(meal_plan, day, meal, details)
+            return meal_plan
+        
         except Exception as e:
-            logger.error(f"Error generating meal plan: {str(e)}")
+            logger.error(f"Error personalizing meal plan: {str(e)}")
             return {
-                "error": "Failed to generate meal plan",
+                "error": "Failed to personalize meal plan",
                 "details": str(e)
             }
+    
+    def calculate_nutritional_impact(self, food_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Nutritional totals for rescued food, computed locally from the nutrient table (no LLM call)."""
+        try:
+            return self.nutrition.calculate(food_items)
+        except Exception as e:
+            logger.error(f"Error calculating nutritional impact: {str(e)}")
+            return {
+                "error": "Failed to calculate nutritional impact",
+                "details": str(e)
+            }
+    
     def predict_hunger_hotspots(self, historical_data: List[Dict[str, Any]], current_data: Dict[str, Any]) -> Dict[str, Any]:
-        system_prompt = """You are an AI that predicts areas at risk of food insecurity. Analyze the historical data 
-        and current conditions to identify potential hunger hotspots. Consider factors like food supply, demand, 
-        economic conditions, and seasonal patterns."""
-        
-        user_prompt = f"""
-        Historical Data:
-        {json.dumps(historical_data, indent=2)}
-        
-        Current Conditions:
-        {json.dumps(current_data, indent=2)}
-        
-        Please identify potential hunger hotspots and predict the severity of food insecurity in each area.
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        prompt = hotspots_prompt(historical_data, current_data)
         
-        response = self.llm.invoke(messages)
-        return json.loads(response.content)
+        try:
+            result = self._invoke("predict_hunger_hotspots", prompt)
+            if not isinstance(result, dict) or "hotspots" not in result:
+                raise ValueError("Response did not contain hotspots")
+            return result
+        except Exception as e:
+            logger.error(f"Error predicting hunger hotspots: {str(e)}")
+            return {"hotspots": [], "error": "Hotspot prediction unavailable", "details": str(e)}
 
 @st.cache_resource
 def get_ai_agents():
@@ -12,6 +12,10 @@ class Config:
             "waste_materials": "waste_materials",
             "waste_users": "waste_users",
             "meal_plans": "meal_plans",
+            "meal_plan_segments": "meal_plan_segments",
+            "ai_jobs": "ai_jobs",
+            "notifications": "notifications",
+            "rate_limits": "rate_limits",
             "local_produce": "local_produce",
             "nutritional_impact": "nutritional_impact",
             "social_impact": "social_impact",
@@ -19,6 +23,8 @@ class Config:
             "micro_donations": "micro_donations",
             "local_champions": "local_champions",
             "delivery_partners": "delivery_partners",
+            "partner_presence": "partner_presence",
+            "partner_locations": "partner_locations",
             "delivery_logs": "delivery_logs"
         }
         self.roles = [
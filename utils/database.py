@@ -1,4 +1,7 @@
+import argparse
+import logging
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
 import streamlit as st
 import os
@@ -11,6 +14,8 @@ from utils.config import get_secret
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Database:
     def __init__(self):
         try:
@@ -36,8 +41,13 @@ class Database:
             st.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
 
-    def _initialize_collections(self):
-        """Ensure all required collections exist with indexes"""
+    def _initialize_collections(self, rebuild: bool = False):
+        """Ensure all required collections exist with indexes.
+        
+        An existing index whose options differ from the definition here (e.g. one made
+        unique later) is kept and reported unless `rebuild` is set; rebuilding drops it,
+        so it is left to `python -m utils.database --rebuild-indexes`.
+        """
         collections = {
             "users": [
                 ("email", 1),  
@@ -94,12 +104,34 @@ class Database:
             ],
             "notifications": [
                 ("user_id", 1),
-                ("created_at", -1)
+                ("created_at", -1),
+                ("status", 1),
+                ("available_at", 1),
+                ("to", 1),
+                ("priority", 1),
+                # One document per Twilio sid; messages not yet sent have none.
+                ("sid", 1, {"unique": True, "partialFilterExpression": {"sid": {"$type": "string"}}}),
+                ("delivery_status", 1),
+                # Matches the outbox claim: status and priority filter, sorted by priority then available_at.
+                ([("status", 1), ("priority", 1), ("available_at", 1)],)
+            ],
+            # Shared send-rate counters, one per window; expired windows are removed.
+            "rate_limits": [
+                ("expires_at", 1, {"expireAfterSeconds": 0})
             ],
             "meal_plans": [
                 ("user_id", 1),
                 ("created_at", -1)
             ],
+            "meal_plan_segments": [
+                ("segment_key", 1),
+                ("produce_fingerprint", 1)
+            ],
+            "ai_jobs": [
+                ("input_hash", 1),
+                ("status", 1),
+                ("created_at", 1)
+            ],
             "local_produce": [
                 ("name", "text"),
                 ("supplier", 1)
@@ -107,14 +139,55 @@ class Database:
             "orders": [
                 ("user_id", 1),
                 ("created_at", -1)
+            ],
+            "delivery_partners": [
+                ("available", 1),
+                ("updated_at", -1)
+            ],
+            # Presence documents disappear once their expires_at passes.
+            "partner_presence": [
+                ("expires_at", 1, {"expireAfterSeconds": 0})
+            ],
+            "partner_locations": [
+                ("partner_id", 1),
+                ("hour", -1)
             ]
         }
         
+        existing = set(self.db.list_collection_names())
         for collection_name, indexes in collections.items():
-            if collection_name not in self.db.list_collection_names():
+            if collection_name not in existing:
                 self.db.create_collection(collection_name)
-                for index in indexes:
-                    self.db[collection_name].create_index([index])
+            # create_index is a no-op for indexes that already exist, so indexes added
+            # later are also built on collections from older deployments.
+            for index in indexes:
+                if isinstance(index[0], list):
+                    keys, options = index[0], (index[1] if len(index) > 1 else {})
+                else:
+                    keys, options = [index[:2]], (index[2] if len(index) > 2 else {})
+                try:
+                    self.db[collection_name].create_index(keys, **options)
+                except OperationFailure as e:
+                    # 85/86: an index on these keys exists with other options, e.g. from
+                    # before it was made unique.
+                    if e.code in (85, 86) and rebuild:
+                        self._rebuild_index(collection_name, keys, options)
+                    elif e.code in (85, 86):
+                        logger.warning(f"Index {keys} on {collection_name} differs from its definition; "
+                                       f"run `python -m utils.database --rebuild-indexes` to update it")
+                    else:
+                        logger.warning(f"Could not create index {keys} on {collection_name}: {str(e)}")
+
+    def _rebuild_index(self, collection_name: str, keys: List[tuple], options: Dict[str, Any]):
+        logger.info(f"Rebuilding index {keys} on {collection_name}")
+        collection = self.db[collection_name]
+        collection.drop_index(keys)
+        try:
+            collection.create_index(keys, **options)
+        except OperationFailure as e:
+            # E.g. duplicates block a unique index; keep the plain index until they are cleaned up.
+            collection.create_index(keys)
+            logger.warning(f"Could not rebuild index {keys} on {collection_name}, kept a plain one: {str(e)}")
 
     def get_collection(self, collection_name: str):
         return self.db[collection_name]
@@ -151,4 +224,19 @@ class Database:
 
 @st.cache_resource
 def get_db():
-    return Database()
\ No newline at end of file
+    return Database()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the app's collections and indexes")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="Drop and recreate indexes whose options changed; run once, with the app stopped")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    db = Database()
+    if args.rebuild_indexes:
+        db._initialize_collections(rebuild=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import streamlit as st
 from utils.database import get_db
 from utils.notifications import get_notifications
 from utils.config import get_config
+from utils.geo import extract_coordinates
+from utils.route_planner import RoutePlanner, donation_job, partner_capacity_kg
 import time
 
 class DeliveryPartner:
@@ -11,6 +13,7 @@ class DeliveryPartner:
         self.db = get_db()
         self.notify = get_notifications()
         self.config = get_config()
+        self.planner = RoutePlanner()
         
     def get_available_deliveries(self):
         """Get all deliveries that need pickup"""
@@ -28,6 +31,31 @@ class DeliveryPartner:
             100
         )
     
+    def plan_route(self, partner_id):
+        """Order this partner's on-board drop-offs and the open pickups into one multi-stop route"""
+        partner = (self.db.get_collection(self.config.collections["delivery_partners"]).find_one({"_id": partner_id})
+                   or self.db.get_collection(self.config.collections["users"]).find_one({"_id": partner_id})
+                   or {})
+        onboard = self.db.find_documents(
+            self.config.collections["food_donations"],
+            {"delivery_partner_id": partner_id, "delivery_status": "pickup_confirmed"},
+            100
+        )
+        available = self.get_available_deliveries()
+        
+        # Matches point at either a recipient organisation or a recipient user.
+        recipient_ids = list({d["recipient_id"] for d in onboard + available if d.get("recipient_id") is not None})
+        recipients = {}
+        for collection in ("users", "recipients"):
+            for recipient in self.db.get_collection(self.config.collections[collection]).find({"_id": {"$in": recipient_ids}}):
+                recipients.setdefault(recipient["_id"], recipient)
+        
+        jobs = [donation_job(d, recipients.get(d.get("recipient_id")), onboard=True) for d in onboard]
+        jobs += [donation_job(d, recipients.get(d.get("recipient_id"))) for d in available]
+        plan = self.planner.plan(extract_coordinates(partner), jobs, partner_capacity_kg(partner))
+        plan["partner_id"] = partner_id
+        return plan
+    
     def confirm_pickup(self, delivery_id, partner_id):
         """Mark a delivery as picked up and notify recipient"""
         delivery = self.db.get_collection(
@@ -39,9 +67,10 @@ class DeliveryPartner:
             return False
             
         
+        # Dispatch offers each donation to several partners; only the first confirmation takes it.
         update_result = self.db.update_document(
             self.config.collections["food_donations"],
-            {"_id": delivery_id},
+            {"_id": delivery_id, "delivery_status": {"$exists": False}},
             {
                 "delivery_partner_id": partner_id,
                 "pickup_time": datetime.now(),
@@ -68,24 +97,15 @@ class DeliveryPartner:
             ).find_one({"_id": delivery["recipient_id"]})
             
             if recipient and "phone" in recipient:
-                message = f"""
-                Delivery Update - Pickup Confirmed
-                
-                Your food donation has been picked up by our delivery partner.
-                
-                Item: {delivery.get('type', 'N/A')}
-                Quantity: {delivery.get('quantity', 'N/A')}
-                
-                Estimated delivery time: 30-60 minutes
-                Delivery Partner Contact: {st.session_state.user_phone}
-                
-                Thank you for using our service!
-                """
-                return self.notify.send_whatsapp_message(
+                return self.notify.send_template(
                     recipient["phone"],
-                    message
+                    "delivery_pickup_confirmed",
+                    {**delivery, "partner_phone": st.session_state.user_phone},
+                    kind="delivery_pickup_confirmed",
+                    priority="urgent"
                 )
             return True
+        st.warning("This pickup has already been taken by another delivery partner")
         return False
     
     def confirm_delivery(self, delivery_id):
@@ -137,36 +157,21 @@ class DeliveryPartner:
             success = True
             
             if recipient and "phone" in recipient:
-                message = f"""
-                Delivery Update - Completed
-                
-                Your food donation has been delivered!
-                
-                Item: {delivery.get('type', 'N/A')}
-                Quantity: {delivery.get('quantity', 'N/A')}
-                Delivery Time: {int(delivery_time)} minutes
-                
-                Thank you for using our service!
-                """
-                success &= self.notify.send_whatsapp_message(
+                success &= self.notify.send_template(
                     recipient["phone"],
-                    message
+                    "delivery_completed_recipient",
+                    {**delivery, "delivery_time": int(delivery_time)},
+                    kind="delivery_delivered",
+                    priority="urgent"
                 )
                 
             if donor and "phone" in donor:
-                message = f"""
-                Delivery Update - Completed
-                
-                Your food donation has been successfully delivered to the recipient!
-                
-                Item: {delivery.get('type', 'N/A')}
-                Quantity: {delivery.get('quantity', 'N/A')}
-                
-                Thank you for your contribution!
-                """
-                success &= self.notify.send_whatsapp_message(
+                success &= self.notify.send_template(
                     donor["phone"],
-                    message
+                    "delivery_completed_donor",
+                    delivery,
+                    kind="delivery_delivered",
+                    priority="urgent"
                 )
                 
             return success
@@ -0,0 +1,273 @@
+import logging
+import math
+import threading
+import time
+import numpy as np
+import streamlit as st
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from utils.database import get_db
+from utils.config import get_config, get_secret
+from utils.geo import extract_coordinates, haversine_km
+from utils.notifications import get_notifications
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.32
+
+
+class PartnerIndex:
+    """In-memory grid of available delivery partners' positions for k-nearest queries.
+
+    Positions are bucketed into square cells of `cell_km` (in latitude degrees), so a
+    location update only moves one id between two cells. A query scans rings of cells
+    outwards from the query's cell and stops once k partners are closer than any cell not
+    yet scanned could be; when the rings would cover more cells than are occupied it
+    measures every partner instead. Safe to update and query from several threads.
+    """
+
+    def __init__(self, cell_km: float = 1.0, initial_capacity: int = 1024):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.lock = threading.RLock()
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.slots: Dict[Any, int] = {}
+        self.free: List[int] = []
+        self.points = np.zeros((initial_capacity, 2))
+        self.ids: List[Any] = [None] * initial_capacity
+        self.cell_of: List[Optional[Tuple[int, int]]] = [None] * initial_capacity
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, partner_id: Any) -> bool:
+        return partner_id in self.slots
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def _allocate(self) -> int:
+        if self.free:
+            return self.free.pop()
+        if self.size == len(self.points):
+            self.points = np.concatenate([self.points, np.zeros_like(self.points)])
+            self.ids.extend([None] * self.size)
+            self.cell_of.extend([None] * self.size)
+        self.size += 1
+        return self.size - 1
+
+    def _unlink(self, slot: int):
+        cell = self.cell_of[slot]
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(slot)
+            if not members:
+                del self.cells[cell]
+
+    def update(self, partner_id: Any, lat: float, lng: float):
+        """Add a partner or move it to a new position."""
+        cell = self._cell(lat, lng)
+        with self.lock:
+            slot = self.slots.get(partner_id)
+            if slot is None:
+                slot = self._allocate()
+                self.slots[partner_id] = slot
+                self.ids[slot] = partner_id
+            elif self.cell_of[slot] != cell:
+                self._unlink(slot)
+            else:
+                self.points[slot] = (lat, lng)
+                return
+            self.points[slot] = (lat, lng)
+            self.cell_of[slot] = cell
+            self.cells.setdefault(cell, set()).add(slot)
+
+    def remove(self, partner_id: Any) -> bool:
+        with self.lock:
+            slot = self.slots.pop(partner_id, None)
+            if slot is None:
+                return False
+            self._unlink(slot)
+            self.ids[slot] = None
+            self.cell_of[slot] = None
+            self.free.append(slot)
+            return True
+
+    def partner_ids(self) -> List[Any]:
+        with self.lock:
+            return list(self.slots)
+
+    def position(self, partner_id: Any) -> Optional[Tuple[float, float]]:
+        with self.lock:
+            slot = self.slots.get(partner_id)
+            return None if slot is None else (float(self.points[slot, 0]), float(self.points[slot, 1]))
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int) -> Iterable[Tuple[int, int]]:
+        if ring == 0:
+            return [(row, col)]
+        cells = [(row + dr, col + dc) for dr in (-ring, ring) for dc in range(-ring, ring + 1)]
+        cells += [(row + dr, col + dc) for dc in (-ring, ring) for dr in range(-ring + 1, ring)]
+        return cells
+
+    def nearest(self, lat: float, lng: float, k: int = 5, max_km: Optional[float] = None,
+                exclude: Iterable[Any] = ()) -> List[Tuple[Any, float]]:
+        """Up to k (partner_id, distance_km) pairs, closest first."""
+        exclude = set(exclude)
+        with self.lock:
+            wanted = min(k, len(self.slots) - sum(1 for e in exclude if e in self.slots))
+            if wanted <= 0:
+                return []
+            row, col = self._cell(lat, lng)
+            slots: List[int] = []
+            distances = np.zeros(0)
+            ring = 0
+            while True:
+                found = [s for cell in self._ring(row, col, ring) for s in self.cells.get(cell, ())
+                         if self.ids[s] not in exclude]
+                if found:
+                    found_points = self.points[found]
+                    slots += found
+                    distances = np.concatenate([distances, haversine_km(lat, lng, found_points[:, 0], found_points[:, 1])])
+                # Everything outside the scanned square is at least this far away; east-west
+                # cells narrow with latitude, so take the cosine at the square's far edge.
+                edge_lat = min(abs(lat) + (ring + 1) * self.cell_deg, 89.9)
+                covered_km = ring * self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                if np.count_nonzero(distances <= covered_km) >= wanted:
+                    break
+                if max_km is not None and covered_km >= max_km:
+                    break
+                # Sparse or far-away partners: measuring everyone beats scanning mostly empty rings.
+                if (2 * ring + 3) ** 2 > 4 * len(self.cells):
+                    slots = [s for s in self.slots.values() if self.ids[s] not in exclude]
+                    found_points = self.points[slots]
+                    distances = haversine_km(lat, lng, found_points[:, 0], found_points[:, 1])
+                    break
+                ring += 1
+
+            order = np.argsort(distances, kind="stable")[:wanted]
+            return [(self.ids[slots[i]], round(float(distances[i]), 3)) for i in order
+                    if max_km is None or distances[i] <= max_km]
+
+
+class DispatchService:
+    """Offers matched donations to the k nearest available delivery partners.
+
+    Available partners and their positions live in a PartnerIndex loaded from
+    `delivery_partners` and kept current through `update_location`. With
+    `refresh_seconds`, the index is reloaded that often so it also follows heartbeats
+    ingested by another process (`python -m utils.presence`). `offer` records the
+    partners on the donation under `dispatch` and sends each of them an urgent WhatsApp
+    with the pickup; whoever confirms the pickup first takes the delivery.
+    """
+
+    def __init__(self, db=None, config=None, index: Optional[PartnerIndex] = None, notifications=None,
+                 k: int = 5, max_km: Optional[float] = 15.0, max_age_seconds: Optional[int] = None,
+                 refresh_seconds: Optional[float] = None):
+        self.db = db or get_db()
+        self.config = config or get_config()
+        self.index = index or PartnerIndex()
+        self.notifications = notifications
+        self.k = k
+        self.max_km = max_km
+        self.max_age_seconds = max_age_seconds
+        self.refresh_seconds = refresh_seconds
+        self.refresh_lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def load_partners(self, max_age_seconds: Optional[int] = None) -> int:
+        """Index every available partner with a known position; returns how many were indexed.
+
+        Only partners whose location was updated within `max_age_seconds` (default: the
+        service's) count. Partners indexed before but no longer available are dropped.
+        """
+        max_age_seconds = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        collection = self.db.get_collection(self.config.collections["delivery_partners"])
+        query: Dict[str, Any] = {"available": True}
+        if max_age_seconds is not None:
+            query["updated_at"] = {"$gte": datetime.now() - timedelta(seconds=max_age_seconds)}
+        loaded = set()
+        for partner in collection.find(query, {"location": 1}):
+            point = extract_coordinates(partner)
+            if point:
+                self.index.update(partner["_id"], *point)
+                loaded.add(partner["_id"])
+        for partner_id in self.index.partner_ids():
+            if partner_id not in loaded:
+                self.index.remove(partner_id)
+        self.loaded_at = time.monotonic()
+        return len(loaded)
+
+    def _refresh(self):
+        if self.refresh_seconds is None:
+            return
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.refresh_seconds:
+            return
+        # One caller reloads; the others keep using the current index meanwhile.
+        if not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.load_partners()
+        except Exception as e:
+            logger.error(f"Reloading delivery partners failed: {str(e)}")
+        finally:
+            self.refresh_lock.release()
+
+    def update_location(self, partner_id: Any, lat: float, lng: float, available: bool = True):
+        if available:
+            self.index.update(partner_id, lat, lng)
+        else:
+            self.index.remove(partner_id)
+
+    def remove_partner(self, partner_id: Any) -> bool:
+        return self.index.remove(partner_id)
+
+    def nearest_partners(self, donation: Dict[str, Any], k: Optional[int] = None,
+                         exclude: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        point = extract_coordinates(donation)
+        if point is None:
+            return []
+        self._refresh()
+        return [{"partner_id": partner_id, "distance_km": distance}
+                for partner_id, distance in self.index.nearest(point[0], point[1], k or self.k, self.max_km, exclude)]
+
+    def offer(self, donation: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Offer a matched donation to the nearest partners; returns who it was offered to."""
+        # Offering again (say, after nobody picked it up) goes to the next-nearest partners.
+        previous = donation.get("dispatch") or {}
+        candidates = self.nearest_partners(donation, exclude=previous.get("offered_to", ()))
+        if not candidates:
+            return []
+
+        self.db.update_document(self.config.collections["food_donations"], {"_id": donation["_id"]}, {"dispatch": {
+            "offered_to": previous.get("offered_to", []) + [c["partner_id"] for c in candidates],
+            "distances_km": previous.get("distances_km", []) + [c["distance_km"] for c in candidates],
+            "offered_at": datetime.now()
+        }})
+
+        users = self.db.get_collection(self.config.collections["users"])
+        phones = {u["_id"]: u.get("phone") for u in users.find(
+            {"_id": {"$in": [c["partner_id"] for c in candidates]}}, {"phone": 1})}
+        fields = {**donation, "address": (donation.get("location") or {}).get("address")}
+        recipients = [(phones[c["partner_id"]], {**fields, "distance_km": c["distance_km"]})
+                      for c in candidates if phones.get(c["partner_id"])]
+        if recipients:
+            try:
+                if self.notifications is None:
+                    self.notifications = get_notifications()
+                self.notifications.send_template_many("delivery_offer", recipients, priority="urgent")
+            except Exception as e:
+                logger.error(f"Notifying partners about donation {donation['_id']} failed: {str(e)}")
+        return candidates
+
+
+@st.cache_resource
+def get_dispatch_service():
+    service = DispatchService(
+        k=int(get_secret("DISPATCH_PARTNERS_PER_OFFER") or 5),
+        max_km=float(get_secret("DISPATCH_MAX_KM") or 15),
+        max_age_seconds=int(get_secret("PARTNER_ONLINE_SECONDS") or 120),
+        refresh_seconds=float(get_secret("DISPATCH_REFRESH_SECONDS") or 15)
+    )
+    service.load_partners()
+    return service
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from utils.prompts import estimate_tokens
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MEALS = ["breakfast", "lunch", "dinner"]
+
+
+def _first_row_id(text: str, header_start: str) -> Optional[str]:
+    """First cell of the first data row after a pipe-separated header line."""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith(header_start) and i + 1 < len(lines) and "|" in lines[i + 1]:
+            return lines[i + 1].split("|")[0]
+    return None
+
+
+def _meal(day: str, meal: str) -> Dict[str, Any]:
+    return {
+        "name": f"{day} {meal.title()}",
+        "description": f"A balanced {meal} using seasonal produce.",
+        "ingredients": ["Spinach", "Lentils", "Brown Rice"],
+        "nutrition": {"calories": 550, "protein": 25, "carbs": 70, "fat": 15}
+    }
+
+
+def default_responder(messages: List[BaseMessage]) -> str:
+    """Produce a plausible JSON answer for each AIAgents prompt."""
+    system = str(messages[0].content) if messages else ""
+    user = str(messages[-1].content) if messages else ""
+
+    if "matches surplus food" in system:
+        return json.dumps({"recipient_id": _first_row_id(user, "recipient_id|"), "justification": "Closest good fit."})
+    if "waste exchange" in system:
+        return json.dumps({"user_id": _first_row_id(user, "_id|"), "justification": "Declares this waste type.",
+                           "repurposing": "Composting"})
+    if "regenerates part" in system:
+        if "(all meals)" in user:
+            return json.dumps({meal: _meal("New", meal) for meal in MEALS})
+        return json.dumps(_meal("New", "meal"))
+    if "personalizes a shared meal plan" in system:
+        return json.dumps({"days": {"Monday": {"breakfast": _meal("Personal", "breakfast")}}})
+    if "nutritionist" in system:
+        return json.dumps({
+            "days": {day: {meal: _meal(day, meal) for meal in MEALS} for day in DAYS},
+            "shopping_list": ["Spinach", "Lentils", "Brown Rice"],
+            "nutritional_summary": {"weekly_calories": 11550, "weekly_protein": 525}
+        })
+    if "food insecurity" in system:
+        return json.dumps({"hotspots": [
+            {"location": "Central", "latitude": 12.97, "longitude": 77.59, "severity": 0.7}
+        ]})
+    return json.dumps({"response": "ok"})
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic local stand-in for ChatGoogleGenerativeAI.
+
+    Latency is `base latency + output tokens / tokens_per_second`, where the base latency
+    is drawn from a constant, uniform or lognormal distribution. A seeded RNG per call
+    makes runs reproducible. `malformed_rate` returns truncated JSON and `error_rate`
+    raises, to exercise parsing and resilience paths.
+    """
+
+    responder: Optional[Callable[[List[BaseMessage]], str]] = None
+    latency_distribution: str = "lognormal"
+    latency_ms: float = 300.0
+    latency_sigma: float = 0.5
+    latency_max_ms: float = 600.0
+    tokens_per_second: float = 200.0
+    malformed_rate: float = 0.0
+    error_rate: float = 0.0
+    stream_chunk_tokens: int = 8
+    seed: int = 0
+    model_name: str = "fake-gemini"
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "seed": self.seed}
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+        prompt = "".join(str(m.content) for m in messages)
+        digest = hashlib.sha256(f"{self.seed}:{call}:{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _base_latency(self, rng: random.Random) -> float:
+        if self.latency_distribution == "constant":
+            ms = self.latency_ms
+        elif self.latency_distribution == "uniform":
+            ms = rng.uniform(self.latency_ms, self.latency_max_ms)
+        else:
+            ms = rng.lognormvariate(0.0, self.latency_sigma) * self.latency_ms
+        return ms / 1000.0
+
+    def _plan(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        """Decide content, timing and failure mode for one call."""
+        rng = self._rng(messages)
+        if rng.random() < self.error_rate:
+            return {"error": RuntimeError("Injected upstream error"), "delay": self._base_latency(rng)}
+
+        content = (self.responder or default_responder)(messages)
+        if rng.random() < self.malformed_rate:
+            content = content[: max(len(content) // 2, 1)]
+
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(content)
+        return {
+            "content": content,
+            "first_token_delay": self._base_latency(rng),
+            "token_delay": 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                      "total_tokens": input_tokens + output_tokens}
+        }
+
+    def _chunks(self, content: str) -> List[str]:
+        size = max(self.stream_chunk_tokens * 4, 1)
+        return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+    def _result(self, plan: Dict[str, Any]) -> ChatResult:
+        message = AIMessage(content=plan["content"], usage_metadata=plan["usage"],
+                            response_metadata={"model_name": self.model_name})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        plan = self._plan(messages)
+        if "error" in plan:
+            time.sleep(plan["delay"])
+            raise plan["error"]
+        time.sleep(plan["first_token_delay"] + plan["usage"]["output_tokens"] * plan["token_delay"])
+        return self._result(plan)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        plan = self._plan(messages)
+        if "error" in plan:
+            await asyncio.sleep(plan["delay"])
+            raise plan["error"]
+        await asyncio.sleep(plan["first_token_delay"] + plan["usage"]["output_tokens"] * plan["token_delay"])
+        return self._result(plan)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        plan = self._plan(messages)
+        if "error" in plan:
+            time.sleep(plan["delay"])
+            raise plan["error"]
+        time.sleep(plan["first_token_delay"])
+        chunks = self._chunks(plan["content"])
+        for i, piece in enumerate(chunks):
+            time.sleep(estimate_tokens(piece) * plan["token_delay"])
+            usage = plan["usage"] if i == len(chunks) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        plan = self._plan(messages)
+        if "error" in plan:
+            await asyncio.sleep(plan["delay"])
+            raise plan["error"]
+        await asyncio.sleep(plan["first_token_delay"])
+        chunks = self._chunks(plan["content"])
+        for i, piece in enumerate(chunks):
+            await asyncio.sleep(estimate_tokens(piece) * plan["token_delay"])
+            usage = plan["usage"] if i == len(chunks) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
@@ -0,0 +1,45 @@
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def extract_coordinates(document: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """Return (lat, lng) from a document's location, or None if it has no usable coordinates.
+
+    Accepts `{"lat": .., "lng": ..}` / `{"latitude": .., "longitude": ..}` directly on the
+    document or under `location`, and GeoJSON points (`{"coordinates": [lng, lat]}`).
+    """
+    if not isinstance(document, dict):
+        return None
+
+    candidates = [document.get("location"), document]
+    for location in candidates:
+        if not isinstance(location, dict):
+            continue
+        try:
+            if "lat" in location and ("lng" in location or "lon" in location):
+                return float(location["lat"]), float(location.get("lng", location.get("lon")))
+            if "latitude" in location and "longitude" in location:
+                return float(location["latitude"]), float(location["longitude"])
+            coordinates = location.get("coordinates")
+            if isinstance(coordinates, (list, tuple)) and len(coordinates) == 2:
+                return float(coordinates[1]), float(coordinates[0])
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized great-circle distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(points: np.ndarray) -> np.ndarray:
+    """Pairwise distance matrix in km for an (n, 2) array of (lat, lng) points."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return haversine_km(points[:, None, 0], points[:, None, 1], points[None, :, 0], points[None, :, 1])
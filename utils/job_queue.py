@@ -0,0 +1,258 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+import streamlit as st
+from bson import ObjectId
+from pymongo import ReturnDocument
+from utils.database import get_db
+from utils.ai_agents import get_ai_agents
+from utils.config import get_config, get_secret
+from utils.telemetry import get_current_page, set_current_page
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Rough wall time of one AI job, used to size the worker pool from the requests-per-minute quota.
+AVERAGE_JOB_SECONDS = 8
+# A job nobody has claimed after this long means no worker is running.
+UNCLAIMED_TIMEOUT_SECONDS = 60
+
+
+def input_hash(kind: str, payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([kind, payload], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _meal_plan(ai, db, config, payload: Dict[str, Any]) -> Dict[str, Any]:
+    plan = ai.generate_meal_plan(payload["user_profile"], payload["local_produce"])
+    if "error" in plan:
+        return plan
+    # Saved here so the plan survives the user leaving the page before the job finishes.
+    meal_plan_id = db.insert_document(config.collections["meal_plans"], {
+        "user_id": payload["user_id"],
+        "plan": plan,
+        "source": "generated",
+        "local_produce_used": bool(payload["local_produce"])
+    })
+    return {"plan": plan, "meal_plan_id": meal_plan_id}
+
+
+def _match_donation(ai, db, config, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return ai.match_surplus_food(payload["donation"], payload["recipients"])
+
+
+def _hunger_hotspots(ai, db, config, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return ai.predict_hunger_hotspots(payload["historical_data"], payload["current_data"])
+
+
+HANDLERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "meal_plan": _meal_plan,
+    "match_donation": _match_donation,
+    "hunger_hotspots": _hunger_hotspots
+}
+
+
+class JobQueue:
+    """Mongo-backed queue for long-running AI work.
+
+    Pages `enqueue` a job and poll `get`; workers (in-process threads started by
+    `get_job_queue`, or `python -m utils.job_queue`) claim jobs atomically, run the
+    registered handler and store the result. Jobs with the
+    same kind and payload are deduplicated while active and reused for `dedup_ttl` seconds
+    after completing.
+    """
+
+    def __init__(self, db=None, config=None, lease_seconds: int = 300):
+        self.db = db or get_db()
+        self.config = config or get_config()
+        self.collection = self.db.get_collection(self.config.collections["ai_jobs"])
+        self.lease_seconds = lease_seconds
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], user_id: Any = None,
+                max_attempts: int = 3, dedup_ttl: int = 3600, page: Optional[str] = None) -> str:
+        """Queue a job and return its id; `page` (default: the calling page) tags its AI usage."""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        digest = input_hash(kind, payload)
+        recent = self.collection.find_one(
+            {"input_hash": digest, "status": DONE, "finished_at": {"$gte": datetime.now() - timedelta(seconds=dedup_ttl)}},
+            {"_id": 1}, sort=[("finished_at", -1)]
+        )
+        if recent:
+            return str(recent["_id"])
+
+        now = datetime.now()
+        job = self.collection.find_one_and_update(
+            {"input_hash": digest, "status": {"$in": [PENDING, RUNNING]}},
+            {"$setOnInsert": {
+                "kind": kind,
+                "payload": payload,
+                "user_id": user_id,
+                "page": page or get_current_page(),
+                "status": PENDING,
+                "attempts": 0,
+                "max_attempts": max_attempts,
+                "created_at": now,
+                "available_at": now
+            }},
+            upsert=True, projection={"_id": 1}, return_document=ReturnDocument.AFTER
+        )
+        return str(job["_id"])
+
+    def get(self, job_id: Any) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": ObjectId(job_id) if ObjectId.is_valid(str(job_id)) else job_id},
+                                        {"payload": 0})
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job, including running jobs whose lease expired.
+
+        A job whose lease expired on its last attempt (its worker crashed or hung) is not
+        taken again; `expire_abandoned` marks it failed.
+        """
+        now = datetime.now()
+        query: Dict[str, Any] = {"$or": [
+            {"status": PENDING, "available_at": {"$lte": now}},
+            {"status": RUNNING, "lease_expires_at": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}}
+        ]}
+        if kinds:
+            query["kind"] = {"$in": kinds}
+        return self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": RUNNING, "worker_id": worker_id, "started_at": now,
+                      "lease_expires_at": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)], return_document=ReturnDocument.AFTER
+        )
+
+    def expire_abandoned(self) -> int:
+        """Fail running jobs whose lease expired with no attempts left; returns how many."""
+        now = datetime.now()
+        return self.collection.update_many(
+            {"status": RUNNING, "lease_expires_at": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": FAILED, "error": "Worker stopped responding", "finished_at": now}}
+        ).modified_count
+
+    def unclaimed(self, job: Dict[str, Any], timeout: int = UNCLAIMED_TIMEOUT_SECONDS) -> bool:
+        """True when a job has waited `timeout` seconds without any worker picking it up."""
+        return (job["status"] == PENDING and not job.get("attempts")
+                and job.get("created_at", datetime.now()) < datetime.now() - timedelta(seconds=timeout))
+
+    def complete(self, job: Dict[str, Any], result: Dict[str, Any]):
+        self.collection.update_one({"_id": job["_id"], "worker_id": job["worker_id"]}, {"$set": {
+            "status": DONE, "result": result, "error": None, "finished_at": datetime.now()
+        }})
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Retry with exponential backoff until max_attempts, then mark failed."""
+        retry = job.get("attempts", 1) < job.get("max_attempts", 3)
+        update = {"status": PENDING if retry else FAILED, "error": error}
+        if retry:
+            update["available_at"] = datetime.now() + timedelta(seconds=min(2 ** job.get("attempts", 1), 300))
+        else:
+            update["finished_at"] = datetime.now()
+        self.collection.update_one({"_id": job["_id"], "worker_id": job["worker_id"]}, {"$set": update})
+
+    def run_one(self, job: Dict[str, Any], ai) -> None:
+        set_current_page(job.get("page") or "unknown")
+        try:
+            result = HANDLERS[job["kind"]](ai, self.db, self.config, job["payload"])
+            if isinstance(result, dict) and "error" in result:
+                raise RuntimeError(result.get("details") or result["error"])
+            self.complete(job, result)
+        except Exception as e:
+            logger.error(f"Job {job['_id']} ({job['kind']}) failed: {str(e)}")
+            self.fail(job, str(e))
+
+
+def default_worker_count() -> int:
+    configured = get_secret("AI_WORKER_CONCURRENCY")
+    if configured:
+        return int(configured)
+    requests_per_minute = float(get_secret("GEMINI_REQUESTS_PER_MINUTE") or 15)
+    return max(1, math.ceil(requests_per_minute / 60 * AVERAGE_JOB_SECONDS))
+
+
+def run_worker(workers: Optional[int] = None, kinds: Optional[List[str]] = None, poll_interval: float = 1.0,
+               stop_event: Optional[threading.Event] = None, queue: Optional[JobQueue] = None, ai=None):
+    """Run `workers` threads that claim and process jobs until `stop_event` is set.
+
+    The threads are daemons, so an in-process pool never holds up interpreter exit.
+    """
+    queue = queue or JobQueue()
+    ai = ai or get_ai_agents()
+    stop_event = stop_event or threading.Event()
+    workers = workers or default_worker_count()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop(index: int):
+        worker_id = f"{prefix}:{index}"
+        errors = 0
+        while not stop_event.is_set():
+            try:
+                job = queue.claim(worker_id, kinds)
+                if job is None:
+                    queue.expire_abandoned()
+            except Exception as e:
+                errors += 1
+                logger.error(f"Claiming AI job failed: {str(e)}")
+                stop_event.wait(min(poll_interval * 2 ** errors, 60))
+                continue
+            errors = 0
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            queue.run_one(job, ai)
+
+    logger.info(f"Starting {workers} AI job workers")
+    threads = [threading.Thread(target=loop, args=(index,), name=f"ai-job-{index}", daemon=True)
+               for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def start_background_workers(workers: Optional[int] = None, **kwargs) -> threading.Event:
+    """Process jobs from daemon threads in this process; set the returned event to stop."""
+    stop_event = threading.Event()
+    threading.Thread(target=run_worker, kwargs={"workers": workers, "stop_event": stop_event, **kwargs},
+                     name="ai-jobs", daemon=True).start()
+    return stop_event
+
+
+@st.cache_resource
+def get_job_queue():
+    queue = JobQueue()
+    # Set AI_JOB_INPROCESS_WORKERS=false when `python -m utils.job_queue` runs separately.
+    if str(get_secret("AI_JOB_INPROCESS_WORKERS") or "true").lower() not in ("0", "false", "no"):
+        start_background_workers(queue=queue)
+    return queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued AI jobs")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent jobs (default: sized to the Gemini quota)")
+    parser.add_argument("--kinds", help=f"Comma separated subset of: {', '.join(HANDLERS)}")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    try:
+        run_worker(args.workers, args.kinds.split(",") if args.kinds else None, args.poll_interval, stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()
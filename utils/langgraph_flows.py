@@ -1,25 +1,269 @@
-from langgraph.graph import StateGraph
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableLambda
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Annotated, Awaitable, Callable, Iterable, Iterator, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
 import json
-from utils.ai_agents import get_ai_agents
+import logging
+import threading
+import uuid
+from bson import ObjectId
+from utils.nutrition_engine import get_nutrition_engine
+from utils.config import get_secret
+from utils.tracing import WorkflowTracer, get_workflow_tracer
 import streamlit as st
 
-ai = get_ai_agents()
+logger = logging.getLogger(__name__)
+
+
+def _merge_state(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Node outputs are merged into the shared state instead of replacing it."""
+    return {**current, **(update or {})}
+
+
+WorkflowState = Annotated[dict, _merge_state]
+
+
+def _tag_object_ids(value: Any) -> Any:
+    # Only plain containers are rebuilt; checkpoint internals of other types pass through as they are.
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if type(value) is dict:
+        return {k: _tag_object_ids(v) for k, v in value.items()}
+    if type(value) in (list, tuple):
+        return type(value)(_tag_object_ids(v) for v in value)
+    return value
+
+
+def _untag_object_ids(value: Any) -> Any:
+    if type(value) is dict:
+        if len(value) == 1 and "$oid" in value:
+            return ObjectId(value["$oid"])
+        return {k: _untag_object_ids(v) for k, v in value.items()}
+    if type(value) in (list, tuple):
+        return type(value)(_untag_object_ids(v) for v in value)
+    return value
+
+
+class CheckpointSerializer(JsonPlusSerializer):
+    """JsonPlusSerializer that also round-trips Mongo ObjectIds, stored as {"$oid": hex}.
+
+    Workflow state holds Mongo documents; tagging their ids keeps checkpoints free of
+    pickle, so reading a checkpoint store never executes code from it.
+    """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        return super().dumps_typed(_tag_object_ids(obj))
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        return _untag_object_ids(super().loads_typed(data))
+
+
+def make_checkpointer(kind: str, path: str = "workflow_checkpoints.sqlite"):
+    """Checkpoint saver by name: "memory", "sqlite" or "mongo".
+    
+    SQLite needs `langgraph-checkpoint-sqlite` and Mongo needs `langgraph-checkpoint-mongodb`;
+    both are optional.
+    """
+    serde = CheckpointSerializer()
+    if kind == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver(serde=serde)
+    if kind == "sqlite":
+        import sqlite3
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError:
+            raise ValueError("SQLite checkpointing requires the langgraph-checkpoint-sqlite package")
+        return SqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=serde)
+    if kind == "mongo":
+        from utils.database import get_db
+        try:
+            from langgraph.checkpoint.mongodb import MongoDBSaver
+        except ImportError:
+            raise ValueError("Mongo checkpointing requires the langgraph-checkpoint-mongodb package")
+        db = get_db()
+        return MongoDBSaver(db.client, db_name=db.db.name, serde=serde)
+    raise ValueError(f"Unknown checkpointer: {kind}")
+
+
+def _input_hash(name: str, values: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([name, values], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 
 class LangGraphFlows:
-    def __init__(self):
-        self.workflows = {
-            "meal_planning": self._create_meal_planning_workflow(),
-            "food_redistribution": self._create_food_redistribution_workflow(),
-            "waste_exchange": self._create_waste_exchange_workflow(),
-            "impact_calculation": self._create_impact_calculation_workflow()
-        }
+    """LangGraph workflows, each compiled on first use.
+
+    The AI client is also resolved on first use, so constructing this class (and importing
+    a page that does) costs nothing until a workflow actually runs. Pass `eager=True` to
+    resolve the AI client and compile every workflow up front.
+
+    With a `checkpointer` ("memory", "sqlite", "mongo" or a saver instance), state is saved
+    after every node; re-running with the same `thread_id` resumes a failed run from the
+    last good node and returns a finished run's result without running it again. With
+    `memoize=True`, nodes that are pure functions of their inputs (the LLM matching and
+    planning steps, impact calculations) reuse results for identical inputs. With a
+    `tracer`, every run and node is recorded as a span.
+
+    Runs of `food_redistribution` with `"notify": True` in their input send the WhatsApp
+    match notifications from the `notify_parties` node, so a failed send is retried by
+    resuming the run rather than by matching again.
+    """
+
+    WORKFLOWS = {
+        "meal_planning": "_create_meal_planning_workflow",
+        "food_redistribution": "_create_food_redistribution_workflow",
+        "waste_exchange": "_create_waste_exchange_workflow",
+        "impact_calculation": "_create_impact_calculation_workflow"
+    }
+
+    def __init__(self, ai=None, eager: bool = False, ai_factory: Optional[Callable[[], Any]] = None,
+                 checkpointer: Any = None, memoize: bool = False, memo_size: int = 512,
+                 tracer: Optional[WorkflowTracer] = None, notifications=None):
+        self._ai = ai
+        self._ai_factory = ai_factory
+        self._notifications = notifications
+        self.checkpointer = make_checkpointer(checkpointer) if isinstance(checkpointer, str) else checkpointer
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.tracer = tracer
+        self._compiled: Dict[str, Any] = {}
+        self._ai_lock = threading.Lock()
+        self._compile_lock = threading.Lock()
+        if eager:
+            self.get_ai()
+            for name in self.WORKFLOWS:
+                self.get_workflow(name)
+
+    @property
+    def ai(self):
+        return self.get_ai()
+
+    def get_ai(self):
+        """AI agents, created on first call.
+
+        Nodes call this rather than reading `self.ai`: LangGraph resolves attribute chains
+        referenced by node functions while compiling, which would create the client early.
+        """
+        if self._ai is None:
+            with self._ai_lock:
+                if self._ai is None:
+                    if self._ai_factory is None:
+                        # Imported here so that importing this module does not load the Gemini client library.
+                        from utils.ai_agents import get_ai_agents
+                        self._ai_factory = get_ai_agents
+                    self._ai = self._ai_factory()
+        return self._ai
+
+    def get_notifications(self):
+        if self._notifications is None:
+            from utils.notifications import get_notifications
+            self._notifications = get_notifications()
+        return self._notifications
+
+    def _node(self, name: str, func: Callable[[Dict[str, Any]], Dict[str, Any]],
+              afunc: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None,
+              memo_keys: Optional[Tuple[str, ...]] = None, reads: Optional[Tuple[str, ...]] = None):
+        """Wrap a node so it runs under both invoke and ainvoke; the hook for per-node behaviour.
+        
+        `memo_keys` marks the node as pure: its output depends only on those state keys.
+        `reads` names the state keys the node uses (default `memo_keys`); tracing records their size as the node's input.
+        """
+        if self.memoize and memo_keys:
+            func, afunc = self._memoized(name, func, afunc, memo_keys)
+        if self.tracer is not None:
+            func, afunc = self._traced(name, func, afunc, reads if reads is not None else memo_keys)
+        return RunnableLambda(func, afunc=afunc, name=name)
+    
+    def _memoized(self, name: str, func: Callable, afunc: Optional[Callable], memo_keys: Tuple[str, ...]):
+        def memoized(state: Dict[str, Any]) -> Dict[str, Any]:
+            key = _input_hash(name, {k: state.get(k) for k in memo_keys})
+            result = self._memo_get(key)
+            if result is None:
+                result = self._memo_put(key, func(state))
+            return result
+        
+        async def amemoized(state: Dict[str, Any]) -> Dict[str, Any]:
+            key = _input_hash(name, {k: state.get(k) for k in memo_keys})
+            result = self._memo_get(key)
+            if result is None:
+                result = self._memo_put(key, await afunc(state))
+            return result
+        
+        return memoized, amemoized if afunc else None
+    
+    def _traced(self, name: str, func: Callable, afunc: Optional[Callable], reads: Optional[Tuple[str, ...]]):
+        # Run metadata (workflow, trace and parent span) is set by `_run_config` and reaches nodes via config.
+        # A node's input is the part of the state it reads; without `reads`, the whole state.
+        def start(state: Dict[str, Any], config: Dict[str, Any]):
+            metadata = config.get("metadata", {})
+            input_value = None
+            if self.tracer.record_sizes:
+                input_value = {k: state.get(k) for k in reads} if reads is not None else dict(state)
+            return self.tracer.start(metadata.get("workflow", "unknown"), name,
+                                     metadata.get("trace_id") or self.tracer.new_trace_id(),
+                                     metadata.get("parent_span_id"), input_value=input_value)
+        
+        def traced(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+            span = start(state, config)
+            try:
+                result = func(state)
+            except Exception as e:
+                span.finish(error=e)
+                raise
+            span.finish(result)
+            return result
+        
+        async def atraced(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+            span = start(state, config)
+            try:
+                result = await afunc(state)
+            except Exception as e:
+                span.finish(error=e)
+                raise
+            span.finish(result)
+            return result
+        
+        return traced, atraced if afunc else None
+    
+    def _memo_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._memo_lock:
+            result = self._memo.get(key)
+            if result is not None:
+                self._memo.move_to_end(key)
+            return result
+    
+    def _memo_put(self, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # Failed steps are not remembered, so a retry calls the model again.
+        if any(isinstance(v, dict) and "error" in v for v in result.values()):
+            return result
+        with self._memo_lock:
+            self._memo[key] = result
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+    
+    def get_workflow(self, workflow_name: str):
+        """Compiled workflow by name; compiled once, thread-safe."""
+        if workflow_name not in self.WORKFLOWS:
+            raise ValueError(f"Unknown workflow: {workflow_name}")
+        workflow = self._compiled.get(workflow_name)
+        if workflow is None:
+            with self._compile_lock:
+                workflow = self._compiled.get(workflow_name)
+                if workflow is None:
+                    workflow = getattr(self, self.WORKFLOWS[workflow_name])()
+                    self._compiled[workflow_name] = workflow
+        return workflow
     
     def _create_meal_planning_workflow(self):
-        workflow = StateGraph(dict)  
+        workflow = StateGraph(WorkflowState)
         
    
         def get_user_profile(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -31,31 +275,36 @@ class LangGraphFlows:
         def generate_meal_plan(state: Dict[str, Any]) -> Dict[str, Any]:
             user_profile = state["user_profile"]
             local_produce = state["local_produce"]
-            meal_plan = ai.generate_meal_plan(user_profile, local_produce)
+            meal_plan = self.get_ai().generate_meal_plan(user_profile, local_produce)
+            return {"meal_plan": meal_plan}
+        
+        async def agenerate_meal_plan(state: Dict[str, Any]) -> Dict[str, Any]:
+            meal_plan = await self.get_ai().agenerate_meal_plan(state["user_profile"], state["local_produce"])
             return {"meal_plan": meal_plan}
         
         def format_output(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"output": state["meal_plan"]}
         
         
-        workflow.add_node("get_user_profile", get_user_profile)
-        workflow.add_node("get_local_produce", get_local_produce)
-        workflow.add_node("generate_meal_plan", generate_meal_plan)
-        workflow.add_node("format_output", format_output)
+        workflow.add_node("get_user_profile", self._node("get_user_profile", get_user_profile,
+                                                         reads=("user_profile",)))
+        workflow.add_node("get_local_produce", self._node("get_local_produce", get_local_produce,
+                                                          reads=("local_produce",)))
+        workflow.add_node("generate_meal_plan", self._node("generate_meal_plan", generate_meal_plan, agenerate_meal_plan,
+                                                           memo_keys=("user_profile", "local_produce")))
+        workflow.add_node("format_output", self._node("format_output", format_output, reads=("meal_plan",)))
         
        
-        workflow.add_edge("get_user_profile", "generate_meal_plan")
-        workflow.add_edge("get_local_produce", "generate_meal_plan")
+        workflow.add_edge(START, "get_user_profile")
+        workflow.add_edge(START, "get_local_produce")
+        workflow.add_edge(["get_user_profile", "get_local_produce"], "generate_meal_plan")
         workflow.add_edge("generate_meal_plan", "format_output")
+        workflow.add_edge("format_output", END)
         
-      
-        workflow.set_entry_point("get_user_profile")
-        workflow.set_finish_point("format_output")
-        
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
     def _create_food_redistribution_workflow(self):
-        workflow = StateGraph(dict)  
+        workflow = StateGraph(WorkflowState)
         
         def analyze_donation(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"donation": state["donation"]}
@@ -63,31 +312,55 @@ class LangGraphFlows:
         def get_recipients(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"recipients": state["recipients"]}
         
+        def rank_recipients(state: Dict[str, Any]) -> Dict[str, Any]:
+            return {"ranked": self.get_ai().rank_recipients(state["donation"], state["recipients"])}
+        
         def match_donation(state: Dict[str, Any]) -> Dict[str, Any]:
             donation = state["donation"]
             recipients = state["recipients"]
-            match = ai.match_surplus_food(donation, recipients)
+            match = self.get_ai().match_surplus_food(donation, recipients, state.get("ranked"))
+            return {"match": match}
+        
+        async def amatch_donation(state: Dict[str, Any]) -> Dict[str, Any]:
+            match = await self.get_ai().amatch_surplus_food(state["donation"], state["recipients"], state.get("ranked"))
             return {"match": match}
         
         def notify_parties(state: Dict[str, Any]) -> Dict[str, Any]:
+            if not state.get("notify"):
+                return {"notification_sent": False}
+            recipient_id = (state.get("match") or {}).get("recipient_id")
+            recipient = next((r for r in state["recipients"] if r.get("_id") == recipient_id), None)
+            if recipient is None:
+                return {"notification_sent": False}
+            # Raising leaves the run checkpointed after match_donation; a retry resumes here.
+            if not self.get_notifications().notify_food_match(
+                    donor_phone=state["donation"].get("donor_phone", ""),
+                    recipient_phone=recipient.get("phone", ""),
+                    food_details=state["donation"]):
+                raise RuntimeError("Sending the match notifications failed")
             return {"notification_sent": True}
         
-        workflow.add_node("analyze_donation", analyze_donation)
-        workflow.add_node("get_recipients", get_recipients)
-        workflow.add_node("match_donation", match_donation)
-        workflow.add_node("notify_parties", notify_parties)
-        
-        workflow.add_edge("analyze_donation", "match_donation")
-        workflow.add_edge("get_recipients", "match_donation")
+        workflow.add_node("analyze_donation", self._node("analyze_donation", analyze_donation, reads=("donation",)))
+        workflow.add_node("get_recipients", self._node("get_recipients", get_recipients, reads=("recipients",)))
+        workflow.add_node("rank_recipients", self._node("rank_recipients", rank_recipients,
+                                                        reads=("donation", "recipients")))
+        workflow.add_node("match_donation", self._node("match_donation", match_donation, amatch_donation,
+                                                       memo_keys=("donation", "recipients"),
+                                                       reads=("donation", "recipients", "ranked")))
+        workflow.add_node("notify_parties", self._node("notify_parties", notify_parties,
+                                                       reads=("notify", "match", "recipients", "donation")))
+        
+        workflow.add_edge(START, "analyze_donation")
+        workflow.add_edge(START, "get_recipients")
+        workflow.add_edge(["analyze_donation", "get_recipients"], "rank_recipients")
+        workflow.add_edge("rank_recipients", "match_donation")
         workflow.add_edge("match_donation", "notify_parties")
+        workflow.add_edge("notify_parties", END)
         
-        workflow.set_entry_point("analyze_donation")
-        workflow.set_finish_point("notify_parties")
-        
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
     def _create_waste_exchange_workflow(self):
-        workflow = StateGraph(dict)  
+        workflow = StateGraph(WorkflowState)
         
         def analyze_waste(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"waste": state["waste"]}
@@ -98,35 +371,43 @@ class LangGraphFlows:
         def match_waste(state: Dict[str, Any]) -> Dict[str, Any]:
             waste = state["waste"]
             users = state["potential_users"]
-            match = ai.create_waste_exchange(waste, users)
+            match = self.get_ai().create_waste_exchange(waste, users)
+            return {"match": match}
+        
+        async def amatch_waste(state: Dict[str, Any]) -> Dict[str, Any]:
+            match = await self.get_ai().acreate_waste_exchange(state["waste"], state["potential_users"])
             return {"match": match}
         
         def notify_parties(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"notification_sent": True}
         
-        workflow.add_node("analyze_waste", analyze_waste)
-        workflow.add_node("get_potential_users", get_potential_users)
-        workflow.add_node("match_waste", match_waste)
-        workflow.add_node("notify_parties", notify_parties)
+        workflow.add_node("analyze_waste", self._node("analyze_waste", analyze_waste, reads=("waste",)))
+        workflow.add_node("get_potential_users", self._node("get_potential_users", get_potential_users,
+                                                            reads=("potential_users",)))
+        workflow.add_node("match_waste", self._node("match_waste", match_waste, amatch_waste,
+                                                    memo_keys=("waste", "potential_users")))
+        workflow.add_node("notify_parties", self._node("notify_parties", notify_parties, reads=()))
         
-        workflow.add_edge("analyze_waste", "match_waste")
-        workflow.add_edge("get_potential_users", "match_waste")
+        workflow.add_edge(START, "analyze_waste")
+        workflow.add_edge(START, "get_potential_users")
+        workflow.add_edge(["analyze_waste", "get_potential_users"], "match_waste")
         workflow.add_edge("match_waste", "notify_parties")
+        workflow.add_edge("notify_parties", END)
         
-        workflow.set_entry_point("analyze_waste")
-        workflow.set_finish_point("notify_parties")
-        
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
     def _create_impact_calculation_workflow(self):
-        workflow = StateGraph(dict)  
+        workflow = StateGraph(WorkflowState)
         
         def get_food_items(state: Dict[str, Any]) -> Dict[str, Any]:
             return {"food_items": state["food_items"]}
         
         def calculate_nutrition(state: Dict[str, Any]) -> Dict[str, Any]:
-            food_items = state["food_items"]
-            nutrition = ai.calculate_nutritional_impact(food_items)
+            # Local computation; the impact page never needs the AI client.
+            try:
+                nutrition = get_nutrition_engine().calculate(state["food_items"])
+            except Exception as e:
+                nutrition = {"error": "Failed to calculate nutritional impact", "details": str(e)}
             return {"nutrition": nutrition}
         
         def calculate_environmental(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -145,28 +426,163 @@ class LangGraphFlows:
                 }
             }
         
-        workflow.add_node("get_food_items", get_food_items)
-        workflow.add_node("calculate_nutrition", calculate_nutrition)
-        workflow.add_node("calculate_environmental", calculate_environmental)
-        workflow.add_node("combine_results", combine_results)
+        workflow.add_node("get_food_items", self._node("get_food_items", get_food_items, reads=("food_items",)))
+        workflow.add_node("calculate_nutrition", self._node("calculate_nutrition", calculate_nutrition,
+                                                            memo_keys=("food_items",)))
+        workflow.add_node("calculate_environmental", self._node("calculate_environmental", calculate_environmental,
+                                                                memo_keys=("food_items",)))
+        workflow.add_node("combine_results", self._node("combine_results", combine_results,
+                                                        reads=("nutrition", "co2_saved", "waste_reduced")))
         
+        workflow.add_edge(START, "get_food_items")
         workflow.add_edge("get_food_items", "calculate_nutrition")
         workflow.add_edge("get_food_items", "calculate_environmental")
-        workflow.add_edge("calculate_nutrition", "combine_results")
-        workflow.add_edge("calculate_environmental", "combine_results")
+        workflow.add_edge(["calculate_nutrition", "calculate_environmental"], "combine_results")
+        workflow.add_edge("combine_results", END)
         
-        workflow.set_entry_point("get_food_items")
-        workflow.set_finish_point("combine_results")
-        
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
-    def run_workflow(self, workflow_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        if workflow_name not in self.workflows:
-            raise ValueError(f"Unknown workflow: {workflow_name}")
-        
-        workflow = self.workflows[workflow_name]
-        return workflow.invoke(input_data)
+    def _thread_config(self, thread_id: Optional[str]) -> Dict[str, Any]:
+        if self.checkpointer is None:
+            return {}
+        return {"configurable": {"thread_id": thread_id or uuid.uuid4().hex}}
+    
+    def _run_config(self, workflow_name: str, thread_id: Optional[str] = None, **extra) -> Dict[str, Any]:
+        config = {**self._thread_config(thread_id), **extra}
+        if self.tracer is not None:
+            config["metadata"] = {"workflow": workflow_name, "trace_id": self.tracer.new_trace_id()}
+        return config
+    
+    def _discard(self, config: Dict[str, Any], thread_id: Optional[str] = None):
+        """Drop the checkpoints of a run nobody can resume because it had no `thread_id`."""
+        if thread_id is None and self.checkpointer is not None:
+            self.forget_run(config["configurable"]["thread_id"])
+    
+    def forget_run(self, thread_id: str):
+        """Delete the checkpoints saved under `thread_id` once its result has been used."""
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
+    
+    @contextmanager
+    def _run_span(self, workflow_name: str, config: Dict[str, Any], input_data: Any):
+        """Root span for one run; node spans started inside it become its children."""
+        if self.tracer is None:
+            yield
+            return
+        metadata = config["metadata"]
+        span = self.tracer.start(workflow_name, workflow_name, metadata["trace_id"], None, input_data, kind="workflow")
+        metadata["parent_span_id"] = span.span_id
+        try:
+            yield
+        except Exception as e:
+            span.finish(error=e)
+            raise
+        span.finish()
+    
+    def run_workflow(self, workflow_name: str, input_data: Dict[str, Any], thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run a workflow; with a checkpointer, `thread_id` names the run so a retry can resume it."""
+        workflow = self.get_workflow(workflow_name)
+        config = self._run_config(workflow_name, thread_id)
+        try:
+            with self._run_span(workflow_name, config, input_data):
+                if thread_id and self.checkpointer is not None:
+                    snapshot = workflow.get_state(config)
+                    if snapshot.next:
+                        logger.info(f"Resuming {workflow_name} run {thread_id} at {snapshot.next}")
+                        return workflow.invoke(None, config)
+                    if snapshot.values:
+                        return snapshot.values
+                return workflow.invoke(input_data, config)
+        finally:
+            self._discard(config, thread_id)
+    
+    async def arun_workflow(self, workflow_name: str, input_data: Dict[str, Any], thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """Async `run_workflow`.
+        
+        Only the LLM nodes await; the other nodes are quick local steps and run inline. The
+        gain is that many runs waiting on the model share one event loop instead of a
+        thread each, not overlap between the branches of one run.
+        """
+        workflow = self.get_workflow(workflow_name)
+        config = self._run_config(workflow_name, thread_id)
+        try:
+            with self._run_span(workflow_name, config, input_data):
+                if thread_id and self.checkpointer is not None:
+                    snapshot = await workflow.aget_state(config)
+                    if snapshot.next:
+                        logger.info(f"Resuming {workflow_name} run {thread_id} at {snapshot.next}")
+                        return await workflow.ainvoke(None, config)
+                    if snapshot.values:
+                        return snapshot.values
+                return await workflow.ainvoke(input_data, config)
+        finally:
+            self._discard(config, thread_id)
+    
+    def stream_workflow(self, workflow_name: str, input_data: Dict[str, Any],
+                        thread_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Run a workflow, yielding an event as each node finishes.
+        
+        Events are {"node", "update", "state"}: the node's output and the state so far.
+        The last event's state is what `run_workflow` would return. A run that already
+        finished under `thread_id` yields a single event with node None.
+        """
+        workflow = self.get_workflow(workflow_name)
+        config = self._run_config(workflow_name, thread_id)
+        try:
+            with self._run_span(workflow_name, config, input_data):
+                state = dict(input_data)
+                if thread_id and self.checkpointer is not None:
+                    snapshot = workflow.get_state(config)
+                    if snapshot.next:
+                        logger.info(f"Resuming {workflow_name} run {thread_id} at {snapshot.next}")
+                        state, input_data = dict(snapshot.values), None
+                    elif snapshot.values:
+                        yield {"node": None, "update": {}, "state": snapshot.values}
+                        return
+                for chunk in workflow.stream(input_data, config, stream_mode="updates"):
+                    for node, update in chunk.items():
+                        state = _merge_state(state, update if isinstance(update, dict) else None)
+                        yield {"node": node, "update": update, "state": state}
+        finally:
+            self._discard(config, thread_id)
+    
+    def iter_workflow_batch(self, workflow_name: str, inputs: Iterable[Dict[str, Any]],
+                            max_concurrency: int = 8) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (input index, result) as runs complete, with at most `max_concurrency` in flight.
+        
+        A run that raises yields an error dict instead of stopping the batch.
+        """
+        inputs = list(inputs)
+        if not inputs:
+            return
+        workflow = self.get_workflow(workflow_name)
+        configs = [self._run_config(workflow_name, max_concurrency=max_concurrency) for _ in inputs]
+        for index, result in workflow.batch_as_completed(inputs, config=configs, return_exceptions=True):
+            self._discard(configs[index])
+            if isinstance(result, Exception):
+                logger.error(f"{workflow_name} run {index} failed: {str(result)}")
+                result = {"error": f"Workflow {workflow_name} failed", "details": str(result)}
+            yield index, result
+    
+    def run_workflow_batch(self, workflow_name: str, inputs: Iterable[Dict[str, Any]], max_concurrency: int = 8,
+                           on_progress: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, Any]]:
+        """Run a workflow over many inputs; results are returned in input order.
+        
+        `on_progress(completed, total)` is called after each run finishes.
+        """
+        inputs = list(inputs)
+        results: List[Dict[str, Any]] = [None] * len(inputs)
+        for completed, (index, result) in enumerate(self.iter_workflow_batch(workflow_name, inputs, max_concurrency), 1):
+            results[index] = result
+            if on_progress:
+                on_progress(completed, len(inputs))
+        return results
 
 @st.cache_resource
 def get_langgraph_flows():
-    return LangGraphFlows()
\ No newline at end of file
+    # Checkpoints default to memory so a failed donation run resumes within this process;
+    # set WORKFLOW_CHECKPOINTER=sqlite or mongo to survive restarts, or none to turn them off.
+    checkpointer = str(get_secret("WORKFLOW_CHECKPOINTER") or "memory").lower()
+    return LangGraphFlows(checkpointer=None if checkpointer == "none" else checkpointer,
+                          memoize=str(get_secret("WORKFLOW_MEMOIZE") or "true").lower() in ("1", "true", "yes"),
+                          tracer=None if str(get_secret("WORKFLOW_TRACING") or "").lower() in ("0", "false", "no") else get_workflow_tracer())
\ No newline at end of file
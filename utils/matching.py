@@ -0,0 +1,203 @@
+import re
+import numpy as np
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional
+from utils.geo import extract_coordinates, haversine_km
+from utils.units import parse_quantity_kg
+
+FOOD_TYPE_FIELDS = ("accepted_food_types", "food_types", "needs", "preferred_food_types")
+CAPACITY_FIELDS = ("capacity_kg", "capacity", "daily_capacity")
+# What ranking, the match prompt and the notification need from a recipient.
+CANDIDATE_FIELDS = ("name", "phone", "location", "lat", "lng", "lon", "latitude", "longitude") + FOOD_TYPE_FIELDS + CAPACITY_FIELDS
+# Recipients loaded per donation; ranking and the workflow state grow with this.
+MAX_CANDIDATES = 300
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [str(v) for v in value]
+
+
+def find_candidates(collection, donation: Dict[str, Any], limit: int = MAX_CANDIDATES) -> List[Dict[str, Any]]:
+    """Recipients worth ranking for `donation`, filtered, projected and capped in Mongo.
+
+    Recipients that list the donation's food type come first, then ones that list no food
+    types (ranked as neutral on type). Recipients that only take other types are skipped
+    unless nobody else is left.
+    """
+    projection = {field: 1 for field in CANDIDATE_FIELDS}
+    food_type = str(donation.get("type", "")).strip()
+    if not food_type:
+        return list(collection.find({}, projection).limit(limit))
+
+    # Matches list elements and comma-separated strings, case-insensitively like `score`.
+    pattern = {"$regex": rf"(^|,)\s*{re.escape(food_type)}\s*(,|$)", "$options": "i"}
+    candidates = list(collection.find({"$or": [{field: pattern} for field in FOOD_TYPE_FIELDS]}, projection).limit(limit))
+    if len(candidates) < limit:
+        untyped = {"$and": [{"$or": [{field: {"$in": [None, ""]}}, {field: {"$size": 0}}]} for field in FOOD_TYPE_FIELDS]}
+        candidates += collection.find(untyped, projection).limit(limit - len(candidates))
+    return candidates or list(collection.find({}, projection).limit(limit))
+
+
+def _days_until(expiry: Any, now: Optional[datetime] = None) -> Optional[float]:
+    now = now or datetime.now()
+    if isinstance(expiry, datetime):
+        expiry_dt = expiry
+    elif isinstance(expiry, date):
+        expiry_dt = datetime.combine(expiry, datetime.max.time())
+    elif isinstance(expiry, str):
+        try:
+            expiry_dt = datetime.combine(datetime.strptime(expiry[:10], "%Y-%m-%d").date(), datetime.max.time())
+        except ValueError:
+            return None
+    else:
+        return None
+    return (expiry_dt - now).total_seconds() / 86400.0
+
+
+class CandidateRanker:
+    """Deterministic, NumPy-vectorized scoring of recipients for a food donation.
+
+    Every recipient gets a score in [0, 1] combining distance, capacity fit and food-type
+    compatibility. Expiry urgency shifts weight towards distance so perishable food goes to
+    the closest organisations. Only the top-k candidates need to be sent to the LLM.
+    """
+
+    def __init__(
+        self,
+        distance_weight: float = 0.35,
+        capacity_weight: float = 0.25,
+        food_type_weight: float = 0.4,
+        distance_scale_km: float = 10.0,
+        urgency_horizon_days: float = 7.0,
+        top_k: int = 5,
+        decisive_score: float = 0.8,
+        decisive_margin: float = 0.15
+    ):
+        self.distance_weight = distance_weight
+        self.capacity_weight = capacity_weight
+        self.food_type_weight = food_type_weight
+        self.distance_scale_km = distance_scale_km
+        self.urgency_horizon_days = urgency_horizon_days
+        self.top_k = top_k
+        self.decisive_score = decisive_score
+        self.decisive_margin = decisive_margin
+
+    def urgency(self, donation: Dict[str, Any], now: Optional[datetime] = None) -> float:
+        """0 for food that keeps beyond the horizon, 1 for food expiring now."""
+        days_left = _days_until(donation.get("expiry_date"), now)
+        if days_left is None:
+            return 0.5
+        return float(np.clip(1.0 - days_left / self.urgency_horizon_days, 0.0, 1.0))
+
+    def score(self, donation: Dict[str, Any], recipients: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Score all recipients at once; returns the total and each component as arrays."""
+        n = len(recipients)
+        if n == 0:
+            empty = np.zeros(0)
+            return {"score": empty, "distance_km": empty, "distance": empty, "capacity": empty, "food_type": empty}
+
+        coords = np.full((n, 2), np.nan)
+        capacity = np.full(n, np.nan)
+        type_match = np.zeros(n)
+        has_types = np.zeros(n, dtype=bool)
+        food_type = str(donation.get("type", "")).strip().lower()
+
+        for i, recipient in enumerate(recipients):
+            point = extract_coordinates(recipient)
+            if point:
+                coords[i] = point
+            for field in CAPACITY_FIELDS:
+                if recipient.get(field) is not None:
+                    value = parse_quantity_kg(recipient[field])
+                    if value is not None:
+                        capacity[i] = value
+                    break
+            for field in FOOD_TYPE_FIELDS:
+                accepted = _as_list(recipient.get(field))
+                if accepted:
+                    has_types[i] = True
+                    type_match[i] = any(food_type == a.lower() for a in accepted)
+                    break
+
+        origin = extract_coordinates(donation)
+        if origin:
+            distance_km = haversine_km(origin[0], origin[1], coords[:, 0], coords[:, 1])
+        else:
+            distance_km = np.full(n, np.nan)
+        distance_score = np.where(np.isnan(distance_km), 0.5, np.exp(-np.nan_to_num(distance_km) / self.distance_scale_km))
+
+        quantity = parse_quantity_kg(donation.get("quantity"))
+        if quantity and quantity > 0:
+            fit = np.minimum(capacity, quantity) / np.maximum(capacity, quantity)
+            capacity_score = np.where(np.isnan(capacity) | (capacity <= 0), 0.5, fit)
+        else:
+            capacity_score = np.full(n, 0.5)
+
+        food_score = np.where(has_types, type_match, 0.5)
+
+        distance_weight = self.distance_weight * (1.0 + self.urgency(donation, now))
+        total = (
+            distance_weight * distance_score
+            + self.capacity_weight * capacity_score
+            + self.food_type_weight * food_score
+        ) / (distance_weight + self.capacity_weight + self.food_type_weight)
+
+        return {
+            "score": total,
+            "distance_km": distance_km,
+            "distance": distance_score,
+            "capacity": capacity_score,
+            "food_type": food_score
+        }
+
+    def rank(self, donation: Dict[str, Any], recipients: List[Dict[str, Any]], top_k: Optional[int] = None, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Return the best `top_k` recipients, highest score first."""
+        scores = self.score(donation, recipients, now)
+        total = scores["score"]
+        if total.size == 0:
+            return []
+
+        k = min(top_k or self.top_k, total.size)
+        top = np.argpartition(-total, k - 1)[:k]
+        top = top[np.argsort(-total[top], kind="stable")]
+
+        ranked = []
+        for i in top:
+            distance_km = scores["distance_km"][i]
+            ranked.append({
+                "recipient": recipients[i],
+                "score": round(float(total[i]), 4),
+                "distance_km": None if np.isnan(distance_km) else round(float(distance_km), 2),
+                "components": {
+                    "distance": round(float(scores["distance"][i]), 4),
+                    "capacity": round(float(scores["capacity"][i]), 4),
+                    "food_type": round(float(scores["food_type"][i]), 4)
+                }
+            })
+        return ranked
+
+    def is_decisive(self, ranked: List[Dict[str, Any]]) -> bool:
+        """True when the leader is good enough and far enough ahead to skip the LLM."""
+        if not ranked or ranked[0]["score"] < self.decisive_score:
+            return False
+        if len(ranked) == 1:
+            return True
+        return ranked[0]["score"] - ranked[1]["score"] >= self.decisive_margin
+
+    def as_match(self, candidate: Dict[str, Any], justification: Optional[str] = None, method: str = "ranking") -> Dict[str, Any]:
+        """Shape a ranked candidate like an LLM match result."""
+        recipient = candidate["recipient"]
+        return {
+            "recipient_id": recipient.get("_id"),
+            "recipient_name": recipient.get("name"),
+            "score": candidate["score"],
+            "justification": justification or (
+                f"Highest compatibility score ({candidate['score']:.2f}) based on food type, "
+                f"capacity and distance."
+            ),
+            "method": method
+        }
@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import streamlit as st
+from utils.database import get_db
+from utils.ai_agents import get_ai_agents
+from utils.config import get_config
+
+logger = logging.getLogger(__name__)
+
+AGE_BANDS = [(0, 17, "under 18", 15), (18, 29, "18-29", 24), (30, 44, "30-44", 37), (45, 59, "45-59", 52), (60, 200, "60+", 67)]
+
+
+def age_band(age: Any) -> Dict[str, Any]:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        age = 30
+    for low, high, label, midpoint in AGE_BANDS:
+        if low <= age <= high:
+            return {"label": label, "midpoint": midpoint}
+    return {"label": "60+", "midpoint": 67}
+
+
+def segment_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical, shareable version of a user's profile (age reduced to its band)."""
+    band = age_band(user.get("age", 30))
+    return {
+        "age_band": band["label"],
+        "age": band["midpoint"],
+        "dietary_preferences": sorted(user.get("dietary_preferences", [])),
+        "allergies": sorted(a.lower() for a in user.get("allergies", [])),
+        "health_goals": sorted(user.get("health_goals", [])),
+        "activity_level": user.get("activity_level", "Moderately Active")
+    }
+
+
+def segment_key(profile: Dict[str, Any]) -> str:
+    canonical = {k: v for k, v in profile.items() if k != "age"}
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def produce_fingerprint(local_produce: List[Dict[str, Any]]) -> str:
+    """Changes whenever the set of available produce changes."""
+    items = sorted({(str(p.get("name", "")), str(p.get("category", "")), str(p.get("supplier", ""))) for p in local_produce})
+    return hashlib.sha1(json.dumps(items).encode("utf-8")).hexdigest()[:16]
+
+
+class MealPlanSegments:
+    """Pre-generated meal plans shared by users with the same segment profile.
+
+    Users are grouped by dietary preferences, allergies, health goals, activity level
+    and age band. `refresh` generates one plan per popular segment against the current
+    local produce; `get_plan` serves it instantly when the produce has not changed.
+    """
+
+    def __init__(self, db=None, ai=None, config=None):
+        self.db = db or get_db()
+        self.ai = ai or get_ai_agents()
+        self.config = config or get_config()
+        self.collection = self.config.collections["meal_plan_segments"]
+
+    def current_produce(self) -> List[Dict[str, Any]]:
+        return self.db.find_documents(self.config.collections["local_produce"], {}, 50)
+
+    def build_segments(self, users: List[Dict[str, Any]], min_users: int = 2, max_segments: int = 50) -> List[Dict[str, Any]]:
+        """Group users into segments, most populated first."""
+        segments: Dict[str, Dict[str, Any]] = {}
+        for user in users:
+            if "dietary_preferences" not in user or "health_goals" not in user:
+                continue
+            profile = segment_profile(user)
+            key = segment_key(profile)
+            segment = segments.setdefault(key, {"segment_key": key, "profile": profile, "user_count": 0})
+            segment["user_count"] += 1
+
+        ranked = sorted(segments.values(), key=lambda s: s["user_count"], reverse=True)
+        return [s for s in ranked if s["user_count"] >= min_users][:max_segments]
+
+    def refresh(self, max_concurrency: int = 4, min_users: int = 2, max_segments: int = 50, force: bool = False) -> Dict[str, int]:
+        """Generate plans for segments that are missing or stale for the current produce."""
+        users = self.db.find_documents(self.config.collections["users"], {"dietary_preferences": {"$exists": True}}, 0)
+        local_produce = self.current_produce()
+        fingerprint = produce_fingerprint(local_produce)
+        segments = self.build_segments(users, min_users, max_segments)
+
+        existing = {
+            doc["segment_key"]: doc.get("produce_fingerprint")
+            for doc in self.db.get_collection(self.collection).find(
+                {"segment_key": {"$in": [s["segment_key"] for s in segments]}},
+                {"segment_key": 1, "produce_fingerprint": 1}
+            )
+        }
+        stale = [s for s in segments if force or existing.get(s["segment_key"]) != fingerprint]
+
+        generated = failed = 0
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = {pool.submit(self.ai.generate_meal_plan, s["profile"], local_produce): s for s in stale}
+            for future in as_completed(futures):
+                segment = futures[future]
+                plan = future.result()
+                if isinstance(plan, dict) and "error" in plan:
+                    failed += 1
+                    logger.warning(f"Segment {segment['segment_key']} failed: {plan.get('details')}")
+                    continue
+                self.db.get_collection(self.collection).update_one(
+                    {"segment_key": segment["segment_key"]},
+                    {"$set": {
+                        "profile": segment["profile"],
+                        "user_count": segment["user_count"],
+                        "plan": plan,
+                        "produce_fingerprint": fingerprint,
+                        "generated_at": datetime.now()
+                    }},
+                    upsert=True
+                )
+                generated += 1
+
+        return {"segments": len(segments), "stale": len(stale), "generated": generated, "failed": failed}
+
+    def get_plan(self, user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Pre-generated plan for this user's segment, if fresh for the given produce."""
+        doc = self.db.get_collection(self.collection).find_one({
+            "segment_key": segment_key(segment_profile(user_profile)),
+            "produce_fingerprint": produce_fingerprint(local_produce)
+        })
+        return doc["plan"] if doc else None
+
+
+@st.cache_resource
+def get_meal_plan_segments():
+    return MealPlanSegments()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate meal plans per user segment")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent LLM generations")
+    parser.add_argument("--min-users", type=int, default=2)
+    parser.add_argument("--max-segments", type=int, default=50)
+    parser.add_argument("--force", action="store_true", help="Regenerate even if produce is unchanged")
+    parser.add_argument("--watch", type=int, default=0, help="Re-check every N seconds and refresh when produce changes")
+    args = parser.parse_args()
+
+    segments = MealPlanSegments()
+    while True:
+        stats = segments.refresh(args.concurrency, args.min_users, args.max_segments, args.force)
+        logger.info(f"Segment refresh: {stats}")
+        if not args.watch:
+            break
+        args.force = False
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import argparse
+import logging
+import os
+import random
+import socket
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+import streamlit as st
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from utils.database import get_db
+from utils.config import get_config, get_secret
+from utils.resilience import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Priority lanes, most urgent first. Urgent messages skip coalescing and per-recipient limits.
+URGENT = "urgent"
+NORMAL = "normal"
+BULK = "bulk"
+PRIORITIES = {URGENT: 0, NORMAL: 1, BULK: 2}
+
+# Twilio error codes worth another attempt once a status callback reports the message failed:
+# queue overflow, unreachable handset, unknown error, and channel rate limit.
+RETRYABLE_DELIVERY_ERRORS = ("30001", "30003", "30008", "63018")
+# Written by utils.status_callbacks from Twilio's delivery reports.
+DELIVERY_FIELDS = ("delivery_status", "delivery_rank", "delivery_error_code", "delivery_updated_at")
+
+MAX_MESSAGE_LENGTH = 1600
+DIGEST_SEPARATOR = "\n\n---\n\n"
+DIGEST_HEADER = "You have {count} RescueBites updates:\n\n"
+# Room left for the header, whose length grows with the part count.
+DIGEST_HEADER_RESERVE = 40
+
+
+def compose_digest(parts: List[str]) -> str:
+    """One message from coalesced parts; a single part is sent as is."""
+    if len(parts) == 1:
+        return parts[0]
+    return DIGEST_HEADER.format(count=len(parts)) + DIGEST_SEPARATOR.join(parts)
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Client errors (bad number, unverified sender) will not succeed on retry; 429 will."""
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+class NotificationOutbox:
+    """Mongo-backed outbox for outgoing WhatsApp messages.
+
+    `enqueue` stores the message and returns at once; worker threads (`run_worker`, in the
+    app process or via `python -m utils.notification_outbox`) claim messages atomically,
+    send them, and retry failures with jittered exponential backoff. Each message document
+    records its delivery status, attempts, provider sid and last error.
+
+    With a `coalesce_window`, a message is held for that many seconds; later messages to
+    the same number join it as one digest (up to the 1600-character WhatsApp limit), and
+    exact repeats of a message already queued or sent in the window are dropped.
+
+    Messages carry a priority lane (urgent, normal, bulk) and are claimed most urgent
+    first. Normal and bulk messages are limited to `recipient_per_minute` per number, and
+    bulk to `bulk_per_second` overall, so a campaign leaves room for urgent sends; a
+    message over its limit is deferred rather than holding a worker.
+    """
+
+    def __init__(self, db=None, config=None, lease_seconds: int = 60, max_attempts: int = 5,
+                 base_delay: float = 2.0, max_delay: float = 300.0, recipient_per_minute: float = 10,
+                 bulk_per_second: float = 20, max_tracked_recipients: int = 10000):
+        self.db = db or get_db()
+        self.config = config or get_config()
+        self.collection = self.db.get_collection(self.config.collections["notifications"])
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.recipient_per_minute = recipient_per_minute
+        self.bulk_bucket = TokenBucket(bulk_per_second * 60, capacity=bulk_per_second)
+        self.max_tracked_recipients = max_tracked_recipients
+        self._recipient_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._buckets_lock = threading.Lock()
+        # Set on enqueue so idle workers in this process pick up urgent messages without waiting to poll.
+        self.wakeup = threading.Event()
+
+    def enqueue(self, to: str, body: str, user_id: Any = None, kind: Optional[str] = None,
+                coalesce_window: float = 0, priority: str = NORMAL) -> str:
+        """Queue a message and return its id (the digest's id when it was coalesced or a duplicate)."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if priority == URGENT:
+            coalesce_window = 0
+        now = datetime.now()
+        if coalesce_window > 0:
+            existing = self._coalesce(to, body, kind, now, coalesce_window, PRIORITIES[priority])
+            if existing:
+                return existing
+        
+        notification_id = str(self.collection.insert_one({
+            "to": to,
+            "body": body,
+            "parts": [body],
+            "kinds": [kind],
+            "length": len(body),
+            "user_id": user_id,
+            "kind": kind,
+            "priority": PRIORITIES[priority],
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "created_at": now,
+            "available_at": now + timedelta(seconds=coalesce_window)
+        }).inserted_id)
+        self.wakeup.set()
+        return notification_id
+    
+    def _coalesce(self, to: str, body: str, kind: Optional[str], now: datetime, window: float, priority: int) -> Optional[str]:
+        duplicate = self.collection.find_one(
+            {"to": to, "parts": body, "status": {"$in": [QUEUED, SENDING, SENT]},
+             "created_at": {"$gte": now - timedelta(seconds=window)}},
+            {"_id": 1}
+        )
+        if duplicate:
+            return str(duplicate["_id"])
+        
+        # Only a digest that is still waiting (not yet claimed) can take more parts.
+        digest = self.collection.find_one_and_update(
+            {"to": to, "priority": priority, "status": QUEUED, "attempts": 0, "available_at": {"$gt": now},
+             "length": {"$lte": MAX_MESSAGE_LENGTH - DIGEST_HEADER_RESERVE - len(DIGEST_SEPARATOR) - len(body)}},
+            {"$push": {"parts": body, "kinds": kind},
+             "$inc": {"length": len(DIGEST_SEPARATOR) + len(body)},
+             "$set": {"updated_at": now}},
+            projection={"_id": 1}, sort=[("created_at", 1)]
+        )
+        return str(digest["_id"]) if digest else None
+
+    def get(self, notification_id: Any) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": ObjectId(notification_id) if ObjectId.is_valid(str(notification_id)) else notification_id})
+
+    def claim(self, worker_id: str, priorities: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Atomically take the most urgent, oldest due message, including ones whose sender lease expired.
+        
+        A message whose lease expired on its last attempt is not taken again, since Twilio
+        may already have accepted it; `expire_abandoned` marks it failed.
+        """
+        now = datetime.now()
+        query: Dict[str, Any] = {"$or": [
+            {"status": QUEUED, "available_at": {"$lte": now}},
+            {"status": SENDING, "lease_expires_at": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}}
+        ]}
+        if priorities:
+            query["priority"] = {"$in": [PRIORITIES[p] for p in priorities]}
+        return self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": SENDING, "worker_id": worker_id,
+                      "lease_expires_at": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("priority", 1), ("available_at", 1)], return_document=ReturnDocument.AFTER
+        )
+    
+    def expire_abandoned(self) -> int:
+        """Fail messages whose sender lease expired with no attempts left; returns how many."""
+        now = datetime.now()
+        return self.collection.update_many(
+            {"status": SENDING, "lease_expires_at": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": FAILED, "error": "Worker stopped responding", "failed_at": now}}
+        ).modified_count
+    
+    def _recipient_bucket(self, to: str) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._recipient_buckets.get(to)
+            if bucket is None:
+                bucket = self._recipient_buckets[to] = TokenBucket(self.recipient_per_minute)
+                while len(self._recipient_buckets) > self.max_tracked_recipients:
+                    self._recipient_buckets.popitem(last=False)
+            else:
+                self._recipient_buckets.move_to_end(to)
+            return bucket
+    
+    def rate_limit_wait(self, message: Dict[str, Any]) -> float:
+        """Seconds until this message may be sent; 0 takes the tokens. Urgent messages are never held."""
+        priority = message.get("priority", PRIORITIES[NORMAL])
+        if priority == PRIORITIES[URGENT]:
+            return 0.0
+        wait = self._recipient_bucket(message["to"]).try_acquire()
+        if wait == 0.0 and priority == PRIORITIES[BULK]:
+            wait = self.bulk_bucket.try_acquire()
+            if wait > 0:
+                # Give back the recipient token; the message is retried later as a whole.
+                self._recipient_bucket(message["to"]).consume(-1)
+        return wait
+    
+    def defer(self, message: Dict[str, Any], seconds: float):
+        """Put a claimed message back without counting the attempt."""
+        self.collection.update_one({"_id": message["_id"], "worker_id": message["worker_id"]}, {
+            "$set": {"status": QUEUED, "available_at": datetime.now() + timedelta(seconds=seconds)},
+            "$inc": {"attempts": -1}
+        })
+
+    def backoff(self, attempts: int) -> float:
+        """Full-jitter exponential backoff, so retries after an outage do not arrive in lockstep."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+
+    def mark_sent(self, message: Dict[str, Any], sid: Optional[str]):
+        update: Dict[str, Any] = {"$set": {"status": SENT, "sid": sid, "error": None, "sent_at": datetime.now()}}
+        for _ in range(3):
+            try:
+                self.collection.update_one({"_id": message["_id"], "worker_id": message["worker_id"]}, update)
+                return
+            except DuplicateKeyError:
+                # A status callback for this sid arrived first and was stored on its own
+                # document; fold it into the message.
+                orphan = self.collection.find_one_and_delete({"sid": sid, "status": {"$exists": False}})
+                if orphan:
+                    update["$set"].update({key: orphan[key] for key in DELIVERY_FIELDS if key in orphan})
+                    if orphan.get("delivery_events"):
+                        update["$push"] = {"delivery_events": {"$each": orphan["delivery_events"], "$slice": -20}}
+        logger.error(f"Recording sid {sid} for notification {message['_id']} failed")
+
+    def mark_failed(self, message: Dict[str, Any], error: Exception):
+        retry = not is_permanent_error(error) and message.get("attempts", 1) < message.get("max_attempts", self.max_attempts)
+        update = {"status": QUEUED if retry else FAILED, "error": str(error)}
+        if retry:
+            update["available_at"] = datetime.now() + timedelta(seconds=self.backoff(message.get("attempts", 1)))
+        else:
+            update["failed_at"] = datetime.now()
+        self.collection.update_one({"_id": message["_id"], "worker_id": message["worker_id"]}, {"$set": update})
+
+    def deliver(self, message: Dict[str, Any], sender: Callable[[str, str], Optional[str]]):
+        wait = self.rate_limit_wait(message)
+        if wait > 0:
+            self.defer(message, wait)
+            return
+        try:
+            sid = sender(message["to"], compose_digest(message.get("parts") or [message["body"]]))
+        except Exception as e:
+            logger.warning(f"Sending notification {message['_id']} failed (attempt {message.get('attempts')}): {str(e)}")
+            self.mark_failed(message, e)
+            return
+        self.mark_sent(message, sid)
+
+    def requeue_failed(self, since: Optional[datetime] = None, max_requeues: int = 1,
+                       error_codes=RETRYABLE_DELIVERY_ERRORS) -> int:
+        """Send again messages Twilio accepted but later reported undelivered with a retryable error."""
+        query: Dict[str, Any] = {
+            "status": SENT,
+            "delivery_status": {"$in": ["undelivered", "failed"]},
+            "delivery_error_code": {"$in": list(error_codes)},
+            "requeues": {"$not": {"$gte": max_requeues}}
+        }
+        if since is not None:
+            query["delivery_updated_at"] = {"$gte": since}
+        result = self.collection.update_many(query, {
+            "$set": {"status": QUEUED, "attempts": 0, "available_at": datetime.now()},
+            "$unset": {"sid": "", "delivery_status": "", "delivery_rank": "", "delivery_error_code": ""},
+            "$inc": {"requeues": 1}
+        })
+        if result.modified_count:
+            self.wakeup.set()
+        return result.modified_count
+    
+    def stats(self) -> Dict[str, int]:
+        return {row["_id"]: row["count"] for row in self.collection.aggregate([
+            {"$match": {"status": {"$exists": True}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ])}
+
+
+def default_worker_count() -> int:
+    return int(get_secret("NOTIFICATION_WORKERS") or 4)
+
+
+def default_urgent_workers() -> int:
+    return int(get_secret("NOTIFICATION_URGENT_WORKERS") or 1)
+
+
+def run_worker(workers: Optional[int] = None, poll_interval: float = 1.0, stop_event: Optional[threading.Event] = None,
+               outbox: Optional[NotificationOutbox] = None, sender: Optional[Callable[[str, str], Optional[str]]] = None,
+               urgent_workers: Optional[int] = None, requeue_interval: float = 60.0):
+    """Run `workers` threads that claim and send messages until `stop_event` is set.
+    
+    `urgent_workers` more threads take only urgent messages, so they are sent promptly
+    even while every other worker is busy with a bulk backlog. Every `requeue_interval`
+    seconds, messages that status callbacks reported undelivered for a retryable reason
+    are queued again and messages abandoned on their last attempt are failed (0 disables
+    this). The threads are daemons, so an in-process pool never holds up interpreter exit.
+    """
+    outbox = outbox or get_notification_outbox()
+    if sender is None:
+        # Imported here: utils.notifications enqueues into this module's outbox. Built
+        # directly rather than via get_notifications, which would start a second pool.
+        from utils.notifications import Notifications
+        sender = Notifications(outbox=outbox).deliver
+    stop_event = stop_event or threading.Event()
+    workers = workers or default_worker_count()
+    urgent_workers = default_urgent_workers() if urgent_workers is None else urgent_workers
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop(index: int, priorities: Optional[List[str]]):
+        worker_id = f"{prefix}:{index}"
+        while not stop_event.is_set():
+            try:
+                message = outbox.claim(worker_id, priorities)
+            except Exception as e:
+                logger.error(f"Claiming notification failed: {str(e)}")
+                message = None
+            if message is None:
+                outbox.wakeup.wait(poll_interval)
+                outbox.wakeup.clear()
+                continue
+            try:
+                outbox.deliver(message, sender)
+            except Exception as e:
+                # Recording the outcome failed; the lease expiry hands the message to a worker again.
+                logger.error(f"Delivering notification {message['_id']} failed: {str(e)}")
+                stop_event.wait(poll_interval)
+
+    def requeue_loop():
+        while not stop_event.wait(requeue_interval):
+            try:
+                requeued = outbox.requeue_failed()
+                expired = outbox.expire_abandoned()
+            except Exception as e:
+                logger.error(f"Requeueing undelivered notifications failed: {str(e)}")
+                continue
+            if requeued:
+                logger.info(f"Requeued {requeued} undelivered notifications")
+            if expired:
+                logger.warning(f"Failed {expired} notifications abandoned by their worker on the last attempt")
+
+    logger.info(f"Starting {workers} notification workers and {urgent_workers} urgent-only workers")
+    threads = [threading.Thread(target=loop, args=(index, None), name=f"notify-{index}", daemon=True)
+               for index in range(workers)]
+    threads += [threading.Thread(target=loop, args=(index, [URGENT]), name=f"notify-urgent-{index}", daemon=True)
+                for index in range(workers, workers + urgent_workers)]
+    if requeue_interval > 0:
+        threads.append(threading.Thread(target=requeue_loop, name="notify-requeue", daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def start_background_workers(workers: Optional[int] = None, **kwargs) -> threading.Event:
+    """Drain the outbox from daemon threads in this process; set the returned event to stop."""
+    stop_event = threading.Event()
+    threading.Thread(target=run_worker, kwargs={"workers": workers, "stop_event": stop_event, **kwargs},
+                     name="notification-outbox", daemon=True).start()
+    return stop_event
+
+
+@st.cache_resource
+def get_notification_outbox():
+    return NotificationOutbox(
+        recipient_per_minute=float(get_secret("NOTIFICATION_RECIPIENT_PER_MINUTE") or 10),
+        bulk_per_second=float(get_secret("NOTIFICATION_BULK_PER_SECOND") or 20)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send queued WhatsApp notifications")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent sends (default: NOTIFICATION_WORKERS or 4)")
+    parser.add_argument("--urgent-workers", type=int, default=None,
+                        help="Extra workers reserved for urgent messages (default: NOTIFICATION_URGENT_WORKERS or 1)")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    try:
+        run_worker(args.workers, args.poll_interval, stop_event, urgent_workers=args.urgent_workers)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
-from twilio.rest import Client
 import streamlit as st
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Mapping, Tuple
 import os
 from dotenv import load_dotenv
-import time
 from utils.config import get_secret
+from utils.message_templates import render, render_many
+from utils.notification_outbox import get_notification_outbox, start_background_workers, default_worker_count, URGENT, NORMAL, BULK
+from utils.resilience import SharedRateLimiter
+from utils.twilio_client import TwilioSender
 
 load_dotenv()
 
 class Notifications:
-    def __init__(self):
+    """WhatsApp notifications. Messages go through the outbox; `deliver` is the actual Twilio send."""
+    
+    def __init__(self, outbox=None):
         try:
             # account_sid = os.getenv("TWILIO_ACCOUNT_SID")
             # auth_token = os.getenv("TWILIO_AUTH_TOKEN")
@@ -21,77 +25,86 @@ class Notifications:
             if not all([account_sid, auth_token, whatsapp_number]):
                 raise ValueError("Missing Twilio credentials in environment variables")
             
-            self.client = Client(account_sid, auth_token)
+            self.outbox = outbox or get_notification_outbox()
+            messages_per_second = float(get_secret("TWILIO_MESSAGES_PER_SECOND") or 80)
+            self.sender = TwilioSender(
+                account_sid, auth_token, whatsapp_number,
+                messages_per_second=messages_per_second,
+                # One counter per account in Mongo, shared by the app's workers and `python -m utils.notification_outbox`.
+                rate_limiter=SharedRateLimiter(
+                    self.outbox.db.get_collection(self.outbox.config.collections["rate_limits"]),
+                    f"twilio:{account_sid}", messages_per_second
+                ),
+                pool_size=max(10, default_worker_count()),
+                status_callback=get_secret("TWILIO_STATUS_CALLBACK_URL"),
+                # Set to a local stand-in (benchmarks/twilio_stub.py) for load tests; defaults to api.twilio.com.
+                base_url=get_secret("TWILIO_API_BASE_URL")
+            )
+            self.client = self.sender.client
             self.whatsapp_number = whatsapp_number
-            self.max_retries = 3
-            self.retry_delay = 1  
+            # Messages to the same number within this many seconds are sent as one digest.
+            self.coalesce_window = float(get_secret("NOTIFICATION_COALESCE_SECONDS") or 30)
         except Exception as e:
             st.error(f"Failed to initialize Twilio client: {e}")
             raise
         
-    def _send_with_retry(self, to: str, message: str) -> bool:
-        """Helper method to handle retries for sending messages"""
-        for attempt in range(self.max_retries):
-            try:
-                self.client.messages.create(
-                    body=message,
-                    from_=f"whatsapp:{self.whatsapp_number}",
-                    to=f"whatsapp:{to}"
-                )
-                return True
-            except Exception as e:
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                    continue
-                st.error(f"Failed to send WhatsApp message after {self.max_retries} attempts: {e}")
-                return False
+    def deliver(self, to: str, message: str) -> str:
+        """Send one message through Twilio now and return its sid; raises on failure."""
+        return self.sender.send(to, message)
     
-    def send_whatsapp_message(self, to: str, message: str) -> bool:
-        """Send a WhatsApp message with proper formatting"""
+    def send_whatsapp_message(self, to: str, message: str, kind: str = None, coalesce: bool = True,
+                              priority: str = NORMAL) -> bool:
+        """Queue a WhatsApp message with proper formatting; outbox workers send and retry it.
+        
+        Unless `coalesce` is False, it may be merged with other messages to the same number
+        and is dropped if an identical message was already queued or sent recently.
+        `priority` is "urgent" (sent at once, never held back), "normal" or "bulk".
+        """
         try:
-            
-            if not to.startswith("+"):
-                to = f"+{to.lstrip('0')}"
-                
-          
-            message = message.strip()
-            if len(message) > 1600:
-                message = message[:1597] + "..."
-                
-            return self._send_with_retry(to, message)
+            # Indentation from triple-quoted text would be sent as is and defeat duplicate detection.
+            message = "\n".join(line.strip() for line in message.strip().splitlines())
+            self._queue(to, message, kind, coalesce, priority)
+            return True
+        except Exception as e:
+            st.error(f"Error preparing WhatsApp message: {e}")
+            return False
+    
+    def send_template(self, to: str, template: str, fields: Mapping[str, Any] = None, kind: str = None,
+                      coalesce: bool = True, priority: str = NORMAL) -> bool:
+        """Queue a message rendered from utils.message_templates; `kind` defaults to the template name."""
+        try:
+            self._queue(to, render(template, fields), kind or template, coalesce, priority)
+            return True
         except Exception as e:
             st.error(f"Error preparing WhatsApp message: {e}")
             return False
     
+    def send_template_many(self, template: str, recipients: Iterable[Tuple[str, Mapping[str, Any]]],
+                           kind: str = None, coalesce: bool = True, priority: str = NORMAL) -> int:
+        """Queue one template to many (to, fields) pairs; returns how many were queued."""
+        recipients = list(recipients)
+        queued = 0
+        for (to, _), message in zip(recipients, render_many(template, (fields for _, fields in recipients))):
+            try:
+                self._queue(to, message, kind or template, coalesce, priority)
+                queued += 1
+            except Exception as e:
+                st.error(f"Error preparing WhatsApp message: {e}")
+        return queued
+    
+    def _queue(self, to: str, message: str, kind: str, coalesce: bool, priority: str):
+        if not to.startswith("+"):
+            to = f"+{to.lstrip('0')}"
+        if len(message) > 1600:
+            message = message[:1597] + "..."
+        self.outbox.enqueue(to, message, kind=kind, coalesce_window=self.coalesce_window if coalesce else 0,
+                            priority=priority)
+    
     def notify_food_match(self, donor_phone: str, recipient_phone: str, food_details: Dict[str, Any]) -> bool:
         try:
-            donor_message = f"""
-             Food Match Notification 
-            
-            Your food donation has been matched!
-            
-            Item: {food_details.get('type', 'N/A')}
-            Quantity: {food_details.get('quantity', 'N/A')}
-            
-            The recipient will contact you shortly to arrange pickup.
-            Thank you for reducing food waste!
-            """
-            
-            recipient_message = f"""
-             Food Availability Notification 
-            
-            A food donation matching your needs is available!
-            
-            Item: {food_details.get('type', 'N/A')}
-            Quantity: {food_details.get('quantity', 'N/A')}
-            Expiry: {food_details.get('expiry_date', 'N/A')}
-            Location: {food_details.get('location', {}).get('address', 'N/A')}
-            
-            Please contact the donor to arrange pickup.
-            """
-            
-            donor_success = self.send_whatsapp_message(donor_phone, donor_message)
-            recipient_success = self.send_whatsapp_message(recipient_phone, recipient_message)
+            fields = {**food_details, "address": food_details.get("location", {}).get("address")}
+            donor_success = self.send_template(donor_phone, "food_match_donor", fields, kind="food_match")
+            recipient_success = self.send_template(recipient_phone, "food_match_recipient", fields, kind="food_match")
             
             return donor_success and recipient_success
         except Exception as e:
@@ -100,32 +113,9 @@ class Notifications:
     
     def notify_waste_exchange(self, supplier_phone: str, receiver_phone: str, waste_details: Dict[str, Any]) -> bool:
         try:
-            supplier_message = f"""
-             Waste Exchange Notification 
-            
-            Your waste material has found a new purpose!
-            
-            Type: {waste_details.get('type', 'N/A')}
-            Quantity: {waste_details.get('quantity', 'N/A')}
-            
-            The receiving business will contact you shortly.
-            Thank you for participating in circular economy!
-            """
-            
-            receiver_message = f"""
-             Waste Availability Notification 
-            
-            A waste material you can repurpose is available!
-            
-            Type: {waste_details.get('type', 'N/A')}
-            Quantity: {waste_details.get('quantity', 'N/A')}
-            Location: {waste_details.get('location', {}).get('address', 'N/A')}
-            
-            Please contact the supplier to arrange pickup.
-            """
-            
-            supplier_success = self.send_whatsapp_message(supplier_phone, supplier_message)
-            receiver_success = self.send_whatsapp_message(receiver_phone, receiver_message)
+            fields = {**waste_details, "address": waste_details.get("location", {}).get("address")}
+            supplier_success = self.send_template(supplier_phone, "waste_exchange_supplier", fields, kind="waste_exchange")
+            receiver_success = self.send_template(receiver_phone, "waste_exchange_receiver", fields, kind="waste_exchange")
             
             return supplier_success and receiver_success
         except Exception as e:
@@ -133,59 +123,22 @@ class Notifications:
             return False
     
     def notify_social_impact(self, phone: str, impact_data: Dict[str, Any]) -> bool:
-        try:
-            message = f"""
-             Social Impact Update 
-            
-            Your recent activities have made a difference!
-            
-            Meals Provided: {impact_data.get('meals_provided', 0)}
-            CO2 Saved: {impact_data.get('co2_saved', 0)} kg
-            Waste Reduced: {impact_data.get('waste_reduced', 0)} kg
-            
-            Thank you for contributing to a sustainable future!
-            """
-            return self.send_whatsapp_message(phone, message)
-        except Exception as e:
-            st.error(f"Error in social impact notification: {e}")
-            return False
+        fields = {"meals_provided": 0, "co2_saved": 0, "waste_reduced": 0, **impact_data}
+        return self.send_template(phone, "social_impact", fields, priority=BULK)
     
     def notify_delivery_update(self, phone: str, delivery_details: Dict[str, Any], status: str) -> bool:
-        try:
-            if status == "pickup_confirmed":
-                message = f"""
-                 Delivery Update - Pickup Confirmed
-                
-                Your food donation has been picked up by our delivery partner.
-                
-                Item: {delivery_details.get('type', 'N/A')}
-                Quantity: {delivery_details.get('quantity', 'N/A')}
-                
-                Estimated delivery time: 30-60 minutes
-                Delivery Partner Contact: {delivery_details.get('partner_phone', 'N/A')}
-                
-                Thank you for using our service!
-                """
-            elif status == "delivered":
-                message = f"""
-                 Delivery Update - Completed
-                
-                Your food donation has been {'delivered to recipient' if delivery_details.get('is_recipient') else 'received'}!
-                
-                Item: {delivery_details.get('type', 'N/A')}
-                Quantity: {delivery_details.get('quantity', 'N/A')}
-                Delivery Time: {delivery_details.get('delivery_time', 'N/A')} minutes
-                
-                Thank you for {'using' if delivery_details.get('is_recipient') else 'contributing to'} our service!
-                """
-            else:
-                return False
-                
-            return self.send_whatsapp_message(phone, message)
-        except Exception as e:
-            st.error(f"Error in delivery notification: {e}")
+        if status == "pickup_confirmed":
+            template = "delivery_pickup_confirmed"
+        elif status == "delivered":
+            template = "delivery_completed_recipient" if delivery_details.get("is_recipient") else "delivery_completed_donor"
+        else:
             return False
+        return self.send_template(phone, template, delivery_details, kind=f"delivery_{status}", priority=URGENT)
 
 @st.cache_resource
 def get_notifications():
-    return Notifications()
\ No newline at end of file
+    notifications = Notifications()
+    # Set NOTIFICATION_INPROCESS_WORKERS=false when `python -m utils.notification_outbox` runs separately.
+    if str(get_secret("NOTIFICATION_INPROCESS_WORKERS") or "true").lower() not in ("0", "false", "no"):
+        start_background_workers(outbox=notifications.outbox, sender=notifications.deliver)
+    return notifications
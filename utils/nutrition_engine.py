@@ -0,0 +1,130 @@
+import csv
+import os
+import threading
+import numpy as np
+import streamlit as st
+from typing import Dict, Any, List, Optional, Tuple
+from utils.units import parse_quantity_kg
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "nutrient_table.csv")
+
+NUTRIENTS = ("calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium", "calcium", "iron", "vitamin_c")
+
+# Reference daily values (kcal, g, mg) used to express totals as person-days of need.
+DAILY_VALUES = np.array([2000, 50, 275, 78, 28, 50, 2300, 1300, 18, 90], dtype=float)
+
+KCAL_PER_MEAL = 600.0
+DEFAULT_ITEM_KG = 1.0
+
+
+class NutritionEngine:
+    """Local nutrient calculator backed by a per-100 g nutrient table.
+
+    Each food item is resolved to a row of the table (by name, then by food type
+    category) and weighted by its quantity; totals are a single matrix product of the
+    (items x foods) weight matrix with the (foods x nutrients) table.
+    """
+
+    def __init__(self, table_path: str = DEFAULT_TABLE):
+        with open(table_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+        self.names = [row["name"] for row in rows]
+        self.categories = {row["name"].lower(): i for i, row in enumerate(rows) if row["name"] == row["category"]}
+        self.index = {name.lower(): i for i, name in enumerate(self.names)}
+        self.table = np.array([[float(row[n]) for n in NUTRIENTS] for row in rows], dtype=float)
+        self._category_rows = set(self.categories.values())
+        self.other = self.index["other"]
+        # Longest names first so "whole wheat bread" wins over "bread".
+        self._by_length = sorted(self.index.items(), key=lambda kv: -len(kv[0]))
+        self._resolved: Dict[Tuple[str, str], Tuple[int, bool]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, item: Dict[str, Any]) -> Tuple[int, bool]:
+        """Return (table row, matched_by_name) for a food item."""
+        name = str(item.get("name") or item.get("item") or "").strip().lower()
+        food_type = str(item.get("type") or item.get("category") or "").strip().lower()
+        key = (name, food_type)
+        cached = self._resolved.get(key)
+        if cached is not None:
+            return cached
+
+        row = None
+        if name:
+            row = self.index.get(name)
+            if row is None:
+                row = next((i for n, i in self._by_length if n in name), None)
+
+        if row is not None and row not in self._category_rows:
+            result = (row, True)
+        else:
+            category = self.categories.get(food_type)
+            result = (category if category is not None else (row if row is not None else self.other), False)
+
+        with self._lock:
+            self._resolved[key] = result
+        return result
+
+    def weights(self, food_items: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+        """Table rows, quantities in units of 100 g, and indexes resolved only by category."""
+        rows = np.empty(len(food_items), dtype=np.intp)
+        hundred_grams = np.empty(len(food_items), dtype=float)
+        unmatched = []
+        for i, item in enumerate(food_items):
+            rows[i], by_name = self.resolve(item)
+            if not by_name:
+                unmatched.append(i)
+            kg = parse_quantity_kg(item.get("quantity"), DEFAULT_ITEM_KG)
+            hundred_grams[i] = max(kg or 0.0, 0.0) * 10.0
+        return rows, hundred_grams, unmatched
+
+    def nutrient_vectors(self, food_items: List[Dict[str, Any]]) -> np.ndarray:
+        """(items x nutrients) matrix of absolute nutrient amounts."""
+        rows, hundred_grams, _ = self.weights(food_items)
+        return hundred_grams[:, None] * self.table[rows]
+
+    def _totals_matrix(self, rows: np.ndarray, hundred_grams: np.ndarray, group_starts: np.ndarray) -> np.ndarray:
+        # Sparse-in-spirit weight matrix: W[g, food] = total 100 g units of `food` in group g.
+        n_groups = len(group_starts)
+        groups = np.searchsorted(group_starts, np.arange(len(rows)), side="right") - 1
+        weights = np.zeros((n_groups, len(self.names)))
+        np.add.at(weights, (groups, rows), hundred_grams)
+        return weights @ self.table
+
+    def _summary(self, totals: np.ndarray, n_items: int, kg: float, unmatched: List[str]) -> Dict[str, Any]:
+        return {
+            "items": n_items,
+            "total_weight_kg": round(kg, 3),
+            "totals": {n: round(float(v), 2) for n, v in zip(NUTRIENTS, totals)},
+            "meals_equivalent": round(float(totals[0] / KCAL_PER_MEAL), 1),
+            "person_days": {n: round(float(v), 2) for n, v in zip(NUTRIENTS, totals / DAILY_VALUES)},
+            "unmatched_items": unmatched,
+            "engine": "local"
+        }
+
+    def calculate(self, food_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Nutritional totals for one batch of food items."""
+        return self.calculate_batch([food_items])[0]
+
+    def calculate_batch(self, batches: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Totals for many batches at once (e.g. bulk recomputation of all donations)."""
+        items = [item for batch in batches for item in batch]
+        sizes = np.array([len(batch) for batch in batches], dtype=np.intp)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1])) if len(sizes) else np.zeros(0, dtype=np.intp)
+
+        rows, hundred_grams, unmatched = self.weights(items)
+        totals = self._totals_matrix(rows, hundred_grams, starts) if len(batches) else np.zeros((0, len(NUTRIENTS)))
+        kg = np.bincount(np.searchsorted(starts, np.arange(len(items)), side="right") - 1,
+                         weights=hundred_grams / 10.0, minlength=len(batches)) if items else np.zeros(len(batches))
+
+        unmatched_by_batch: List[List[str]] = [[] for _ in batches]
+        batch_of = np.searchsorted(starts, np.asarray(unmatched, dtype=np.intp), side="right") - 1
+        for i, b in zip(unmatched, batch_of):
+            unmatched_by_batch[b].append(str(items[i].get("name") or items[i].get("type") or "unknown"))
+
+        return [self._summary(totals[b], int(sizes[b]), float(kg[b]), unmatched_by_batch[b]) for b in range(len(batches))]
+
+
+@st.cache_resource
+def get_nutrition_engine(table_path: Optional[str] = None):
+    return NutritionEngine(table_path or DEFAULT_TABLE)
@@ -0,0 +1,323 @@
+import argparse
+import json
+import logging
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+import streamlit as st
+from bson import ObjectId
+from pymongo import UpdateOne
+from utils.database import get_db
+from utils.config import get_config, get_secret
+from utils.dispatch import KM_PER_DEGREE, get_dispatch_service
+from utils.geo import extract_coordinates
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """Ingests partner heartbeats: who is online, where they are, and where they have been.
+
+    `heartbeat` updates an in-memory latest-position cache (and the dispatch index, when
+    one is attached) and appends to a buffer; a flusher thread bulk-writes the buffer every
+    `flush_interval` seconds or once `batch_size` pings are waiting. Each flush keeps only
+    pings that matter: positions are downsampled to one point per `sample_seconds` or
+    `sample_metres` moved, and only those (plus availability changes) are written. Each
+    flush upserts the latest of them per partner into `partner_presence` (expired by a TTL
+    index once heartbeats stop) and `delivery_partners`, and appends them to hourly
+    per-partner buckets in `partner_locations`. The cache always holds the exact latest
+    ping. Partners silent for `online_seconds` drop out of the cache and dispatch; the
+    stored `available` flag stays as the partner set it, and readers judge whether they
+    are online by `updated_at`. Once `max_buffer` pings are waiting (say, while Mongo is
+    down), `heartbeat` refuses more so the endpoint can ask the app to retry instead of
+    dropping them.
+    """
+
+    def __init__(self, db=None, config=None, dispatch=None, batch_size: int = 2000, flush_interval: float = 1.0,
+                 max_buffer: int = 200000, online_seconds: int = 120, presence_ttl_seconds: int = 300,
+                 sample_seconds: int = 60, sample_metres: float = 100.0):
+        self.db = db or get_db()
+        self.config = config or get_config()
+        self.dispatch = dispatch
+        self.presence = self.db.get_collection(self.config.collections["partner_presence"])
+        self.partners = self.db.get_collection(self.config.collections["delivery_partners"])
+        self.locations = self.db.get_collection(self.config.collections["partner_locations"])
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.online_seconds = online_seconds
+        self.presence_ttl_seconds = presence_ttl_seconds
+        self.sample_seconds = sample_seconds
+        self.sample_km = sample_metres / 1000.0
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.latest: Dict[Any, Tuple[float, float, bool, datetime]] = {}
+        self.last_sample: Dict[Any, Tuple[float, float, datetime]] = {}
+        self.flush_lock = threading.Lock()
+        self.pending = threading.Event()
+        self.stop_event = threading.Event()
+        self.received = 0
+        self.written = 0
+        self.sampled = 0
+        self._flusher: Optional[threading.Thread] = None
+
+    def load(self) -> int:
+        """Seed the cache from partners written recently, e.g. by a process that restarted; returns how many."""
+        cutoff = datetime.now() - timedelta(seconds=self.online_seconds)
+        loaded = 0
+        for partner in self.partners.find({"updated_at": {"$gte": cutoff}}, {"location": 1, "available": 1, "updated_at": 1}):
+            point = extract_coordinates(partner)
+            if point and partner["_id"] not in self.latest:
+                self.latest[partner["_id"]] = (point[0], point[1], bool(partner.get("available")), partner["updated_at"])
+                loaded += 1
+        return loaded
+
+    def _should_sample(self, partner_id: Any, lat: float, lng: float, at: datetime) -> bool:
+        previous = self.last_sample.get(partner_id)
+        if previous is not None:
+            # Equirectangular distance is plenty for "moved more than ~100 m".
+            dlat = (lat - previous[0]) * KM_PER_DEGREE
+            dlng = (lng - previous[1]) * KM_PER_DEGREE * math.cos(math.radians(lat))
+            if (at - previous[2]).total_seconds() < self.sample_seconds and dlat * dlat + dlng * dlng < self.sample_km ** 2:
+                return False
+        self.last_sample[partner_id] = (lat, lng, at)
+        return True
+
+    def heartbeat(self, partner_id: Any, lat: float, lng: float, available: bool = True,
+                  at: Optional[datetime] = None) -> bool:
+        """Record that a partner is online at (lat, lng); `available=False` keeps them online but off dispatch.
+
+        Returns False, without recording anything, when the buffer is full.
+        """
+        if len(self.buffer) >= self.max_buffer:
+            return False
+        at = at or datetime.now()
+        lat, lng = float(lat), float(lng)
+        previous = self.latest.get(partner_id)
+        self.latest[partner_id] = (lat, lng, available, at)
+        if self.dispatch is not None:
+            self.dispatch.update_location(partner_id, lat, lng, available)
+        self.received += 1
+        sampled = self._should_sample(partner_id, lat, lng, at)
+        if sampled or previous is None or previous[2] != available:
+            self.buffer.append((partner_id, lat, lng, available, at, sampled))
+            if len(self.buffer) >= self.batch_size:
+                self.pending.set()
+        return True
+
+    def set_available(self, partner_id: Any, available: bool):
+        """Record a partner's own availability switch, without a position.
+
+        Positions only come from heartbeats; a partner with no recent heartbeat is stored
+        as available but is not offered pickups until their app reports where they are.
+        """
+        latest = self.latest.get(partner_id)
+        if latest is not None:
+            self.latest[partner_id] = (latest[0], latest[1], available, latest[3])
+        if self.dispatch is not None:
+            if available and latest is not None:
+                self.dispatch.update_location(partner_id, latest[0], latest[1])
+            elif not available:
+                self.dispatch.remove_partner(partner_id)
+        self.partners.update_one({"_id": partner_id}, {"$set": {"available": available}}, upsert=True)
+
+    def position(self, partner_id: Any) -> Optional[Tuple[float, float]]:
+        """Latest known position of a partner who is still online."""
+        latest = self.latest.get(partner_id)
+        if latest is None or (datetime.now() - latest[3]).total_seconds() > self.online_seconds:
+            return None
+        return latest[0], latest[1]
+
+    def is_available(self, partner_id: Any) -> bool:
+        latest = self.latest.get(partner_id)
+        return latest is not None and latest[2] and (datetime.now() - latest[3]).total_seconds() <= self.online_seconds
+
+    def online_partners(self, available_only: bool = True) -> Dict[Any, Tuple[float, float]]:
+        cutoff = datetime.now() - timedelta(seconds=self.online_seconds)
+        return {partner_id: (lat, lng) for partner_id, (lat, lng, available, at) in list(self.latest.items())
+                if at >= cutoff and (available or not available_only)}
+
+    def expire(self) -> int:
+        """Take partners whose heartbeats stopped off dispatch and out of the cache; returns how many."""
+        cutoff = datetime.now() - timedelta(seconds=self.online_seconds)
+        stale = [partner_id for partner_id, latest in list(self.latest.items()) if latest[3] < cutoff]
+        for partner_id in stale:
+            self.latest.pop(partner_id, None)
+            self.last_sample.pop(partner_id, None)
+            if self.dispatch is not None:
+                self.dispatch.remove_partner(partner_id)
+        return len(stale)
+
+    def _updates(self, batch: List[tuple]) -> Tuple[List[UpdateOne], List[UpdateOne], List[UpdateOne]]:
+        latest: Dict[Any, tuple] = {}
+        buckets: Dict[Tuple[Any, datetime], Dict[str, list]] = {}
+        for ping in batch:
+            partner_id, lat, lng, available, at, sampled = ping
+            if partner_id not in latest or latest[partner_id][4] <= at:
+                latest[partner_id] = ping
+            if sampled:
+                hour = at.replace(minute=0, second=0, microsecond=0)
+                bucket = buckets.setdefault((partner_id, hour), {"t": [], "lat": [], "lng": []})
+                bucket["t"].append(int((at - hour).total_seconds()))
+                bucket["lat"].append(round(lat, 5))
+                bucket["lng"].append(round(lng, 5))
+
+        # TTL indexes compare against UTC, whatever the server's local time.
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.presence_ttl_seconds)
+        presence, partners = [], []
+        for partner_id, lat, lng, available, at, _ in latest.values():
+            location = {"lat": lat, "lng": lng}
+            presence.append(UpdateOne(
+                {"_id": partner_id},
+                {"$set": {"location": location, "available": available, "last_seen": at, "expires_at": expires_at}},
+                upsert=True
+            ))
+            partners.append(UpdateOne(
+                {"_id": partner_id},
+                {"$set": {"location": location, "available": available, "updated_at": at}},
+                upsert=True
+            ))
+        # One document per partner per hour, with offsets and coordinates in parallel arrays.
+        locations = [UpdateOne(
+            {"partner_id": partner_id, "hour": hour},
+            {"$push": {"t": {"$each": bucket["t"]}, "lat": {"$each": bucket["lat"]}, "lng": {"$each": bucket["lng"]}},
+             "$inc": {"points": len(bucket["t"])}},
+            upsert=True
+        ) for (partner_id, hour), bucket in buckets.items()]
+        return presence, partners, locations
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of buffered pings written."""
+        with self.flush_lock:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size * 10:
+                batch.append(self.buffer.popleft())
+            if not batch:
+                return 0
+            presence, partners, locations = self._updates(batch)
+            try:
+                # Samples go last: a retried batch only repeats the idempotent $set writes.
+                self.presence.bulk_write(presence, ordered=False)
+                self.partners.bulk_write(partners, ordered=False)
+                if locations:
+                    self.locations.bulk_write(locations, ordered=False)
+            except Exception as e:
+                logger.error(f"Writing {len(batch)} partner heartbeats failed: {str(e)}")
+                self.buffer.extendleft(reversed(batch))
+                return 0
+            self.written += len(batch)
+            self.sampled += sum(1 for ping in batch if ping[5])
+            return len(batch)
+
+    def _run(self):
+        last_expired = datetime.now()
+        while not self.stop_event.is_set():
+            self.pending.wait(self.flush_interval)
+            self.pending.clear()
+            while self.flush() >= self.batch_size:
+                pass
+            if (datetime.now() - last_expired).total_seconds() >= self.online_seconds / 4:
+                self.expire()
+                last_expired = datetime.now()
+        self.flush()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name="partner-presence", daemon=True)
+            self._flusher.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.pending.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+
+class HeartbeatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        token = self.server.token
+        if token and self.headers.get("Authorization") != f"Bearer {token}":
+            self._reply(403)
+            return
+        try:
+            pings = json.loads(body)
+            for ping in pings if isinstance(pings, list) else [pings]:
+                partner_id = ping["partner_id"]
+                if ObjectId.is_valid(str(partner_id)):
+                    partner_id = ObjectId(str(partner_id))
+                if not self.server.tracker.heartbeat(partner_id, ping["lat"], ping["lng"],
+                                                     bool(ping.get("available", True))):
+                    self._reply(503)
+                    return
+        except (ValueError, TypeError, KeyError):
+            self._reply(400)
+            return
+        self._reply(204)
+
+
+class HeartbeatServer(ThreadingHTTPServer):
+    """HTTP endpoint for partner apps: POST a JSON ping `{partner_id, lat, lng, available}` or a list of them.
+
+    With a `token`, requests must carry `Authorization: Bearer <token>`. Without one it
+    only accepts a loopback address, so it cannot be opened to the network by accident.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, tracker: PresenceTracker, token: Optional[str] = None):
+        if not token and address[0] not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError("Set PRESENCE_API_TOKEN before listening on a non-loopback address")
+        super().__init__(address, HeartbeatHandler)
+        self.tracker = tracker
+        self.token = token
+
+
+@st.cache_resource
+def get_presence_tracker():
+    tracker = PresenceTracker(
+        dispatch=get_dispatch_service(),
+        online_seconds=int(get_secret("PARTNER_ONLINE_SECONDS") or 120)
+    )
+    tracker.load()
+    tracker.start()
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive delivery partner location heartbeats")
+    parser.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to accept partner apps directly (needs PRESENCE_API_TOKEN)")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    tracker = PresenceTracker(batch_size=args.batch_size, flush_interval=args.flush_interval,
+                              online_seconds=int(get_secret("PARTNER_ONLINE_SECONDS") or 120))
+    tracker.load()
+    tracker.start()
+    server = HeartbeatServer((args.host, args.port), tracker, get_secret("PRESENCE_API_TOKEN"))
+    logger.info(f"Listening for partner heartbeats on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        tracker.stop()
+
+
+if __name__ == "__main__":
+    main()
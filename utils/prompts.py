@@ -0,0 +1,355 @@
+import json
+import math
+from collections import Counter
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional, Iterable
+from bson import ObjectId
+from langchain_core.messages import HumanMessage, SystemMessage
+
+CHARS_PER_TOKEN = 4
+
+# Fields each agent actually needs from the documents it embeds. Everything else
+# (`created_at`, phone numbers, internal flags, ...) is dropped before serialization.
+FIELD_PROJECTIONS = {
+    "recipients": ["recipient_id", "name", "score", "distance_km", "capacity", "needs"],
+    "waste_users": ["_id", "name", "business_type", "waste_types", "capacity", "location.address"],
+    "local_produce": ["name", "category", "price", "season", "supplier"],
+    "hunger_hotspots": ["location", "region", "time_period", "severity_index", "severity", "latitude", "longitude"],
+    "trends": ["_id", "count"]
+}
+
+# Default per-call token budgets for the user prompt of each agent.
+TOKEN_BUDGETS = {
+    "match_surplus_food": 1200,
+    "create_waste_exchange": 1500,
+    "generate_meal_plan": 1500,
+    "regenerate_meal_plan_part": 900,
+    "personalize_meal_plan": 700,
+    "predict_hunger_hotspots": 2500
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) good enough for budgeting."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _compact_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _compact_value(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_compact_value(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def _get_path(document: Dict[str, Any], path: str) -> Any:
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def project(document: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Keep only `fields` (dotted paths allowed) and make values JSON friendly."""
+    projected = {}
+    for field in fields:
+        value = _get_path(document, field)
+        if value in (None, "", [], {}):
+            continue
+        projected[field.split(".")[-1] if "." in field else field] = _compact_value(value)
+    return projected
+
+
+def to_json(value: Any) -> str:
+    """Minified JSON without whitespace between separators."""
+    return json.dumps(_compact_value(value), separators=(",", ":"), ensure_ascii=False)
+
+
+def to_rows(records: List[Dict[str, Any]], fields: List[str]) -> List[str]:
+    """Pipe-separated header plus one row per record; lists are joined with `;`."""
+    columns = [f.split(".")[-1] for f in fields]
+    rows = ["|".join(columns)]
+    for record in records:
+        cells = []
+        for column in columns:
+            value = record.get(column, "")
+            if isinstance(value, list):
+                value = ";".join(str(v) for v in value)
+            elif isinstance(value, dict):
+                value = to_json(value)
+            cells.append(str(value).replace("|", "/").replace("\n", " "))
+        rows.append("|".join(cells))
+    return rows
+
+
+class Prompt:
+    """A built prompt with its token estimate."""
+
+    def __init__(self, agent: str, system: str, user: str, truncated: Optional[Dict[str, int]] = None):
+        self.agent = agent
+        self.system = system
+        self.user = user
+        self.truncated = truncated or {}
+        self.estimated_tokens = estimate_tokens(system) + estimate_tokens(user)
+
+    def messages(self) -> list:
+        return [SystemMessage(content=self.system), HumanMessage(content=self.user)]
+
+
+class PromptBuilder:
+    """Assemble a compact user prompt under a per-call token budget.
+
+    Plain text sections are always kept; record lists are projected, serialized as rows
+    (or minified JSON) and truncated to whatever budget remains, with a one-line summary
+    of what was left out.
+    """
+
+    def __init__(self, agent: str, token_budget: Optional[int] = None):
+        self.agent = agent
+        self.token_budget = token_budget or TOKEN_BUDGETS.get(agent, 1500)
+        self.sections: List[str] = []
+        self.truncated: Dict[str, int] = {}
+
+    @property
+    def used_tokens(self) -> int:
+        return estimate_tokens("\n".join(self.sections))
+
+    @property
+    def remaining_tokens(self) -> int:
+        return max(self.token_budget - self.used_tokens, 0)
+
+    def add_text(self, text: str) -> "PromptBuilder":
+        self.sections.append(text.strip())
+        return self
+
+    def add_fields(self, title: str, document: Dict[str, Any], fields: Dict[str, str]) -> "PromptBuilder":
+        """Add `- Label: value` lines for the given {label: path} mapping."""
+        lines = [f"{title}:"]
+        for label, path in fields.items():
+            value = _get_path(document, path)
+            if isinstance(value, (list, tuple)):
+                value = ", ".join(str(v) for v in value) or "None"
+            lines.append(f"- {label}: {value if value not in (None, '') else 'N/A'}")
+        return self.add_text("\n".join(lines))
+
+    def add_value(self, title: str, value: Any) -> "PromptBuilder":
+        return self.add_text(f"{title}:\n{to_json(value)}")
+
+    def add_records(
+        self,
+        title: str,
+        records: List[Dict[str, Any]],
+        fields: List[str],
+        fmt: str = "rows",
+        summarize_by: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        empty: str = "None available"
+    ) -> "PromptBuilder":
+        """Add a projected list of records, truncated to fit the remaining budget."""
+        if not records:
+            return self.add_text(f"{title}:\n{empty}")
+
+        projected = [project(r, fields) for r in records]
+        header = f"{title}:"
+        budget = min(self.remaining_tokens if max_tokens is None else max_tokens, self.remaining_tokens) - estimate_tokens(header) - 16
+
+        if fmt == "rows":
+            lines = to_rows(projected, fields)
+            head, body = lines[:1], lines[1:]
+        else:
+            head, body = [], [to_json(p) for p in projected]
+
+        kept, used = [], estimate_tokens("\n".join(head))
+        for line in body:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+
+        text = "\n".join([header] + head + kept)
+        omitted = len(body) - len(kept)
+        if omitted:
+            self.truncated[title] = omitted
+            summary = f"(+{omitted} more omitted"
+            if summarize_by:
+                counts = Counter(str(p.get(summarize_by.split(".")[-1], "other")) for p in projected[len(kept):])
+                summary += ": " + ", ".join(f"{k} x{v}" for k, v in counts.most_common(8))
+            text += "\n" + summary + ")"
+        return self.add_text(text)
+
+    def build(self, system: str) -> Prompt:
+        return Prompt(self.agent, system.strip(), "\n\n".join(self.sections), self.truncated)
+
+
+MATCH_SYSTEM_PROMPT = """You are an AI that matches surplus food donations with organizations that can use them.
+Analyze the food donation details and match it with the most suitable recipient based on their needs,
+capacity, and location proximity. Candidates are pre-ranked by a compatibility score.
+
+Respond in valid JSON format: {"recipient_id": "...", "justification": "..."}"""
+
+WASTE_EXCHANGE_SYSTEM_PROMPT = """You are an AI that facilitates waste exchange between businesses. Analyze the waste material
+and match it with businesses that can repurpose it. Provide details on how the waste can be transformed
+and used by the receiving business.
+
+Respond in valid JSON format: {"user_id": "...", "justification": "...", "repurposing": "..."}"""
+
+MEAL_PLAN_SYSTEM_PROMPT = """You are a nutritionist AI that creates personalized meal plans. Generate a 7-day meal plan
+with breakfast, lunch, and dinner options that match the user's preferences and use locally available produce.
+
+Respond in valid JSON format with this structure:
+{
+  "days": {
+    "Monday": {
+      "breakfast": {"name": "...", "description": "...", "ingredients": ["..."],
+                    "nutrition": {"calories": ..., "protein": ..., "carbs": ..., "fat": ...}},
+      "lunch": {...},
+      "dinner": {...}
+    },
+    // ... other days
+  },
+  "shopping_list": ["...", "..."],
+  "nutritional_summary": {"weekly_calories": ..., "weekly_protein": ..., // ... other metrics
+  }
+}"""
+
+MEAL_PLAN_PART_SYSTEM_PROMPT = """You are a nutritionist AI that regenerates part of an existing meal plan.
+Replace only the requested day or meal. Keep it consistent with the user's profile, avoid repeating
+meals already in the plan, and prefer locally available produce.
+
+Respond in valid JSON. For a single meal:
+{"name": "...", "description": "...", "ingredients": ["..."], "nutrition": {"calories": ..., "protein": ..., "carbs": ..., "fat": ...}}
+For a whole day: {"breakfast": {...}, "lunch": {...}, "dinner": {...}}"""
+
+MEAL_PLAN_PERSONALIZE_SYSTEM_PROMPT = """You are a nutritionist AI that personalizes a shared meal plan for one user.
+The plan was written for a group with the same preferences, allergies and goals. Adjust only meals that
+do not suit this user's exact age, gender or activity level; change as few meals as possible.
+
+Respond in valid JSON with only the changed meals (an empty object if nothing needs to change):
+{"days": {"Monday": {"dinner": {"name": "...", "description": "...", "ingredients": ["..."], "nutrition": {...}}}}}"""
+
+HOTSPOTS_SYSTEM_PROMPT = """You are an AI that predicts areas at risk of food insecurity. Analyze the historical data
+and current conditions to identify potential hunger hotspots. Consider factors like food supply, demand,
+economic conditions, and seasonal patterns.
+
+Respond in valid JSON format: {"hotspots": [{"location": "...", "latitude": ..., "longitude": ..., "severity": ...}]}"""
+
+USER_PROFILE_FIELDS = {
+    "Age": "age",
+    "Gender": "gender",
+    "Dietary Preferences": "dietary_preferences",
+    "Allergies": "allergies",
+    "Health Goals": "health_goals",
+    "Activity Level": "activity_level"
+}
+
+
+def match_prompt(food_donation: Dict[str, Any], candidates: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Prompt:
+    builder = PromptBuilder("match_surplus_food", token_budget)
+    builder.add_fields("Food Donation Details", food_donation, {
+        "Type": "type",
+        "Quantity": "quantity",
+        "Expiry Date": "expiry_date",
+        "Location": "location.address",
+        "Special Requirements": "special_requirements"
+    })
+    builder.add_records("Top Candidate Recipients", candidates, FIELD_PROJECTIONS["recipients"])
+    builder.add_text("Please select the best match and provide a justification for your choice.")
+    return builder.build(MATCH_SYSTEM_PROMPT)
+
+
+def waste_exchange_prompt(waste_material: Dict[str, Any], potential_users: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Prompt:
+    builder = PromptBuilder("create_waste_exchange", token_budget)
+    builder.add_fields("Waste Material Details", waste_material, {
+        "Type": "type",
+        "Quantity": "quantity",
+        "Composition": "composition",
+        "Location": "location.address"
+    })
+    builder.add_records("Potential Users", potential_users, FIELD_PROJECTIONS["waste_users"], summarize_by="business_type")
+    builder.add_text("Please select the best match and explain how the waste can be repurposed.")
+    return builder.build(WASTE_EXCHANGE_SYSTEM_PROMPT)
+
+
+def meal_plan_prompt(user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Prompt:
+    builder = PromptBuilder("generate_meal_plan", token_budget)
+    builder.add_fields("User Profile", user_profile, USER_PROFILE_FIELDS)
+    instructions = """Create a detailed meal plan that:
+1. Matches the user's dietary needs and goals
+2. Uses locally available ingredients when possible
+3. Provides balanced nutrition
+4. Includes a shopping list
+5. Provides nutritional information for each meal"""
+    builder.add_records(
+        "Available Local Produce", local_produce, FIELD_PROJECTIONS["local_produce"],
+        summarize_by="category", max_tokens=builder.remaining_tokens - estimate_tokens(instructions)
+    )
+    builder.add_text(instructions)
+    return builder.build(MEAL_PLAN_SYSTEM_PROMPT)
+
+
+def meal_plan_part_prompt(user_profile: Dict[str, Any], local_produce: List[Dict[str, Any]], days: Dict[str, Any],
+                          day: str, meal: Optional[str] = None, token_budget: Optional[int] = None) -> Prompt:
+    """Prompt for regenerating one day or one meal, with the rest of the plan as meal names only."""
+    builder = PromptBuilder("regenerate_meal_plan_part", token_budget)
+    builder.add_fields("User Profile", user_profile, USER_PROFILE_FIELDS)
+
+    context = []
+    for name, meals in days.items():
+        if not isinstance(meals, dict):
+            continue
+        for slot, details in meals.items():
+            if (name, slot) == (day, meal) or (name == day and meal is None) or not isinstance(details, dict):
+                continue
+            context.append(f"{name} {slot}: {details.get('name', 'N/A')}")
+    builder.add_text("Rest of the plan (do not repeat):\n" + "\n".join(context or ["None"]))
+
+    target = f"{day} {meal}" if meal else f"{day} (all meals)"
+    instructions = f"Regenerate: {target}"
+    builder.add_records(
+        "Available Local Produce", local_produce, ["name", "category"],
+        summarize_by="category", max_tokens=builder.remaining_tokens - estimate_tokens(instructions)
+    )
+    builder.add_text(instructions)
+    return builder.build(MEAL_PLAN_PART_SYSTEM_PROMPT)
+
+
+def meal_plan_personalize_prompt(user_profile: Dict[str, Any], segment_profile: Dict[str, Any], days: Dict[str, Any],
+                                 token_budget: Optional[int] = None) -> Prompt:
+    """Prompt for a small delta on a segment plan; the plan is sent as meal names and calories only."""
+    builder = PromptBuilder("personalize_meal_plan", token_budget)
+    builder.add_fields("User Profile", user_profile, USER_PROFILE_FIELDS)
+    builder.add_fields("Plan Written For", segment_profile, {"Age Band": "age_band", "Activity Level": "activity_level"})
+
+    outline = []
+    for name, meals in days.items():
+        if not isinstance(meals, dict):
+            continue
+        for slot, details in meals.items():
+            if isinstance(details, dict):
+                calories = details.get("nutrition", {}).get("calories", "?")
+                outline.append(f"{name} {slot}: {details.get('name', 'N/A')} ({calories} kcal)")
+    builder.add_text("Current Plan:\n" + "\n".join(outline or ["None"]))
+    builder.add_text("Return only the meals that should change for this user.")
+    return builder.build(MEAL_PLAN_PERSONALIZE_SYSTEM_PROMPT)
+
+
+def hotspots_prompt(historical_data: List[Dict[str, Any]], current_data: Dict[str, Any], token_budget: Optional[int] = None) -> Prompt:
+    builder = PromptBuilder("predict_hunger_hotspots", token_budget)
+    instructions = "Please identify potential hunger hotspots and predict the severity of food insecurity in each area."
+    builder.add_text(f"Current Period: {current_data.get('time_period', 'N/A')}")
+    share = max((builder.remaining_tokens - estimate_tokens(instructions)) // 3, 0)
+    builder.add_records("Historical Data", historical_data, FIELD_PROJECTIONS["hunger_hotspots"], max_tokens=share)
+    for title, key in (("Donation Trends", "donation_trends"), ("Request Trends", "request_trends")):
+        trends = sorted(current_data.get(key, []), key=lambda t: t.get("count", 0), reverse=True)
+        builder.add_records(title, trends, FIELD_PROJECTIONS["trends"], max_tokens=share)
+    builder.add_text(instructions)
+    return builder.build(HOTSPOTS_SYSTEM_PROMPT)
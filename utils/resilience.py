@@ -0,0 +1,454 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from pymongo import ReturnDocument
+
+from utils.prompts import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a token bucket cannot grant capacity before the deadline."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish within its time budget."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls fail fast."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Take `amount` tokens if available; otherwise return the seconds to wait."""
+        with self.lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, amount: float = 1, timeout: Optional[float] = None) -> None:
+        """Block until `amount` tokens are granted or raise RateLimitExceeded."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0.0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit: {amount} tokens not available within {timeout:.1f}s")
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, amount: float = 1, timeout: Optional[float] = None) -> None:
+        """Like `acquire`, but waits without blocking the event loop."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0.0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit: {amount} tokens not available within {timeout:.1f}s")
+            await asyncio.sleep(min(wait, 1.0))
+
+    def consume(self, amount: float) -> None:
+        """Debit tokens after the fact (e.g. actual completion tokens); may go negative."""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class SharedRateLimiter:
+    """Fixed-window limit of `limit` calls per `window` seconds, shared through a Mongo collection.
+
+    Every process using the same collection and `key` draws from one counter per window,
+    so app workers and standalone workers together stay under the limit. Counter documents
+    carry an `expires_at` for the collection's TTL index.
+    """
+
+    def __init__(self, collection, key: str, limit: float, window: float = 1.0, clock: Callable[[], float] = time.time):
+        self.collection = collection
+        self.key = key
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Count `amount` calls in the current window if it has room; otherwise return the seconds to wait."""
+        now = self.clock()
+        window_start = math.floor(now / self.window) * self.window
+        counter = self.collection.find_one_and_update(
+            {"_id": f"{self.key}:{window_start:.3f}"},
+            {"$inc": {"count": amount},
+             "$setOnInsert": {"expires_at": datetime.fromtimestamp(window_start) + timedelta(seconds=self.window + 60)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if counter["count"] <= self.limit:
+            return 0.0
+        return max(window_start + self.window - now, 0.001)
+
+    def acquire(self, amount: float = 1, timeout: Optional[float] = None) -> None:
+        """Block until the call fits in a window or raise RateLimitExceeded."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0.0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit: {amount} calls not available within {timeout:.1f}s")
+            # Spread retries so waiters from every process do not all hit the next window at once.
+            time.sleep(min(wait + random.uniform(0, self.window / 10), 1.0))
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker keyed on consecutive failures."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Closed: allow. Half-open: allow one probe (re-arms the timer). Open: reject."""
+        with self.lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                self.opened_at = self.clock()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = self.clock()
+
+
+def _messages_key(messages: Any) -> str:
+    if isinstance(messages, (list, tuple)):
+        text = "\x1e".join(f"{getattr(m, 'type', '')}:{getattr(m, 'content', m)}" for m in messages)
+    else:
+        text = str(messages)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _messages_tokens(messages: Any) -> int:
+    if isinstance(messages, (list, tuple)):
+        return sum(estimate_tokens(str(getattr(m, "content", m))) for m in messages)
+    return estimate_tokens(str(messages))
+
+
+def _join_chunks(chunks: list) -> Any:
+    if not chunks:
+        return None
+    response = chunks[0]
+    for chunk in chunks[1:]:
+        response = response + chunk
+    return response
+
+
+class _Call:
+    """Cache key, deadline and last error of one logical call across its attempts."""
+
+    def __init__(self, messages: Any, budget: float, info: Optional[dict] = None):
+        self.info = info if info is not None else {}
+        self.key = _messages_key(messages)
+        self.prompt_tokens = _messages_tokens(messages)
+        self.budget = budget
+        self.deadline = time.monotonic() + budget
+        self.error: Exception = DeadlineExceeded("LLM call deadline exceeded")
+        self.delay = 0.0
+
+    def remaining(self) -> float:
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM call deadline exceeded")
+        return remaining
+
+
+class ResilientLLM:
+    """Wrap a LangChain chat model with rate limiting, deadlines, retries and a breaker.
+
+    `invoke` has the same shape as the wrapped model's, so any chat model (including a
+    local fake) can sit underneath. When the upstream keeps failing or the breaker is
+    open, the last good response for an identical prompt is served if one is cached;
+    otherwise the error propagates so callers can fall back to a heuristic.
+
+    A call that misses its deadline cannot be interrupted and keeps its executor thread
+    until the model returns, so the pool has `max_abandoned` threads on top of
+    `max_workers` to absorb them. When every thread is held by an abandoned call, calls
+    fail fast instead of queueing behind them; give the wrapped model its own request
+    timeout so abandoned calls do end.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 1_000_000,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        cache_size: int = 256,
+        max_workers: int = 8,
+        max_abandoned: Optional[int] = None
+    ):
+        self.llm = llm
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Any]" = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.max_abandoned = max_workers if max_abandoned is None else max_abandoned
+        self.abandoned = 0
+        self.abandoned_lock = threading.Lock()
+        self.pool_size = max_workers + self.max_abandoned
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="llm-call")
+
+    def __getattr__(self, name):
+        # Delegate everything else (model name, bind, ...) to the wrapped model.
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _remember(self, key: str, response: Any):
+        with self.cache_lock:
+            self.cache[key] = response
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def cached(self, messages: Any) -> Optional[Any]:
+        with self.cache_lock:
+            return self.cache.get(_messages_key(messages))
+
+    def _fallback(self, call: _Call) -> Any:
+        with self.cache_lock:
+            response = self.cache.get(call.key)
+        if response is not None:
+            logger.warning(f"LLM unavailable ({call.error}); serving cached response")
+            call.info["cache_hit"] = True
+            return response
+        raise call.error
+
+    def _submit(self, fn: Callable, *args, **kwargs):
+        with self.abandoned_lock:
+            if self.abandoned >= self.pool_size:
+                raise DeadlineExceeded(f"{self.abandoned} timed-out LLM calls are still running")
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def _result(self, future, call: _Call) -> Any:
+        """Wait for `future` until the call's deadline; a call still running then is abandoned."""
+        try:
+            return future.result(timeout=max(call.deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            if not future.cancel():
+                with self.abandoned_lock:
+                    self.abandoned += 1
+                future.add_done_callback(self._release)
+            raise DeadlineExceeded(f"LLM call exceeded {call.budget:.1f}s budget")
+
+    async def _aresult(self, awaitable, call: _Call) -> Any:
+        try:
+            return await asyncio.wait_for(awaitable, timeout=max(call.deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"LLM call exceeded {call.budget:.1f}s budget")
+
+    def _release(self, future):
+        with self.abandoned_lock:
+            self.abandoned -= 1
+
+    def _acquire(self, call: _Call):
+        self.request_bucket.acquire(1, timeout=call.remaining())
+        self.token_bucket.acquire(call.prompt_tokens, timeout=call.remaining())
+
+    async def _aacquire(self, call: _Call):
+        await self.request_bucket.aacquire(1, timeout=call.remaining())
+        await self.token_bucket.aacquire(call.prompt_tokens, timeout=call.remaining())
+
+    # The sync and async call paths below differ only in how they wait; the retry
+    # policy lives in `_attempts`, `_failed`, `_succeeded` and `_fallback`.
+
+    def _attempts(self, call: _Call) -> Iterator[int]:
+        """Yield attempt numbers for as long as the breaker lets calls through."""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                call.error = CircuitOpenError("LLM circuit breaker is open")
+                return
+            call.info["attempts"] = attempt + 1
+            yield attempt
+
+    def _failed(self, call: _Call, attempt: int, error: Exception) -> bool:
+        """Record a failed attempt; True if the caller should sleep `call.delay` and retry."""
+        call.error = error
+        if isinstance(error, RateLimitExceeded):
+            # Local throttling says nothing about upstream health.
+            return False
+        self.breaker.record_failure()
+        logger.warning(f"LLM call failed (attempt {attempt + 1}/{self.max_retries + 1}): {error}")
+        call.delay = self._backoff(attempt)
+        return attempt < self.max_retries and time.monotonic() + call.delay < call.deadline
+
+    def _succeeded(self, call: _Call, response: Any) -> Any:
+        self.breaker.record_success()
+        if response is not None:
+            usage = getattr(response, "usage_metadata", None) or {}
+            if usage.get("output_tokens"):
+                self.token_bucket.consume(usage["output_tokens"])
+            self._remember(call.key, response)
+        return response
+
+    def invoke(self, messages: Any, timeout: Optional[float] = None, info: Optional[dict] = None, **kwargs) -> Any:
+        """Call the model; `info`, if given, is filled with attempts and cache_hit."""
+        call = _Call(messages, timeout or self.timeout, info)
+        for attempt in self._attempts(call):
+            try:
+                self._acquire(call)
+                response = self._result(self._submit(self.llm.invoke, messages, **kwargs), call)
+            except Exception as e:
+                if not self._failed(call, attempt, e):
+                    break
+                time.sleep(call.delay)
+                continue
+            return self._succeeded(call, response)
+        return self._fallback(call)
+
+    async def ainvoke(self, messages: Any, timeout: Optional[float] = None, info: Optional[dict] = None, **kwargs) -> Any:
+        """Async `invoke` on the wrapped model's `ainvoke`, sharing limits, breaker and cache."""
+        call = _Call(messages, timeout or self.timeout, info)
+        for attempt in self._attempts(call):
+            try:
+                await self._aacquire(call)
+                response = await self._aresult(self.llm.ainvoke(messages, **kwargs), call)
+            except Exception as e:
+                if not self._failed(call, attempt, e):
+                    break
+                await asyncio.sleep(call.delay)
+                continue
+            return self._succeeded(call, response)
+        return self._fallback(call)
+
+    def stream(self, messages: Any, timeout: Optional[float] = None, info: Optional[dict] = None, **kwargs) -> Iterator[Any]:
+        """Stream chunks from the model behind the same limiter, deadline and breaker.
+
+        Chunks are pulled through the executor, so a connection that hangs before or
+        between chunks still hits the deadline. Failures before the first chunk are retried
+        like `invoke`; after that they propagate. When retries run out, the cached response
+        for the prompt (if any) is yielded as a single chunk.
+        """
+        call = _Call(messages, timeout or self.timeout, info)
+        for attempt in self._attempts(call):
+            chunks = []
+            try:
+                self._acquire(call)
+                iterator = self._result(self._submit(lambda: iter(self.llm.stream(messages, **kwargs))), call)
+                while True:
+                    chunk = self._result(self._submit(next, iterator, _END_OF_STREAM), call)
+                    if chunk is _END_OF_STREAM:
+                        break
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                if chunks:
+                    self.breaker.record_failure()
+                    raise
+                if not self._failed(call, attempt, e):
+                    break
+                time.sleep(call.delay)
+                continue
+            self._succeeded(call, _join_chunks(chunks))
+            return
+        yield self._fallback(call)
+
+    async def astream(self, messages: Any, timeout: Optional[float] = None, info: Optional[dict] = None, **kwargs) -> AsyncIterator[Any]:
+        """Async `stream` on the wrapped model's `astream`."""
+        call = _Call(messages, timeout or self.timeout, info)
+        for attempt in self._attempts(call):
+            chunks = []
+            try:
+                await self._aacquire(call)
+                iterator = self.llm.astream(messages, **kwargs).__aiter__()
+                while True:
+                    try:
+                        chunk = await self._aresult(iterator.__anext__(), call)
+                    except StopAsyncIteration:
+                        break
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                if chunks:
+                    self.breaker.record_failure()
+                    raise
+                if not self._failed(call, attempt, e):
+                    break
+                await asyncio.sleep(call.delay)
+                continue
+            self._succeeded(call, _join_chunks(chunks))
+            return
+        yield self._fallback(call)
@@ -0,0 +1,408 @@
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from utils.geo import extract_coordinates, haversine_matrix
+from utils.matching import CAPACITY_FIELDS, _days_until
+from utils.units import parse_quantity_kg
+
+DEFAULT_CAPACITY_KG = 50.0
+DEFAULT_LOAD_KG = 1.0
+_EPS = 1e-9
+
+
+def donation_job(donation: Dict[str, Any], recipient: Optional[Dict[str, Any]], onboard: bool = False,
+                 now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Turn a matched donation and its recipient into a pickup/drop-off job for the planner.
+
+    `onboard` jobs were already picked up by the partner and only need the drop-off.
+    The deadline is the end of the donation's expiry date.
+    """
+    days_left = _days_until(donation.get("expiry_date"), now)
+    return {
+        "id": donation.get("_id"),
+        "pickup": None if onboard else extract_coordinates(donation),
+        "dropoff": extract_coordinates(recipient),
+        "load_kg": parse_quantity_kg(donation.get("quantity"), DEFAULT_LOAD_KG),
+        "deadline": None if days_left is None else (now or datetime.now()) + timedelta(days=days_left),
+        "onboard": onboard,
+        "pickup_address": (donation.get("location") or {}).get("address"),
+        "dropoff_address": (recipient or {}).get("address") or ((recipient or {}).get("location") or {}).get("address")
+    }
+
+
+def partner_capacity_kg(partner: Optional[Dict[str, Any]]) -> float:
+    for field in CAPACITY_FIELDS:
+        if (partner or {}).get(field) is not None:
+            value = parse_quantity_kg(partner[field])
+            if value:
+                return value
+    return DEFAULT_CAPACITY_KG
+
+
+def _range_extreme(values: np.ndarray, accumulate, fill: float) -> np.ndarray:
+    """out[a, b] = accumulate over values[a..b] for a <= b, e.g. the max load between two positions."""
+    index = np.arange(len(values))
+    return accumulate(np.where(index[None, :] >= index[:, None], values[None, :], fill), axis=1)
+
+
+class RoutePlanner:
+    """Single-vehicle pickup-and-delivery routing for a delivery partner.
+
+    Stops are first ordered with Clarke-Wright savings over pickup→drop-off pairs, or by
+    earliest deadline when that is less late, then improved with 2-opt and or-opt moves.
+    Each kind of move is scored for all positions at once on the haversine distance
+    matrix, with moves that break precedence or capacity masked out; or-opt only tries a
+    stop's nearest neighbours. Arrivals after a job's deadline count as lateness, which a
+    move may never increase; jobs still late at the end are left unassigned.
+    """
+
+    def __init__(self, speed_kmh: float = 20.0, service_minutes: float = 5.0, time_limit: float = 0.5,
+                 candidates_per_round: int = 64, max_segment: int = 3, neighbours: int = 12, moves_per_pass: int = 4):
+        self.speed_kmh = speed_kmh
+        self.service_minutes = service_minutes
+        self.time_limit = time_limit
+        self.candidates_per_round = candidates_per_round
+        self.max_segment = max_segment
+        self.neighbours = neighbours
+        # More moves per pass is faster but tends to settle in a slightly longer route.
+        self.moves_per_pass = moves_per_pass
+
+    def plan(self, start: Optional[Tuple[float, float]], jobs: List[Dict[str, Any]],
+             capacity_kg: float = DEFAULT_CAPACITY_KG, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Order the stops for `jobs` starting from `start` (lat, lng); None starts at the first stop."""
+        now = now or datetime.now()
+        accepted, unassigned = self._screen(jobs, capacity_kg, now)
+        if not accepted:
+            return self._result([], accepted, None, now, unassigned)
+
+        problem = self._problem(start, accepted, capacity_kg, now)
+        deadline = time.perf_counter() + self.time_limit
+        route = min((self._savings_route(problem), self._deadline_route(problem)),
+                    key=lambda r: self._evaluate(problem, r)[::-1])
+        route = self._improve(problem, route, deadline)
+
+        # Drop the latest job until everything arrives in time; removing stops never delays the others.
+        while True:
+            lateness = self._lateness(problem, route)
+            if lateness.max(initial=0.0) <= _EPS:
+                break
+            worst = problem["job_of"][route[1:-1][np.argmax(lateness)]]
+            unassigned.append({"job_id": accepted[worst]["id"], "reason": "cannot be delivered before it expires"})
+            route = route[problem["job_of"][route] != worst]
+        return self._result(route, accepted, problem, now, unassigned)
+
+    def _screen(self, jobs: List[Dict[str, Any]], capacity_kg: float, now: datetime):
+        accepted, unassigned = [], []
+        for job in jobs:
+            reason = None
+            if job.get("dropoff") is None:
+                reason = "recipient has no location"
+            elif not job.get("onboard") and job.get("pickup") is None:
+                reason = "donation has no location"
+            elif not job.get("onboard") and (job.get("load_kg") or 0) > capacity_kg:
+                reason = "larger than the partner's capacity"
+            elif job.get("deadline") is not None and job["deadline"] <= now:
+                reason = "already expired"
+            if reason:
+                unassigned.append({"job_id": job.get("id"), "reason": reason})
+            else:
+                accepted.append(job)
+        return accepted, unassigned
+
+    def _problem(self, start, jobs: List[Dict[str, Any]], capacity_kg: float, now: datetime) -> Dict[str, Any]:
+        # Node 0 is the partner, then each job's pickup (unless on board) and drop-off, and a
+        # final dummy node at zero distance from everything so the route is an open path.
+        points, demand, deadline, job_of, pickup_of = [start or (0.0, 0.0)], [0.0], [np.inf], [-1], [-1]
+        pickups, drops = [], []
+        onboard_load = 0.0
+        for j, job in enumerate(jobs):
+            load = float(job.get("load_kg") or DEFAULT_LOAD_KG)
+            due = np.inf if job.get("deadline") is None else (job["deadline"] - now).total_seconds() / 60.0
+            pickup = -1
+            if job.get("onboard"):
+                onboard_load += load
+            else:
+                pickup = len(points)
+                points.append(job["pickup"])
+                demand.append(load)
+                deadline.append(due)
+                job_of.append(j)
+                pickup_of.append(-1)
+            drop = len(points)
+            points.append(job["dropoff"])
+            demand.append(-load)
+            deadline.append(due)
+            job_of.append(j)
+            pickup_of.append(pickup)
+            if pickup >= 0:
+                pickups.append(pickup)
+                drops.append(drop)
+
+        n = len(points)
+        distance = np.zeros((n + 1, n + 1))
+        distance[:n, :n] = haversine_matrix(np.array(points))
+        if start is None:
+            distance[0, :] = 0.0
+            distance[:, 0] = 0.0
+        # Nearest other stops of every stop, the only places or-opt tries to move a segment next to.
+        neighbours = min(self.neighbours, n - 2)
+        nearest = np.zeros((n + 1, neighbours), dtype=int)
+        if neighbours > 0:
+            stops = distance[1:n, 1:n] + np.diag(np.full(n - 1, np.inf))
+            nearest[1:n] = 1 + np.argpartition(stops, neighbours - 1, axis=1)[:, :neighbours]
+        return {
+            "distance": distance,
+            "demand": np.array(demand + [0.0]),
+            "deadline": np.array(deadline + [np.inf]),
+            "job_of": np.array(job_of + [-1]),
+            "pickup_of": np.array(pickup_of + [-1]),
+            "pickups": np.array(pickups, dtype=int),
+            "drops": np.array(drops, dtype=int),
+            "onboard_load": onboard_load,
+            "capacity": max(capacity_kg, onboard_load),
+            "end": n,
+            "nearest": nearest
+        }
+
+    def _onboard_drops(self, problem: Dict[str, Any]) -> List[int]:
+        # Deliver what is already on board first, nearest next, so capacity is free for new pickups.
+        distance = problem["distance"]
+        remaining = [i for i in range(1, problem["end"]) if problem["pickup_of"][i] < 0 and problem["demand"][i] < 0]
+        order, current = [], 0
+        while remaining:
+            current = min(remaining, key=lambda i: distance[current, i])
+            remaining.remove(current)
+            order.append(current)
+        return order
+
+    def _savings_route(self, problem: Dict[str, Any]) -> np.ndarray:
+        distance = problem["distance"]
+        pickups, drops = problem["pickups"], problem["drops"]
+        m = len(pickups)
+        head = list(range(m))
+        successor, predecessor = [-1] * m, [-1] * m
+        if m > 1:
+            # Saving of driving drop-off a → pickup b directly instead of via the partner's position.
+            savings = distance[drops, 0][:, None] + distance[0, pickups][None, :] - distance[drops[:, None], pickups[None, :]]
+            np.fill_diagonal(savings, -np.inf)
+            flat = np.flatnonzero(savings > _EPS)
+            for index in flat[np.argsort(-savings.ravel()[flat], kind="stable")]:
+                a, b = divmod(int(index), m)
+                if successor[a] >= 0 or predecessor[b] >= 0 or head[a] == b:
+                    continue
+                successor[a], predecessor[b] = b, a
+                new_head, j = head[a], b
+                while j >= 0:
+                    head[j] = new_head
+                    j = successor[j]
+
+        route = [0] + self._onboard_drops(problem)
+        chains = [j for j in range(m) if predecessor[j] < 0]
+        while chains:
+            current = route[-1]
+            chain = min(chains, key=lambda j: distance[current, pickups[j]])
+            chains.remove(chain)
+            j = chain
+            while j >= 0:
+                route += [pickups[j], drops[j]]
+                j = successor[j]
+        return np.array(route + [problem["end"]])
+
+    def _deadline_route(self, problem: Dict[str, Any]) -> np.ndarray:
+        order = np.argsort(problem["deadline"][problem["drops"]], kind="stable")
+        route = [0] + self._onboard_drops(problem)
+        for j in order:
+            route += [problem["pickups"][j], problem["drops"][j]]
+        return np.array(route + [problem["end"]])
+
+    def _arrivals(self, problem: Dict[str, Any], route: np.ndarray) -> np.ndarray:
+        """Minutes from now at which each stop (route[1:-1]) is reached."""
+        legs = problem["distance"][route[:-2], route[1:-1]]
+        return np.cumsum(legs) * (60.0 / self.speed_kmh) + self.service_minutes * np.arange(len(legs))
+
+    def _lateness(self, problem: Dict[str, Any], route: np.ndarray) -> np.ndarray:
+        return np.maximum(self._arrivals(problem, route) - problem["deadline"][route[1:-1]], 0.0)
+
+    def _feasible(self, problem: Dict[str, Any], route: np.ndarray) -> bool:
+        if self._loads(problem, route).max() > problem["capacity"] + _EPS:
+            return False
+        position = np.empty(len(route), dtype=int)
+        position[route] = np.arange(len(route))
+        return bool(np.all(position[problem["pickups"]] < position[problem["drops"]]))
+
+    def _loads(self, problem: Dict[str, Any], route: np.ndarray) -> np.ndarray:
+        """Load carried after each position of the route."""
+        return problem["onboard_load"] + np.cumsum(problem["demand"][route])
+
+    def _evaluate(self, problem: Dict[str, Any], route: np.ndarray) -> Tuple[float, float]:
+        """(distance_km, total lateness in minutes)."""
+        distance = float(problem["distance"][route[:-1], route[1:]].sum())
+        return distance, float(self._lateness(problem, route).sum())
+
+    def _two_opt_moves(self, problem: Dict[str, Any], route: np.ndarray):
+        distance = problem["distance"]
+        size = len(route)
+        inner = np.arange(1, size - 1)
+        previous, current, following = route[inner - 1], route[inner], route[inner + 1]
+        # Reversing route[l..r]: distances are symmetric, so only the two boundary edges change.
+        delta = (distance[previous[:, None], current[None, :]] + distance[current[:, None], following[None, :]]
+                 - distance[previous, current][:, None] - distance[current, following][None, :])
+
+        # A reversal is invalid when a whole pickup/drop-off pair lies inside it.
+        position = np.empty(size, dtype=int)
+        position[route] = np.arange(size)
+        first_drop = np.full(size + 1, size)
+        first_drop[position[problem["pickups"]]] = position[problem["drops"]]
+        first_drop = np.minimum.accumulate(first_drop[::-1])[::-1]
+        invalid = (inner[None, :] <= inner[:, None]) | (first_drop[inner][:, None] <= inner[None, :])
+
+        # Inside a reversed segment the load peaks at load[l-1] + load[r] - min(load[l-1..r-1]).
+        load = self._loads(problem, route)
+        lowest = _range_extreme(load, np.minimum.accumulate, np.inf)
+        peak = load[inner - 1][:, None] + load[inner][None, :] - lowest[(inner - 1)[:, None], (inner - 1)[None, :]]
+        invalid |= peak > problem["capacity"] + _EPS
+        delta[invalid] = np.inf
+
+        def decode(index: int):
+            left, right = (int(inner[i]) for i in np.unravel_index(index, delta.shape))
+            return left - 1, right + 1, lambda r: self._reverse(r, left, right)
+        return delta, decode
+
+    @staticmethod
+    def _reverse(route: np.ndarray, left: int, right: int) -> np.ndarray:
+        route = route.copy()
+        route[left:right + 1] = route[left:right + 1][::-1]
+        return route
+
+    def _or_opt_moves(self, problem: Dict[str, Any], route: np.ndarray):
+        distance = problem["distance"]
+        size = len(route)
+        # Segments of 1..max_segment stops, each tried only next to its nearest stops and at either end.
+        lengths = np.concatenate([np.full(max(size - 1 - length, 0), length) for length in range(1, self.max_segment + 1)])
+        if lengths.size == 0:
+            return None, None
+        starts = np.concatenate([np.arange(1, size - length) for length in range(1, self.max_segment + 1)])
+        ends = starts + lengths - 1
+        first, last = route[starts], route[ends]
+
+        position = np.empty(size, dtype=int)
+        position[route] = np.arange(size)
+        nearest = problem["nearest"]
+        gaps = np.concatenate([
+            position[nearest[first]],
+            position[nearest[last]] - 1,
+            np.zeros((len(starts), 1), dtype=int),
+            np.full((len(starts), 1), size - 2)
+        ], axis=1)
+
+        removal = distance[route[starts - 1], first] + distance[last, route[ends + 1]] - distance[route[starts - 1], route[ends + 1]]
+        insertion = (distance[route[gaps], first[:, None]] + distance[last[:, None], route[gaps + 1]]
+                     - distance[route[gaps], route[gaps + 1]])
+        delta = insertion - removal[:, None]
+
+        # The segment may move between its nodes' pickups (if outside it) and drop-offs (if outside it).
+        partner = np.full(size, -1)
+        partner[problem["drops"]] = problem["pickups"]
+        partner[problem["pickups"]] = problem["drops"]
+        partner_position = np.append(np.where(partner[route] >= 0, position[np.maximum(partner[route], 0)], -1), -1)
+        is_drop = np.append(problem["pickup_of"][route] >= 0, False)
+        lower = np.zeros(len(starts), dtype=int)
+        upper = np.full(len(starts), size - 2)
+        for offset in range(self.max_segment):
+            k = np.where(offset < lengths, starts + offset, size)
+            outside = (partner_position[k] >= 0) & ((partner_position[k] < starts) | (partner_position[k] > ends))
+            lower = np.where(outside & is_drop[k], np.maximum(lower, partner_position[k]), lower)
+            upper = np.where(outside & ~is_drop[k], np.minimum(upper, partner_position[k] - 1), upper)
+        invalid = ((gaps >= starts[:, None] - 1) & (gaps <= ends[:, None])) | (gaps < lower[:, None]) | (gaps > upper[:, None])
+
+        # Stops the segment jumps over carry its net load less (moving later) or more (moving
+        # earlier); the segment itself rides on the load at its new position.
+        load = self._loads(problem, route)
+        highest = _range_extreme(load, np.maximum.accumulate, -np.inf)
+        net = (load[ends] - load[starts - 1])[:, None]
+        rise = (highest[starts, ends] - load[starts - 1])[:, None]
+        peak = np.where(
+            gaps > ends[:, None],
+            np.maximum(highest[np.minimum(ends + 1, size - 1)[:, None], gaps] - net, load[gaps] - net + rise),
+            np.maximum(highest[gaps + 1, (starts - 1)[:, None]] + net, load[gaps] + rise)
+        )
+        invalid |= peak > problem["capacity"] + _EPS
+        delta[invalid] = np.inf
+        columns = gaps.shape[1]
+
+        def decode(index: int):
+            row = index // columns
+            start, length, gap = int(starts[row]), int(lengths[row]), int(gaps[row, index % columns])
+            return min(start - 1, gap), max(start + length, gap + 1), lambda r: self._move(r, start, length, gap)
+        return delta, decode
+
+    @staticmethod
+    def _move(route: np.ndarray, start: int, length: int, gap: int) -> np.ndarray:
+        """Move route[start:start+length] to sit between route[gap] and route[gap + 1]."""
+        segment = route[start:start + length]
+        rest = np.concatenate([route[:start], route[start + length:]])
+        insert_at = gap + 1 if gap < start else gap + 1 - length
+        return np.concatenate([rest[:insert_at], segment, rest[insert_at:]])
+
+    def _improve(self, problem: Dict[str, Any], route: np.ndarray, deadline: float) -> np.ndarray:
+        """Local search to a 2-opt/or-opt optimum, applying up to `moves_per_pass` moves per scoring pass."""
+        distance, lateness = self._evaluate(problem, route)
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for generate in (self._two_opt_moves, self._or_opt_moves):
+                delta, decode = generate(problem, route)
+                if delta is None:
+                    continue
+                flat = delta.ravel()
+                candidates = np.flatnonzero(flat < -_EPS)
+                if candidates.size > self.candidates_per_round:
+                    candidates = candidates[np.argpartition(flat[candidates], self.candidates_per_round)[:self.candidates_per_round]]
+                # A move only reorders stops between the two ends of its span, so moves with
+                # disjoint spans can all be applied from one scoring pass.
+                touched = np.zeros(len(route), dtype=bool)
+                applied = 0
+                for index in candidates[np.argsort(flat[candidates], kind="stable")]:
+                    low, high, move = decode(int(index))
+                    if touched[low:high + 1].any():
+                        continue
+                    candidate = move(route)
+                    if not self._feasible(problem, candidate):
+                        continue
+                    new_distance, new_lateness = self._evaluate(problem, candidate)
+                    if new_lateness <= lateness + _EPS and new_distance < distance - _EPS:
+                        route, distance, lateness = candidate, new_distance, new_lateness
+                        touched[low:high + 1] = True
+                        improved = True
+                        applied += 1
+                        if applied >= self.moves_per_pass:
+                            break
+        return route
+
+    def _result(self, route, jobs: List[Dict[str, Any]], problem: Optional[Dict[str, Any]], now: datetime,
+                unassigned: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if problem is None or len(route) <= 2:
+            return {"stops": [], "distance_km": 0.0, "duration_minutes": 0.0, "unassigned": unassigned}
+
+        arrivals = self._arrivals(problem, route)
+        load = problem["onboard_load"] + np.cumsum(problem["demand"][route[1:-1]])
+        stops = []
+        for node, arrival, on_board in zip(route[1:-1], arrivals, load):
+            job = jobs[problem["job_of"][node]]
+            pickup = problem["demand"][node] > 0
+            stops.append({
+                "job_id": job.get("id"),
+                "action": "pickup" if pickup else "dropoff",
+                "location": job["pickup"] if pickup else job["dropoff"],
+                "address": job.get("pickup_address") if pickup else job.get("dropoff_address"),
+                "eta": now + timedelta(minutes=float(arrival)),
+                "load_kg": round(float(on_board), 2)
+            })
+        distance, _ = self._evaluate(problem, route)
+        return {
+            "stops": stops,
+            "distance_km": round(distance, 2),
+            "duration_minutes": round(float(arrivals[-1]) + self.service_minutes, 1),
+            "unassigned": unassigned
+        }
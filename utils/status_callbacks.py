@@ -0,0 +1,205 @@
+import argparse
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+from urllib.parse import parse_qsl
+from pymongo import UpdateOne
+from utils.database import get_db
+from utils.config import get_config, get_secret
+
+logger = logging.getLogger(__name__)
+
+# Twilio may deliver callbacks out of order; a status never replaces a later one.
+STATUS_RANK = {
+    "accepted": 0,
+    "queued": 1,
+    "sending": 2,
+    "sent": 3,
+    "delivered": 4,
+    "read": 5,
+    "undelivered": 6,
+    "failed": 6
+}
+FAILED_STATUSES = ("undelivered", "failed")
+
+
+class StatusCallbackIngestor:
+    """Buffers Twilio message status callbacks and bulk-writes them to `notifications`.
+
+    `add` only appends to an in-memory buffer; a flusher thread writes every
+    `flush_interval` seconds or once `batch_size` callbacks are waiting. Each batch keeps
+    the furthest status per MessageSid and is written as one ordered bulk_write, upserting
+    by sid so callbacks for messages sent outside the outbox are recorded too. Once
+    `max_buffer` callbacks are waiting (say, while Mongo is down), `add` refuses more so
+    the endpoint can ask Twilio to retry instead of dropping them.
+    """
+
+    def __init__(self, db=None, config=None, batch_size: int = 1000, flush_interval: float = 0.5,
+                 max_buffer: int = 100000):
+        self.db = db or get_db()
+        self.config = config or get_config()
+        self.collection = self.db.get_collection(self.config.collections["notifications"])
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.flush_lock = threading.Lock()
+        self.pending = threading.Event()
+        self.stop_event = threading.Event()
+        self.received = 0
+        self.written = 0
+        self._flusher: Optional[threading.Thread] = None
+
+    def add(self, params: Dict[str, str]) -> bool:
+        """Buffer one callback; False when the buffer is full and the callback was not taken."""
+        if not params.get("MessageSid") or params.get("MessageStatus") not in STATUS_RANK:
+            return True
+        if len(self.buffer) >= self.max_buffer:
+            return False
+        self.buffer.append((params, datetime.now()))
+        self.received += 1
+        if len(self.buffer) >= self.batch_size:
+            self.pending.set()
+        return True
+
+    def _updates(self, batch: List[tuple]) -> List[UpdateOne]:
+        by_sid: Dict[str, List[Dict[str, Any]]] = {}
+        for params, received_at in batch:
+            by_sid.setdefault(params["MessageSid"], []).append({
+                "status": params["MessageStatus"],
+                "error_code": params.get("ErrorCode") or None,
+                "at": received_at
+            })
+
+        operations = []
+        for sid, events in by_sid.items():
+            latest = max(events, key=lambda e: (STATUS_RANK[e["status"]], e["at"]))
+            rank = STATUS_RANK[latest["status"]]
+            # The first op records the event and raises the rank; the second sets the status
+            # only when this batch holds the furthest status seen for the sid.
+            operations.append(UpdateOne(
+                {"sid": sid},
+                {"$max": {"delivery_rank": rank},
+                 "$push": {"delivery_events": {"$each": events, "$slice": -20}},
+                 "$setOnInsert": {"created_at": latest["at"]}},
+                upsert=True
+            ))
+            operations.append(UpdateOne(
+                {"sid": sid, "delivery_rank": rank},
+                {"$set": {"delivery_status": latest["status"], "delivery_error_code": latest["error_code"],
+                          "delivery_updated_at": latest["at"]}}
+            ))
+        return operations
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of callbacks written."""
+        with self.flush_lock:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size * 10:
+                batch.append(self.buffer.popleft())
+            if not batch:
+                return 0
+            try:
+                self.collection.bulk_write(self._updates(batch), ordered=True)
+            except Exception as e:
+                logger.error(f"Writing {len(batch)} status callbacks failed: {str(e)}")
+                self.buffer.extendleft(reversed(batch))
+                return 0
+            self.written += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.pending.wait(self.flush_interval)
+            self.pending.clear()
+            while self.flush() >= self.batch_size:
+                pass
+        self.flush()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name="status-callbacks", daemon=True)
+            self._flusher.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.pending.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        params = dict(parse_qsl(body))
+        validator = self.server.validator
+        if validator is not None and not validator.validate(self.server.public_url, params,
+                                                            self.headers.get("X-Twilio-Signature", "")):
+            self._reply(403)
+            return
+        if not self.server.ingestor.add(params):
+            self._reply(503)
+            return
+        self._reply(204)
+
+
+class CallbackServer(ThreadingHTTPServer):
+    """HTTP endpoint for Twilio's StatusCallback; answers 204 as soon as the callback is buffered.
+
+    With an `auth_token`, requests must carry a valid X-Twilio-Signature for `public_url`.
+    Without both it only accepts a loopback address, so forged callbacks cannot reach it.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, ingestor: StatusCallbackIngestor, auth_token: Optional[str] = None,
+                 public_url: Optional[str] = None):
+        if not (auth_token and public_url) and address[0] not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError("Set TWILIO_AUTH_TOKEN and TWILIO_STATUS_CALLBACK_URL before listening on a non-loopback address")
+        super().__init__(address, CallbackHandler)
+        self.ingestor = ingestor
+        self.public_url = public_url
+        self.validator = None
+        if auth_token and public_url:
+            from twilio.request_validator import RequestValidator
+            self.validator = RequestValidator(auth_token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive Twilio message status callbacks")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Use 0.0.0.0 to accept Twilio directly (needs TWILIO_AUTH_TOKEN and TWILIO_STATUS_CALLBACK_URL)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--flush-interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    ingestor = StatusCallbackIngestor(batch_size=args.batch_size, flush_interval=args.flush_interval)
+    ingestor.start()
+    server = CallbackServer((args.host, args.port), ingestor, get_secret("TWILIO_AUTH_TOKEN"),
+                            get_secret("TWILIO_STATUS_CALLBACK_URL"))
+    logger.info(f"Listening for status callbacks on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        ingestor.stop()
+
+
+if __name__ == "__main__":
+    main()
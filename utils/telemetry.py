@@ -0,0 +1,142 @@
+import contextvars
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+import streamlit as st
+
+# USD per 1M tokens (input, output); used for rough cost estimates in the admin view.
+MODEL_PRICES = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "models/gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+_current_page = contextvars.ContextVar("ai_usage_page", default="unknown")
+
+
+def set_current_page(page: str):
+    """Tag AI calls made from this script run with the page name."""
+    _current_page.set(page)
+
+
+def get_current_page() -> str:
+    return _current_page.get()
+
+
+class CallRecorder:
+    """Collects measurements for a single LLM call; finish() hands them to the tracker."""
+
+    def __init__(self, tracker: "UsageTracker", method: str, model: str, estimated_prompt_tokens: Optional[int] = None):
+        self.tracker = tracker
+        self.record: Dict[str, Any] = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "method": method,
+            "page": get_current_page(),
+            "model": model,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "streamed": False
+        }
+        self.start = time.perf_counter()
+
+    def first_token(self):
+        if "ttft_ms" not in self.record:
+            self.record["streamed"] = True
+            self.record["ttft_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+
+    def finish(self, response: Any = None, cache_hit: Optional[bool] = None, parse_ok: Optional[bool] = None,
+               error: Optional[Exception] = None):
+        usage = getattr(response, "usage_metadata", None) or {}
+        metadata = getattr(response, "response_metadata", None) or {}
+        self.record.update({
+            "model": metadata.get("model_name") or self.record["model"],
+            "prompt_tokens": usage.get("input_tokens"),
+            "completion_tokens": usage.get("output_tokens"),
+            "latency_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "cache_hit": bool(cache_hit),
+            "parse_ok": parse_ok,
+            "error": type(error).__name__ if error else None
+        })
+        self.tracker.add(self.record)
+
+
+class UsageTracker:
+    """In-process ring buffer of LLM call records with per-method/per-page aggregates."""
+
+    def __init__(self, max_records: int = 10000):
+        self.records = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+
+    def start(self, method: str, model: str, estimated_prompt_tokens: Optional[int] = None) -> CallRecorder:
+        return CallRecorder(self, method, model, estimated_prompt_tokens)
+
+    def add(self, record: Dict[str, Any]):
+        with self.lock:
+            self.records.append(record)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    @staticmethod
+    def _cost(record: Dict[str, Any]) -> float:
+        input_price, output_price = MODEL_PRICES.get(record.get("model") or "", (0.0, 0.0))
+        prompt_tokens = record.get("prompt_tokens") or record.get("estimated_prompt_tokens") or 0
+        return (prompt_tokens * input_price + (record.get("completion_tokens") or 0) * output_price) / 1e6
+
+    def summary(self, by: Iterable[str] = ("method",)) -> List[Dict[str, Any]]:
+        """Aggregate calls, tokens, cost, latency percentiles, cache and parse rates per group."""
+        by = tuple(by)
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in self.snapshot():
+            groups.setdefault(tuple(record.get(k) for k in by), []).append(record)
+
+        rows = []
+        for key, records in sorted(groups.items(), key=lambda kv: str(kv[0])):
+            latencies = np.array([r["latency_ms"] for r in records if r.get("latency_ms") is not None])
+            ttfts = np.array([r["ttft_ms"] for r in records if r.get("ttft_ms") is not None])
+            parsed = [r["parse_ok"] for r in records if r.get("parse_ok") is not None]
+            row = dict(zip(by, key))
+            row.update({
+                "calls": len(records),
+                "errors": sum(1 for r in records if r.get("error")),
+                "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in records),
+                "completion_tokens": sum(r.get("completion_tokens") or 0 for r in records),
+                "est_cost_usd": round(sum(self._cost(r) for r in records), 6),
+                "p50_latency_ms": round(float(np.percentile(latencies, 50)), 1) if latencies.size else None,
+                "p95_latency_ms": round(float(np.percentile(latencies, 95)), 1) if latencies.size else None,
+                "p50_ttft_ms": round(float(np.percentile(ttfts, 50)), 1) if ttfts.size else None,
+                "cache_hit_rate": round(sum(1 for r in records if r.get("cache_hit")) / len(records), 3),
+                "parse_success_rate": round(sum(parsed) / len(parsed), 3) if parsed else None
+            })
+            rows.append(row)
+        return rows
+
+    def export(self, fmt: str = "json") -> str:
+        """All raw records as JSON or CSV text."""
+        records = self.snapshot()
+        if fmt == "json":
+            return json.dumps(records, default=str)
+        if fmt != "csv":
+            raise ValueError(f"Unsupported export format: {fmt}")
+        output = io.StringIO()
+        columns = list(dict.fromkeys(k for r in records for k in r))
+        writer = csv.DictWriter(output, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(records)
+        return output.getvalue()
+
+
+@st.cache_resource
+def get_usage_tracker():
+    return UsageTracker()
@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+import streamlit as st
+
+
+def _size(value: Any, sample: int = 20) -> Optional[int]:
+    """Approximate payload size in bytes (its JSON length), extrapolating long lists from a sample."""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return 2 + sum(len(str(k)) + 4 + (_size(v, sample) or 4) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return 2
+        head = value[:sample]
+        return 1 + len(value) + int(sum(_size(v, sample) or 4 for v in head) * len(value) / len(head))
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+class Span:
+    """Timing for one workflow run or node; finish() hands it to the tracer."""
+
+    def __init__(self, tracer: "WorkflowTracer", workflow: str, name: str, kind: str, trace_id: str,
+                 parent_id: Optional[str] = None, input_value: Any = None):
+        self.tracer = tracer
+        self.span_id = uuid.uuid4().hex[:16]
+        self.record: Dict[str, Any] = {
+            "trace_id": trace_id,
+            "span_id": self.span_id,
+            "parent_id": parent_id,
+            "workflow": workflow,
+            "name": name,
+            "kind": kind,
+            "start_time": time.time(),
+            "input_bytes": _size(input_value)
+        }
+        self.start = time.perf_counter()
+
+    def finish(self, output: Any = None, error: Optional[Exception] = None):
+        self.record.update({
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "end_time": time.time(),
+            "output_bytes": _size(output),
+            "error": f"{type(error).__name__}: {error}" if error else None
+        })
+        self.tracer.add(self.record)
+
+
+class WorkflowTracer:
+    """In-process ring buffer of workflow and node spans with per-node latency summaries."""
+
+    def __init__(self, max_spans: int = 20000, record_sizes: bool = True):
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+        self.record_sizes = record_sizes
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex
+
+    def start(self, workflow: str, name: str, trace_id: str, parent_id: Optional[str] = None,
+              input_value: Any = None, kind: str = "node") -> Span:
+        return Span(self, workflow, name, kind, trace_id, parent_id, input_value if self.record_sizes else None)
+
+    def add(self, record: Dict[str, Any]):
+        with self.lock:
+            self.spans.append(record)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.spans)
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+    def summary(self, by: Iterable[str] = ("workflow", "name")) -> List[Dict[str, Any]]:
+        """Calls, errors, p50/p95/max duration and average payload sizes per group."""
+        by = tuple(by)
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for span in self.snapshot():
+            groups.setdefault(tuple(span.get(k) for k in by), []).append(span)
+
+        rows = []
+        for key, spans in sorted(groups.items(), key=lambda kv: str(kv[0])):
+            durations = np.array([s["duration_ms"] for s in spans])
+            inputs = [s["input_bytes"] for s in spans if s.get("input_bytes") is not None]
+            outputs = [s["output_bytes"] for s in spans if s.get("output_bytes") is not None]
+            row = dict(zip(by, key))
+            row.update({
+                "kind": spans[0]["kind"],
+                "calls": len(spans),
+                "errors": sum(1 for s in spans if s.get("error")),
+                "p50_ms": round(float(np.percentile(durations, 50)), 2),
+                "p95_ms": round(float(np.percentile(durations, 95)), 2),
+                "max_ms": round(float(durations.max()), 2),
+                "avg_input_bytes": int(np.mean(inputs)) if inputs else None,
+                "avg_output_bytes": int(np.mean(outputs)) if outputs else None
+            })
+            rows.append(row)
+        return rows
+
+    def export(self, fmt: str = "json") -> str:
+        """Spans as raw JSON, CSV, or OTLP/JSON ("otlp") for an OpenTelemetry collector."""
+        spans = self.snapshot()
+        if fmt == "json":
+            return json.dumps(spans, default=str)
+        if fmt == "csv":
+            output = io.StringIO()
+            columns = list(dict.fromkeys(k for s in spans for k in s))
+            writer = csv.DictWriter(output, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(spans)
+            return output.getvalue()
+        if fmt != "otlp":
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        otlp_spans = []
+        for s in spans:
+            attributes = {"workflow": s["workflow"], "kind": s["kind"],
+                          "input_bytes": s.get("input_bytes"), "output_bytes": s.get("output_bytes")}
+            otlp_spans.append({
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "parentSpanId": s.get("parent_id") or "",
+                "name": f"{s['workflow']}.{s['name']}" if s["kind"] == "node" else s["workflow"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(s["start_time"] * 1e9)),
+                "endTimeUnixNano": str(int(s["end_time"] * 1e9)),
+                "attributes": [
+                    {"key": k, "value": {"intValue": str(v)} if isinstance(v, int) else {"stringValue": str(v)}}
+                    for k, v in attributes.items() if v is not None
+                ],
+                "status": {"code": 2, "message": s["error"]} if s.get("error") else {"code": 1}
+            })
+        return json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "rescuebites"}}]},
+            "scopeSpans": [{"scope": {"name": "utils.langgraph_flows"}, "spans": otlp_spans}]
+        }]})
+
+
+@st.cache_resource
+def get_workflow_tracer():
+    return WorkflowTracer()
@@ -0,0 +1,64 @@
+import logging
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+from utils.resilience import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+TWILIO_API_BASE_URL = "https://api.twilio.com"
+
+
+class PooledHttpClient(TwilioHttpClient):
+    """Twilio HTTP client with one keep-alive session and a connection pool sized for concurrent sends.
+
+    Twilio's default pool keeps at most cpu_count + 4 connections, so busier senders
+    reconnect for every request past that; `pool_size=None` keeps the default.
+    `base_url` points the Messages API at another host (a local stub in benchmarks).
+    """
+
+    def __init__(self, pool_size: Optional[int] = 32, timeout: float = 10.0, base_url: Optional[str] = None,
+                 pool_connections: bool = True):
+        super().__init__(pool_connections=pool_connections, timeout=timeout)
+        if self.session is not None and pool_size:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        if self.base_url and url.startswith(TWILIO_API_BASE_URL):
+            url = self.base_url + url[len(TWILIO_API_BASE_URL):]
+        return super().request(method, url, *args, **kwargs)
+
+
+class TwilioSender:
+    """Sends WhatsApp messages over a pooled connection, within the account's messages-per-second limit.
+
+    Callers send concurrently from their own threads (the outbox workers). The limit is a
+    per-process token bucket unless a shared `rate_limiter` (e.g. a SharedRateLimiter) is
+    given, which every process sending from the account should use.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str, whatsapp_number: str, messages_per_second: float = 80,
+                 pool_size: int = 32, timeout: float = 10.0, base_url: Optional[str] = None,
+                 http_client: Optional[TwilioHttpClient] = None, status_callback: Optional[str] = None,
+                 rate_limiter=None):
+        self.client = Client(account_sid, auth_token, http_client=http_client or PooledHttpClient(pool_size, timeout, base_url))
+        self.whatsapp_number = whatsapp_number
+        # Twilio posts delivery status changes here (see utils.status_callbacks).
+        self.status_callback = status_callback
+        self.rate_limiter = rate_limiter or TokenBucket(messages_per_second * 60, capacity=messages_per_second)
+
+    def send(self, to: str, body: str) -> str:
+        """Send one message and return its sid; raises on failure."""
+        self.rate_limiter.acquire()
+        kwargs = {"status_callback": self.status_callback} if self.status_callback else {}
+        message = self.client.messages.create(
+            body=body,
+            from_=f"whatsapp:{self.whatsapp_number}",
+            to=f"whatsapp:{to}",
+            **kwargs
+        )
+        return message.sid
@@ -0,0 +1,31 @@
+import re
+from typing import Any, Optional
+
+_QUANTITY_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*([a-zA-Z]*)")
+
+# Approximate weight of one unit in kg; container units are rough averages for donated food.
+UNIT_TO_KG = {
+    "kg": 1.0, "kgs": 1.0, "kilo": 1.0, "kilos": 1.0, "kilogram": 1.0, "kilograms": 1.0,
+    "g": 0.001, "gm": 0.001, "gms": 0.001, "gram": 0.001, "grams": 0.001,
+    "lb": 0.4536, "lbs": 0.4536, "pound": 0.4536, "pounds": 0.4536,
+    "l": 1.0, "litre": 1.0, "litres": 1.0, "liter": 1.0, "liters": 1.0,
+    "box": 5.0, "boxes": 5.0, "bag": 5.0, "bags": 5.0, "crate": 10.0, "crates": 10.0,
+    "tray": 2.0, "trays": 2.0, "meal": 0.5, "meals": 0.5, "portion": 0.5, "portions": 0.5,
+    "serving": 0.4, "servings": 0.4, "loaf": 0.5, "loaves": 0.5, "piece": 0.2, "pieces": 0.2,
+}
+
+
+def parse_quantity_kg(quantity: Any, default: Optional[float] = None) -> Optional[float]:
+    """Parse free-text quantities such as "5 kg", "10 boxes" or 3 into kilograms."""
+    if quantity is None:
+        return default
+    if isinstance(quantity, (int, float)):
+        return float(quantity)
+
+    match = _QUANTITY_PATTERN.search(str(quantity))
+    if not match:
+        return default
+
+    value = float(match.group(1).replace(",", "."))
+    unit = match.group(2).lower()
+    return value * UNIT_TO_KG.get(unit, 1.0)